@@ -4,24 +4,43 @@ Tech news gatherer — deterministic data collection layer.
 Fetches RSS, GitHub releases, Reddit hot posts.
 Scores, deduplicates, and outputs structured JSON for LLM summarization.
 
+All sources are fetched concurrently by one asyncio scheduler (per-host limits, pooled
+connections, global deadline). Feeds are fetched conditionally (If-None-Match / If-Modified-Since) using validators
+cached in .cache/http_cache.json; a 304 means "no new entries" for that feed.
+Articles emitted by earlier runs (same URL or normalized title, see .cache/seen.sqlite) are
+dropped before scoring.
+
 Usage:
     python3 gather_tech.py [--sources TECH_SOURCES.json] [--yesterday summaries/YYYY-MM-DD-tech.md] [--output raw_tech.json]
+                           [--summaries summaries] [--history-days 7]
+                           [--seen-db .cache/seen.sqlite] [--seen-ttl-days 30 | --no-seen]
+                           [--http-cache .cache/http_cache.json] [--refresh] [--deadline 45]
 """
 
 import argparse
+import asyncio
 import json
 import sys
 import time
 import hashlib
 import re
+import sqlite3
+import threading
+import zlib
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
 
 import feedparser
 import requests
+from requests.adapters import HTTPAdapter
 from thefuzz import fuzz
 
+try:
+    import numpy as np  # only needed for MinHash dedup of large batches
+except ImportError:
+    np = None
+
 JST = timezone(timedelta(hours=9))
 NOW = datetime.now(timezone.utc)
 CUTOFF_48H = NOW - timedelta(hours=48)
@@ -29,6 +48,16 @@ CUTOFF_7D = NOW - timedelta(days=7)
 SESSION = requests.Session()
 SESSION.headers.update({"User-Agent": "DailyTechDigest/1.0"})
 REQUEST_TIMEOUT = 15
+FETCH_DEADLINE = 45      # seconds for the whole fetch phase; stragglers are dropped
+MAX_WORKERS = 16
+HOST_LIMITS = {"github.com": 4, "www.reddit.com": 2}  # polite to rate-limited hosts
+DEFAULT_HOST_LIMIT = 4
+# Keep-alive pools sized to the per-host limit, so concurrent requests to one host reuse connections
+SESSION.mount("https://", HTTPAdapter(pool_connections=64, pool_maxsize=DEFAULT_HOST_LIMIT))
+SESSION.mount("http://", HTTPAdapter(pool_connections=64, pool_maxsize=DEFAULT_HOST_LIMIT))
+HTTP_CACHE_PATH = Path(__file__).parent / ".cache" / "http_cache.json"
+SEEN_DB_PATH = Path(__file__).parent / ".cache" / "seen.sqlite"
+SEEN_TTL_DAYS = 30
 
 
 # ─── Helpers ───
@@ -68,13 +97,128 @@ def title_hash(title):
     return t
 
 
+# ─── Conditional HTTP ───
+# Per-URL validators (ETag / Last-Modified) plus the last fetch's status, bytes and latency.
+# Loaded once in main(), updated by the fetcher threads, saved once raw_tech.json is written.
+
+HTTP_CACHE = {}
+_HTTP_CACHE_LOCK = threading.Lock()
+_LOADED_ENTRIES = {}   # HTTP_CACHE as loaded, to roll back abandoned URLs
+_ABANDONED = set()     # URLs whose job was dropped at the deadline
+USE_VALIDATORS = True
+
+
+def load_http_cache(path):
+    """Load the validator cache; a missing or corrupt file just means full fetches."""
+    HTTP_CACHE.clear()
+    _ABANDONED.clear()
+    try:
+        HTTP_CACHE.update(json.loads(Path(path).read_text(encoding="utf-8")))
+    except (OSError, ValueError):
+        pass
+    _LOADED_ENTRIES.clear()
+    _LOADED_ENTRIES.update((url, dict(entry)) for url, entry in HTTP_CACHE.items())
+
+
+def abandon_http_cache(urls):
+    """Roll back and freeze the entries of jobs dropped at the deadline.
+
+    Their articles never reach the output, so a late thread must not store validators
+    (the next run would get 304 and never see those articles) or this run's stats.
+    """
+    with _HTTP_CACHE_LOCK:
+        for url in urls:
+            _ABANDONED.add(url)
+            if url in _LOADED_ENTRIES:
+                HTTP_CACHE[url] = dict(_LOADED_ENTRIES[url])
+            else:
+                HTTP_CACHE.pop(url, None)
+
+
+def save_http_cache(path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with _HTTP_CACHE_LOCK:
+        tmp.write_text(json.dumps(HTTP_CACHE, indent=1, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def conditional_get(url, conditional=True, **kwargs):
+    """GET with cached validators. Returns the response, or None on 304 Not Modified.
+
+    Status, body bytes and latency are recorded in HTTP_CACHE[url] either way.
+    Validators are only stored by remember_validators(), once the body parsed fine.
+    """
+    headers = dict(kwargs.pop("headers", None) or {})
+    entry = HTTP_CACHE.get(url, {})
+    if conditional and USE_VALIDATORS:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    start = time.monotonic()
+    resp = SESSION.get(url, timeout=REQUEST_TIMEOUT, headers=headers, **kwargs)
+    nbytes = len(resp.content)
+    with _HTTP_CACHE_LOCK:
+        if url in _ABANDONED:
+            return None if resp.status_code == 304 else resp
+        entry = HTTP_CACHE.setdefault(url, {})
+        entry.update({
+            "status": resp.status_code,
+            "bytes": nbytes,
+            "latency_ms": round((time.monotonic() - start) * 1000),
+            "checked": NOW.isoformat(),
+        })
+    return None if resp.status_code == 304 else resp
+
+
+def remember_validators(url, resp):
+    """Store ETag / Last-Modified of a successfully parsed 200 response."""
+    if not resp.ok:
+        return
+    with _HTTP_CACHE_LOCK:
+        if url in _ABANDONED:
+            return
+        entry = HTTP_CACHE.setdefault(url, {})
+        for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified")):
+            if resp.headers.get(header):
+                entry[key] = resp.headers[header]
+            else:
+                entry.pop(key, None)
+
+
+def fetch_stats(urls):
+    """Per-feed status / bytes / latency for this run, plus totals."""
+    feeds = {u: {k: HTTP_CACHE[u][k] for k in ("status", "bytes", "latency_ms") if k in HTTP_CACHE[u]}
+             for u in urls if HTTP_CACHE.get(u, {}).get("checked") == NOW.isoformat()}
+    return {
+        "requests": len(feeds),
+        "not_modified": sum(1 for f in feeds.values() if f.get("status") == 304),
+        "bytes": sum(f.get("bytes", 0) for f in feeds.values()),
+        "slowest_ms": max((f.get("latency_ms", 0) for f in feeds.values()), default=0),
+        "feeds": feeds,
+    }
+
+
 # ─── Fetchers ───
 
+def github_feed_url(repo_cfg):
+    return f"https://github.com/{repo_cfg['repo']}/releases.atom"
+
+
+def reddit_url(sub_cfg):
+    sub = sub_cfg.get("subreddit") or sub_cfg.get("sub")
+    return f"https://www.reddit.com/r/{sub}/hot.json?limit=15"
+
+
 def fetch_rss(source):
     """Fetch and parse one RSS feed. Returns list of article dicts."""
     articles = []
     try:
-        resp = SESSION.get(source["url"], timeout=REQUEST_TIMEOUT)
+        resp = conditional_get(source["url"])
+        if resp is None:
+            return articles  # 304: nothing new since last run
         feed = feedparser.parse(resp.content)
         for entry in feed.entries[:20]:  # cap per feed
             pub = parse_date(entry)
@@ -96,6 +240,7 @@ def fetch_rss(source):
                 "topics": source.get("topics", []),
                 "priority": source.get("priority", False),
             })
+        remember_validators(source["url"], resp)
     except Exception as e:
         print(f"  ⚠ RSS error [{source['name']}]: {e}", file=sys.stderr)
     return articles
@@ -105,9 +250,11 @@ def fetch_github_releases(repo_cfg):
     """Fetch recent releases from a GitHub repo via Atom feed."""
     articles = []
     repo = repo_cfg["repo"]
-    url = f"https://github.com/{repo}/releases.atom"
+    url = github_feed_url(repo_cfg)
     try:
-        resp = SESSION.get(url, timeout=REQUEST_TIMEOUT)
+        resp = conditional_get(url)
+        if resp is None:
+            return articles  # 304: no new releases
         feed = feedparser.parse(resp.content)
         for entry in feed.entries[:5]:
             pub = parse_date(entry)
@@ -132,6 +279,7 @@ def fetch_github_releases(repo_cfg):
                 "topics": repo_cfg.get("topics", []),
                 "priority": repo_cfg.get("priority", False),
             })
+        remember_validators(url, resp)
     except Exception as e:
         print(f"  ⚠ GitHub error [{repo}]: {e}", file=sys.stderr)
     return articles
@@ -142,10 +290,11 @@ def fetch_reddit(sub_cfg):
     articles = []
     sub = sub_cfg.get("subreddit") or sub_cfg.get("sub")
     min_score = sub_cfg.get("min_score", 100)
-    url = f"https://www.reddit.com/r/{sub}/hot.json?limit=15"
+    url = reddit_url(sub_cfg)
     try:
-        resp = SESSION.get(url, timeout=REQUEST_TIMEOUT,
-                          headers={"User-Agent": "DailyTechDigest/1.0"})
+        # Hot listings re-rank constantly (scores change), so always fetch in full
+        resp = conditional_get(url, conditional=False,
+                               headers={"User-Agent": "DailyTechDigest/1.0"})
         data = resp.json()
         for post in data.get("data", {}).get("children", []):
             d = post["data"]
@@ -175,10 +324,84 @@ def fetch_reddit(sub_cfg):
     return articles
 
 
+# ─── Fetch scheduler ───
+
+def _in_daemon_thread(loop, fn, *args):
+    """Run blocking fn(*args) in a daemon thread; returns an asyncio future for its result.
+
+    Daemon threads (unlike ThreadPoolExecutor workers) do not keep the process alive,
+    so a request still hanging at the deadline cannot delay exit.
+    """
+    future = loop.create_future()
+
+    def deliver(setter, value):
+        if not future.done():
+            setter(value)
+
+    def work():
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            callback = (future.set_exception, e)
+        else:
+            callback = (future.set_result, result)
+        try:
+            loop.call_soon_threadsafe(deliver, *callback)
+        except RuntimeError:
+            pass  # loop already closed: the deadline passed
+
+    threading.Thread(target=work, daemon=True).start()
+    return future
+
+
+async def run_fetch_jobs(jobs, deadline=FETCH_DEADLINE):
+    """Run all (fetch_fn, config, url) jobs at once and return their results in job order.
+
+    Fetchers stay blocking (requests + feedparser) and run in worker threads, at most
+    MAX_WORKERS at a time and at most HOST_LIMITS per site. Each fetcher parses its feed
+    as soon as the response arrives. Jobs still running at the deadline are left as None
+    and their URLs are abandoned in HTTP_CACHE.
+    """
+    loop = asyncio.get_running_loop()
+    workers = asyncio.Semaphore(MAX_WORKERS)
+    limits = {}
+
+    async def run(i, fn, cfg, url):
+        host = urlsplit(url).hostname
+        if host not in limits:
+            limits[host] = asyncio.Semaphore(HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT))
+        async with limits[host], workers:
+            return i, await _in_daemon_thread(loop, fn, cfg)
+
+    results = [None] * len(jobs)
+    urls = {}
+    for i, (fn, cfg, url) in enumerate(jobs):
+        urls[asyncio.create_task(run(i, fn, cfg, url))] = url
+    pending = set(urls)
+    end = loop.time() + deadline
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0, end - loop.time()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break  # deadline
+            for task in done:
+                i, articles = task.result()
+                results[i] = articles
+    finally:
+        abandon_http_cache(urls[task] for task in pending)
+        for task in pending:
+            task.cancel()
+    return results
+
+
 # ─── Scoring ───
 
-def score_article(article, yesterday_titles):
-    """Apply deterministic scoring. Returns updated article with quality_score."""
+def score_article(article, history):
+    """Apply deterministic scoring. Returns updated article with quality_score.
+
+    history is a TitleHistory of recent summaries (built once per run).
+    """
     base = 5
     s = base
 
@@ -206,13 +429,12 @@ def score_article(article, yesterday_titles):
     if article.get("source_type") == "github":
         s += 3
 
-    # Yesterday duplicate penalty
-    t_hash = title_hash(article["title"])
-    for yt in yesterday_titles:
-        if fuzz.ratio(t_hash, title_hash(yt)) > 85:
-            s -= 5
-            article["is_followup"] = True
-            break
+    # Already covered in a recent summary: penalty
+    covered = history.match(article["title"])
+    if covered:
+        s -= 5
+        article["is_followup"] = True
+        article["followup_of"] = covered
 
     article["quality_score"] = max(0, s)
     return article
@@ -220,27 +442,87 @@ def score_article(article, yesterday_titles):
 
 # ─── Deduplication ───
 
-def deduplicate(articles, threshold=85):
-    """Remove near-duplicate articles by title similarity."""
+LSH_BANDS = 50
+LSH_ROWS = 3
+LSH_MIN_ARTICLES = 1000  # below this the exact pairwise scan is fast enough
+SHORT_TITLE = 20         # too few trigrams for MinHash below this: compare such titles directly
+
+
+class TitleLSH:
+    """MinHash LSH over character trigrams of normalized titles.
+
+    query() returns kept titles sharing at least one band with the query, i.e. the only ones
+    worth a fuzz.ratio check. Near-duplicates passing fuzz.ratio > 85 (prefix added, word
+    dropped, a few typos) have trigram Jaccard ≥ 0.65 and always collide; the adversarial case
+    of typos scattered just up to the threshold (Jaccard ~0.35–0.6) is still found ~99% of the
+    time. Unrelated titles (median Jaccard ~0.03) almost never collide.
+    """
+
+    def __init__(self, bands=LSH_BANDS, rows=LSH_ROWS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 2 ** 64, bands * rows, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 64, bands * rows, dtype=np.uint64, endpoint=False)
+        self.bands = bands
+        self.rows = rows
+        self.buckets = [{} for _ in range(bands)]
+
+    def band_keys(self, titles, chunk=500):
+        """One int key per band for every title, computed for the whole batch with NumPy."""
+        keys = []
+        for start in range(0, len(titles), chunk):
+            shingles = [{t[i:i + 3] for i in range(max(1, len(t) - 2))} for t in titles[start:start + chunk]]
+            x = np.fromiter((zlib.crc32(sh.encode()) for group in shingles for sh in group), dtype=np.uint64)
+            offsets = np.cumsum([0] + [len(group) for group in shingles[:-1]])
+            # multiply-shift hash (a odd, mod 2^64 wrap-around) per shingle × permutation, min per title
+            sig = np.minimum.reduceat((x[:, None] * self.a + self.b) >> np.uint64(32), offsets, axis=0)
+            # fold each band's rows into one 64-bit key (wrap-around multiply is fine for hashing)
+            band = sig.reshape(len(shingles), self.bands, self.rows)
+            key = band[:, :, 0].copy()
+            for r in range(1, self.rows):
+                key = key * np.uint64(0x9E3779B97F4A7C15) + band[:, :, r]
+            keys.extend(key.tolist())
+        return keys
+
+    def query(self, keys):
+        found = set()
+        for bucket, key in zip(self.buckets, keys):
+            found.update(bucket.get(key, ()))
+        return found
+
+    def add(self, item, keys):
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, []).append(item)
+
+
+def deduplicate(articles, threshold=85, engine="auto"):
+    """Remove near-duplicate articles by title similarity.
+
+    An article is dropped if fuzz.ratio against an already kept title is > threshold.
+    engine="exact" checks every kept title (O(n²)); "lsh" checks only TitleLSH candidates;
+    "auto" uses lsh for batches of LSH_MIN_ARTICLES or more when numpy is installed.
+    """
+    if engine == "auto":
+        engine = "lsh" if np is not None and len(articles) >= LSH_MIN_ARTICLES else "exact"
+    titles = [title_hash(a["title"]) for a in articles]
+    lsh = TitleLSH() if engine == "lsh" else None
+    keys = lsh.band_keys(titles) if lsh else None
     seen = []
     unique = []
-    for a in articles:
-        t = title_hash(a["title"])
-        is_dup = False
-        for st in seen:
-            if fuzz.ratio(t, st) > threshold:
-                is_dup = True
-                break
-        if not is_dup:
-            seen.append(t)
-            unique.append(a)
+    for i, (a, t) in enumerate(zip(articles, titles)):
+        candidates = seen if lsh is None else [seen[j] for j in sorted(lsh.query(keys[i]))]
+        if any(fuzz.ratio(t, st) > threshold for st in candidates):
+            continue
+        if lsh is not None:
+            lsh.add(len(seen), keys[i])
+        seen.append(t)
+        unique.append(a)
     return unique
 
 
-# ─── Yesterday loader ───
+# ─── History (follow-up detection) ───
 
 def load_yesterday_titles(path):
-    """Extract titles from yesterday's tech summary markdown."""
+    """Extract titles from a tech summary markdown (yesterday's, or any earlier day)."""
     titles = []
     if not path or not Path(path).exists():
         return titles
@@ -254,6 +536,137 @@ def load_yesterday_titles(path):
     return titles
 
 
+class TitleHistory:
+    """Titles of recent tech summaries, normalized and indexed once per run.
+
+    match() is what score_article calls for every article: an identical normalized title is
+    a dict hit, otherwise only TitleLSH candidates get the fuzz.ratio check (every entry when
+    numpy is missing). A week of history then costs about the same per article as one day.
+    Short titles are compared directly: if either side is shorter than SHORT_TITLE, a ratio
+    above threshold needs both to be shorter than short_limit, a small set.
+    """
+
+    def __init__(self, titles=(), threshold=85):
+        """titles: (title, date) pairs, most recent day first (a match reports the latest date)."""
+        self.threshold = threshold
+        self.dates = {}  # normalized title → date of the most recent summary containing it
+        for title, day in titles:
+            t = title_hash(title)
+            if t:  # titles with nothing left after normalization (emoji, kana) match nothing
+                self.dates.setdefault(t, day)
+        self.hashes = list(self.dates)
+        # fuzz.ratio ≤ 100·(1 − |a−b| / (a+b)), so a > threshold match keeps lengths within this factor
+        self.short_limit = SHORT_TITLE * (200 - threshold) / threshold
+        self.short = [h for h in self.hashes if len(h) < self.short_limit]
+        self.lsh = TitleLSH() if np is not None and self.hashes else None
+        if self.lsh is not None:
+            for i, keys in enumerate(self.lsh.band_keys(self.hashes)):
+                self.lsh.add(i, keys)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def match(self, title):
+        """Date of the summary this title follows up on (fuzz.ratio > threshold), else None."""
+        t = title_hash(title)
+        if t in self.dates:
+            return self.dates[t]
+        if self.lsh is None:
+            candidates = self.hashes
+        else:
+            candidates = [self.hashes[i] for i in sorted(self.lsh.query(self.lsh.band_keys([t])[0]))]
+            if len(t) < self.short_limit:
+                candidates += self.short
+        for h in candidates:
+            if fuzz.ratio(t, h) > self.threshold:
+                return self.dates[h]
+        return None
+
+
+def load_history(summaries_dir, days, today, extra=None):
+    """TitleHistory over summaries/YYYY-MM-DD-tech.md for the `days` days before today.
+
+    extra: an explicit summary file (--yesterday), dated by its file name.
+    Returns (history, number of summary files read).
+    """
+    files = []
+    if extra and Path(extra).exists():
+        files.append((Path(extra).name[:10], Path(extra)))
+    for back in range(1, days + 1):
+        day = (today - timedelta(days=back)).strftime("%Y-%m-%d")
+        path = Path(summaries_dir) / f"{day}-tech.md"
+        if path.exists() and all(path.resolve() != f.resolve() for _, f in files):
+            files.append((day, path))
+    files.sort(key=lambda item: item[0], reverse=True)
+    return TitleHistory((title, day) for day, path in files for title in load_yesterday_titles(path)), len(files)
+
+
+# ─── Seen store ───
+
+class SeenStore:
+    """Every article URL and normalized title emitted by earlier runs, in SQLite.
+
+    Rows are 8-byte keys (blake2b of "url:…" / "title:…") with first_seen, last_seen (unix
+    seconds) and hits. All live keys are loaded into a set on open, so is_seen() is O(1).
+    An already-seen article fetched again bumps last_seen and hits, which together with
+    first_seen tells how long a story keeps circulating. Rows are evicted ttl_days after
+    first_seen, however often they came back, so the store stays bounded.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS seen (
+            key BLOB PRIMARY KEY,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 1
+        ) WITHOUT ROWID;
+        DROP INDEX IF EXISTS seen_last;
+        CREATE INDEX IF NOT EXISTS seen_first ON seen(first_seen);
+    """
+
+    def __init__(self, path, ttl_days=SEEN_TTL_DAYS, now=None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.now = int((now or NOW).timestamp())
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript(self.SCHEMA)
+        self.evicted = self.conn.execute("DELETE FROM seen WHERE first_seen < ?",
+                                         (self.now - int(ttl_days * 86400),)).rowcount
+        self.keys = {row[0] for row in self.conn.execute("SELECT key FROM seen")}
+        self._touched = set()
+
+    @staticmethod
+    def article_keys(article):
+        keys = []
+        url = (article.get("url") or "").strip()
+        if url:
+            keys.append(hashlib.blake2b(f"url:{url}".encode(), digest_size=8).digest())
+        t = title_hash(article.get("title", ""))
+        if t:
+            keys.append(hashlib.blake2b(f"title:{t}".encode(), digest_size=8).digest())
+        return keys
+
+    def is_seen(self, article):
+        """True if this URL or normalized title was emitted before (and note that it came back)."""
+        hit = [k for k in self.article_keys(article) if k in self.keys]
+        self._touched.update(hit)
+        return bool(hit)
+
+    def record(self, articles):
+        """Remember emitted articles; new keys get first_seen = now."""
+        rows = {k for a in articles for k in self.article_keys(a)} - self.keys
+        self.conn.executemany("INSERT OR IGNORE INTO seen (key, first_seen, last_seen) VALUES (?, ?, ?)",
+                              [(k, self.now, self.now) for k in rows])
+        self.keys |= rows
+        return len(rows)
+
+    def close(self):
+        """Count the recurrences (hits, last_seen); eviction only looks at first_seen."""
+        self.conn.executemany("UPDATE seen SET last_seen = ?, hits = hits + 1 WHERE key = ?",
+                              [(self.now, k) for k in self._touched])
+        self.conn.commit()
+        self.conn.close()
+
+
 # ─── Topic classification ───
 
 def classify_topics(articles):
@@ -271,9 +684,28 @@ def main():
     parser = argparse.ArgumentParser(description="Gather tech news from configured sources")
     parser.add_argument("--sources", default="TECH_SOURCES.json", help="Sources config file")
     parser.add_argument("--yesterday", default=None, help="Yesterday's tech summary .md file")
+    parser.add_argument("--summaries", default="summaries", help="Directory of earlier YYYY-MM-DD-tech.md files")
+    parser.add_argument("--history-days", type=int, default=7,
+                        help="Penalize stories already covered in the last N days of summaries")
+    parser.add_argument("--seen-db", default=str(SEEN_DB_PATH),
+                        help="SQLite store of articles emitted by earlier runs")
+    parser.add_argument("--seen-ttl-days", type=float, default=SEEN_TTL_DAYS,
+                        help="Forget articles this many days after they were first emitted")
+    parser.add_argument("--no-seen", action="store_true",
+                        help="Do not skip (or record) previously emitted articles")
     parser.add_argument("--output", default="raw_tech.json", help="Output JSON file")
+    parser.add_argument("--http-cache", default=str(HTTP_CACHE_PATH),
+                        help="ETag/Last-Modified cache file (per-feed validators and fetch stats)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore cached validators and download every feed in full")
+    parser.add_argument("--deadline", type=float, default=FETCH_DEADLINE,
+                        help="Seconds allowed for the whole fetch phase")
     args = parser.parse_args()
 
+    global USE_VALIDATORS
+    USE_VALIDATORS = not args.refresh
+    load_http_cache(args.http_cache)
+
     # Load sources
     sources_path = Path(args.sources)
     if not sources_path.exists():
@@ -287,47 +719,54 @@ def main():
     reddit_subs = config.get("reddit_subs", [])
     web_queries = config.get("web_search_queries", {})
 
-    yesterday_titles = load_yesterday_titles(args.yesterday)
+    summaries_dir = Path(args.summaries)
+    if not summaries_dir.exists():
+        summaries_dir = Path(__file__).parent / args.summaries
+    history, history_files = load_history(summaries_dir, args.history_days, datetime.now(JST), args.yesterday)
+    print(f"📚 History: {len(history)} titles from {history_files} summaries", file=sys.stderr)
 
     all_articles = []
-    stats = {"rss_fetched": 0, "rss_errors": 0, "github_fetched": 0, "reddit_fetched": 0}
-
-    # Fetch RSS (parallel, 8 workers)
-    print(f"📡 Fetching {len(rss_sources)} RSS feeds...", file=sys.stderr)
-    with ThreadPoolExecutor(max_workers=8) as pool:
-        futures = {pool.submit(fetch_rss, s): s for s in rss_sources}
-        for future in as_completed(futures):
-            articles = future.result()
-            if articles:
-                stats["rss_fetched"] += 1
-                all_articles.extend(articles)
-            else:
-                stats["rss_errors"] += 1
-
-    # Fetch GitHub releases (parallel)
-    print(f"📦 Checking {len(github_repos)} GitHub repos...", file=sys.stderr)
-    with ThreadPoolExecutor(max_workers=5) as pool:
-        futures = {pool.submit(fetch_github_releases, r): r for r in github_repos}
-        for future in as_completed(futures):
-            articles = future.result()
-            if articles:
-                stats["github_fetched"] += 1
-                all_articles.extend(articles)
-
-    # Fetch Reddit
-    print(f"🔥 Checking {len(reddit_subs)} subreddits...", file=sys.stderr)
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        futures = {pool.submit(fetch_reddit, s): s for s in reddit_subs}
-        for future in as_completed(futures):
-            articles = future.result()
-            if articles:
-                stats["reddit_fetched"] += 1
-                all_articles.extend(articles)
-
+    stats = {"rss_fetched": 0, "rss_not_modified": 0, "rss_errors": 0,
+             "github_fetched": 0, "github_not_modified": 0, "reddit_fetched": 0, "timed_out": 0}
+
+    # Fetch everything at once; results come back in job order (RSS, GitHub, Reddit)
+    jobs = ([("rss", fetch_rss, s, s["url"]) for s in rss_sources]
+            + [("github", fetch_github_releases, r, github_feed_url(r)) for r in github_repos]
+            + [("reddit", fetch_reddit, r, reddit_url(r)) for r in reddit_subs])
+    print(f"📡 Fetching {len(rss_sources)} RSS feeds, {len(github_repos)} GitHub repos, "
+          f"{len(reddit_subs)} subreddits...", file=sys.stderr)
+    started = time.monotonic()
+    results = asyncio.run(run_fetch_jobs([(fn, cfg, url) for _, fn, cfg, url in jobs], args.deadline))
+    stats["fetch_seconds"] = round(time.monotonic() - started, 2)
+
+    for (kind, _, cfg, url), articles in zip(jobs, results):
+        if articles is None:
+            stats["timed_out"] += 1
+            print(f"  ⏱ Deadline reached, skipped: {url}", file=sys.stderr)
+        elif articles:
+            stats[f"{kind}_fetched"] += 1
+            all_articles.extend(articles)
+        elif kind != "reddit" and HTTP_CACHE.get(url, {}).get("checked") == NOW.isoformat() \
+                and HTTP_CACHE[url].get("status") == 304:
+            stats[f"{kind}_not_modified"] += 1
+        elif kind == "rss":
+            stats["rss_errors"] += 1
+
+    fetch = fetch_stats([url for _, _, _, url in jobs])
+    print(f"📶 {fetch['requests']} requests, {fetch['not_modified']} unchanged (304), "
+          f"{fetch['bytes'] / 1024:.0f} KB, slowest {fetch['slowest_ms']} ms", file=sys.stderr)
     print(f"📊 Raw articles collected: {len(all_articles)}", file=sys.stderr)
 
+    # Drop anything an earlier run already emitted (exact URL / normalized title)
+    seen = None if args.no_seen else SeenStore(args.seen_db, args.seen_ttl_days)
+    if seen is not None:
+        fresh = [a for a in all_articles if not seen.is_seen(a)]
+        stats["already_seen"] = len(all_articles) - len(fresh)
+        all_articles = fresh
+        print(f"📊 After seen-store filter: {len(all_articles)}", file=sys.stderr)
+
     # Score
-    all_articles = [score_article(a, yesterday_titles) for a in all_articles]
+    all_articles = [score_article(a, history) for a in all_articles]
 
     # Deduplicate
     all_articles = deduplicate(all_articles)
@@ -348,6 +787,7 @@ def main():
         "generated_at": NOW.isoformat(),
         "today_jst": datetime.now(JST).strftime("%Y-%m-%d"),
         "stats": stats,
+        "fetch_stats": fetch,
         "total_articles": len(all_articles),
         "topic_distribution": {k: len(v) for k, v in topic_groups.items()},
         "web_search_queries": web_queries,
@@ -369,6 +809,17 @@ def main():
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(output, f, indent=2, ensure_ascii=False)
 
+    # Only now are the fetched articles safely on disk; saving validators earlier would turn a
+    # crash during scoring into 304s (and lost articles) on the next run
+    save_http_cache(args.http_cache)
+
+    if seen is not None:
+        emitted = {id(a): a for a in output["top_articles"]}
+        emitted.update((id(a), a) for arts in output["articles_by_topic"].values() for a in arts)
+        added = seen.record(emitted.values())
+        seen.close()
+        print(f"🗃 Seen store: +{added} keys, {len(seen.keys)} total, {seen.evicted} expired", file=sys.stderr)
+
     print(f"✅ Output written to {output_path}", file=sys.stderr)
     print(f"   Topics: {', '.join(f'{k}({v})' for k,v in output['topic_distribution'].items())}", file=sys.stderr)
 
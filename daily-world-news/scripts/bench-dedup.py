@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+bench-dedup.py — gather_tech.deduplicate 的效能基準（合成標題，不連網）
+比較 exact（逐一比對所有已保留標題）與 lsh（MinHash 候選 + 同樣的 fuzz.ratio > 85 檢查）：
+耗時、保留篇數，以及 lsh 漏抓的重複（exact 判重複、lsh 卻保留）
+
+用法: python3 bench-dedup.py [--titles 10000] [--exact-limit 10000] [--seed 7]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gather_tech import deduplicate  # noqa: E402
+
+WORDS = ("ai agent model open source release gpu chip nvidia openai anthropic google meta apple "
+         "quantum bitcoin ethereum crypto security breach patch rust python linux kernel cloud "
+         "startup funding launch benchmark inference training robot space rocket satellite nasa "
+         "spacex biotech gene vaccine battery fusion reactor chip fab tsmc intel amd arm phone "
+         "laptop browser privacy regulation eu court lawsuit billion record new first update").split()
+PREFIXES = ("Breaking: ", "Report: ", "Exclusive: ", "[Update] ", "Show HN: ")
+SYLLABLES = ("ka ri to ne mo la vi sa ten gor ix an bel dra qua zu pe lon mar fi cor sen "
+             "tra vel os ul ny hex").split()
+
+
+def make_title(rng, names):
+    """常用科技字 + 專有名詞（公司、產品、人名），比例接近真實標題"""
+    words = rng.sample(WORDS, rng.randint(3, 7)) + rng.sample(names, rng.randint(2, 4))
+    rng.shuffle(words)
+    return " ".join(words).capitalize()
+
+
+def variant(rng, title):
+    """同一則新聞在不同來源的寫法：標點大小寫、前綴、少一個字、打錯字"""
+    kind = rng.randrange(4)
+    if kind == 0:
+        return title.upper() + "!"
+    if kind == 1:
+        return rng.choice(PREFIXES) + title
+    words = title.split()
+    if kind == 2 and len(words) > 6:
+        del words[rng.randrange(len(words))]
+        return " ".join(words)
+    chars = list(title)
+    for _ in range(max(1, len(chars) // 25)):
+        i = rng.randrange(len(chars))
+        chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(chars)
+
+
+def synthetic_articles(n, seed, dup_rate=0.3):
+    rng = random.Random(seed)
+    names = ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(5000)]
+    titles = []
+    while len(titles) < n:
+        if titles and rng.random() < dup_rate:
+            titles.append(variant(rng, rng.choice(titles)))
+        else:
+            titles.append(make_title(rng, names))
+    return [{"title": t} for t in titles]
+
+
+def timed(articles, engine):
+    start = time.perf_counter()
+    kept = deduplicate(articles, engine=engine)
+    return kept, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="deduplicate 效能基準（exact vs MinHash LSH）")
+    parser.add_argument("--titles", type=int, default=10000, help="合成標題數")
+    parser.add_argument("--exact-limit", type=int, default=10000,
+                        help="exact 只跑前 N 篇（O(n²)，太慢時調低）")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    articles = synthetic_articles(args.titles, args.seed)
+    kept_lsh, t_lsh = timed(articles, "lsh")
+    print(f"⚡ lsh：{len(articles)} 篇 → 保留 {len(kept_lsh)}，{t_lsh:.2f}s")
+
+    subset = articles[:args.exact_limit]
+    kept_exact, t_exact = timed(subset, "exact")
+    print(f"🐢 exact：{len(subset)} 篇 → 保留 {len(kept_exact)}，{t_exact:.2f}s")
+
+    if len(subset) < len(articles):
+        kept_lsh, t_lsh = timed(subset, "lsh")
+        print(f"⚡ lsh（同樣 {len(subset)} 篇）：保留 {len(kept_lsh)}，{t_lsh:.2f}s")
+    exact_ids = {id(a) for a in kept_exact}
+    lsh_ids = {id(a) for a in kept_lsh}
+    missed = len(lsh_ids - exact_ids)
+    dups = len(subset) - len(kept_exact)
+    print(f"📊 加速 {t_exact / t_lsh:.1f}x；exact 找到 {dups} 篇重複，lsh 漏掉 {missed} 篇"
+          f"（召回 {100 * (1 - missed / max(dups, 1)):.2f}%）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
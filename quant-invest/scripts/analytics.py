@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+analytics.py — 相對大盤的績效分析
+把每條策略權益曲線（各檔 + 組合）與大盤對齊成 (日期 × 策略) 矩陣，一次算出：
+alpha、beta、追蹤誤差、資訊比率、相關係數（整段 / rolling）、回撤重疊。
+
+每條曲線起訖不同（各檔上市日、資料長度不一），以遮罩處理：每欄只用自己有值的日期，
+大盤的平均、變異數也在同一組日期上算，所以不需要逐欄迴圈。
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from data_fetch import fetch_history
+
+TRADING_DAYS = 252
+RISK_FREE = 0.02  # 與 backtest 的 Sharpe 相同
+ROLLING_WINDOW = 60
+
+# 同一次執行內的大盤序列（週報的基準、相對分析、其他模組共用，只讀一次價格庫）
+_benchmark_cache = {}
+
+
+def benchmark_history(rules: dict = None, symbol: str = None, period_years: int = None) -> pd.DataFrame:
+    """
+    大盤歷史價格：價格庫已有當天資料就不連網、否則只補抓缺的 K 棒（見 fetch_history），
+    同一次執行內再呼叫直接回傳記憶體裡的那份
+    """
+    bt_config = (rules or {}).get('backtest', {})
+    symbol = symbol or bt_config.get('benchmark', '^TWII')
+    period_years = period_years or bt_config.get('period_years', 3)
+    key = (symbol, period_years, datetime.now().strftime('%Y-%m-%d'))
+    if key not in _benchmark_cache:
+        _benchmark_cache[key] = fetch_history(symbol, period_years=period_years)
+    return _benchmark_cache[key]
+
+
+def clear_benchmark_cache():
+    _benchmark_cache.clear()
+
+
+def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """沿 axis 0 的 rolling 和（前 window-1 列為 NaN）"""
+    c = np.cumsum(x, axis=0)
+    out = np.full(x.shape, np.nan)
+    out[window - 1] = c[window - 1]
+    out[window:] = c[window:] - c[:-window]
+    return out
+
+
+def relative_metrics(curves: dict, benchmark_close: pd.Series, window: int = ROLLING_WINDOW) -> dict:
+    """
+    curves：{名稱: 權益曲線 Series}（例如 backtest 結果的 equity_curve['equity']）
+    回傳:
+    - table：每條曲線一列（alpha / tracking_error / excess_return 為年化或區間百分比）
+    - rolling_corr：(日期 × 名稱) 的 rolling 相關係數
+    """
+    curves = {name: c for name, c in curves.items() if c is not None and len(c) > 1}
+    bench = benchmark_close.dropna()
+    if not curves or len(bench) < 2:
+        return {'table': pd.DataFrame(), 'rolling_corr': pd.DataFrame()}
+
+    # === 對齊：大盤的交易日為主軸，策略曲線在自己起訖範圍內向前填滿 ===
+    names = list(curves)
+    dates = bench.index
+    equity = np.column_stack([
+        c.reindex(dates).ffill().where((dates >= c.index[0]) & (dates <= c.index[-1])).to_numpy(dtype=float)
+        for c in curves.values()
+    ])
+    level = bench.to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = equity[1:] / equity[:-1] - 1
+        b = level[1:] / level[:-1] - 1
+    mask = ~np.isnan(r)
+    m = mask.astype(float)
+    r0 = np.where(mask, r, 0.0)
+    bm = b[:, None] * m  # 每欄只看自己有值的日期
+
+    # === 整段：alpha / beta / 追蹤誤差 / 資訊比率 / 相關係數 ===
+    n = m.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_r = r0.sum(axis=0) / n
+        mean_b = bm.sum(axis=0) / n
+        dr = (r0 - mean_r) * m
+        db = (bm - mean_b) * m
+        cov = (dr * db).sum(axis=0) / (n - 1)
+        var_r = (dr * dr).sum(axis=0) / (n - 1)
+        var_b = (db * db).sum(axis=0) / (n - 1)
+        beta = cov / var_b
+        corr = cov / np.sqrt(var_r * var_b)
+        rf = RISK_FREE / TRADING_DAYS
+        alpha = ((mean_r - rf) - beta * (mean_b - rf)) * TRADING_DAYS
+
+        active = r0 - bm
+        mean_active = active.sum(axis=0) / n
+        tracking = np.sqrt((((active - mean_active) * m) ** 2).sum(axis=0) / (n - 1)) * np.sqrt(TRADING_DAYS)
+        info_ratio = mean_active * TRADING_DAYS / tracking
+
+        # 區間報酬：策略與大盤在同一段日期
+        growth_r = np.exp(np.log1p(r0).sum(axis=0)) - 1
+        growth_b = np.exp(np.log1p(bm).sum(axis=0)) - 1
+
+    # === rolling 相關係數：累積和相減，一次算完所有欄 ===
+    rolling = np.full(r.shape, np.nan)
+    if len(r) >= window:
+        rn = _rolling_sum(m, window)
+        sr, sb = _rolling_sum(r0, window), _rolling_sum(bm, window)
+        srr, sbb, srb = _rolling_sum(r0 * r0, window), _rolling_sum(bm * bm, window), _rolling_sum(r0 * bm, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov_w = srb - sr * sb / rn
+            var_rw = srr - sr * sr / rn
+            var_bw = sbb - sb * sb / rn
+            rolling = cov_w / np.sqrt(var_rw * var_bw)
+        # 視窗內要滿 window 天，且策略與大盤都有波動（空手整段權益不變 → 相關係數無意義）
+        rolling[(rn < window) | (var_rw <= 1e-18) | (var_bw <= 1e-18)] = np.nan
+    rolling_df = pd.DataFrame(rolling, index=dates[1:], columns=names)
+
+    # === 回撤重疊：大盤在水下的日子裡，策略也在水下的比例 ===
+    valid = ~np.isnan(equity)
+    peak = np.fmax.accumulate(equity, axis=0)
+    strat_under = valid & (equity < peak)
+    bench_under = (level < np.maximum.accumulate(level))[:, None] & valid
+    overlap = (strat_under & bench_under).sum(axis=0) / np.maximum(bench_under.sum(axis=0), 1)
+
+    def pct(x):
+        return np.round(x * 100, 2)
+
+    table = pd.DataFrame({
+        'days': n.astype(int),
+        'return': pct(growth_r),
+        'benchmark_return': pct(growth_b),
+        'excess_return': pct(growth_r - growth_b),
+        'alpha': pct(alpha),
+        'beta': np.round(beta, 3),
+        'correlation': np.round(corr, 3),
+        'rolling_corr_last': np.round([rolling_df[c].dropna().iloc[-1] if rolling_df[c].notna().any()
+                                       else np.nan for c in names], 3),
+        'rolling_corr_mean': np.round(rolling_df.mean(axis=0).to_numpy(), 3),
+        'tracking_error': pct(tracking),
+        'information_ratio': np.round(info_ratio, 2),
+        'drawdown_overlap': pct(overlap),
+    }, index=pd.Index(names, name='name'))
+    return {'table': table, 'rolling_corr': rolling_df}
+
+
+def _fmt(value, spec: str) -> str:
+    return '—' if value is None or not np.isfinite(value) else format(value, spec)
+
+
+def format_relative(table: pd.DataFrame, benchmark_symbol: str) -> str:
+    """週報用的 Markdown 表格"""
+    if table.empty:
+        return ''
+    text = (f"| 標的 | 報酬 | 超額 | Alpha（年化） | Beta | 相關 | 近 {ROLLING_WINDOW} 日相關 | "
+            f"追蹤誤差 | 資訊比率 | 回撤重疊 |\n"
+            "|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|\n")
+    for name, row in table.iterrows():
+        text += (f"| {name} | {_fmt(row['return'], '+.1f')}% | {_fmt(row['excess_return'], '+.1f')}% | "
+                 f"{_fmt(row['alpha'], '+.1f')}% | {_fmt(row['beta'], '.2f')} | {_fmt(row['correlation'], '.2f')} | "
+                 f"{_fmt(row['rolling_corr_last'], '.2f')} | {_fmt(row['tracking_error'], '.1f')}% | "
+                 f"{_fmt(row['information_ratio'], '.2f')} | {_fmt(row['drawdown_overlap'], '.0f')}% |\n")
+    return text + (f"\n> 與 {benchmark_symbol} 在同一段日期比較；回撤重疊 = 大盤回撤期間策略也在回撤的天數比例。"
+                   "空手期間權益不變，所以 Beta 與相關係數通常偏低。\n\n")
+
+
+if __name__ == "__main__":
+    import time
+    from backtest import load_rules, backtest_stock_vectorized, synthetic_history
+
+    rules = load_rules()
+    bench = synthetic_history(seed=999)['Close']
+    curves = {}
+    for i in range(37):
+        result = backtest_stock_vectorized(f'SYN{i}', synthetic_history(seed=i), rules)
+        if 'equity_curve' in result:
+            curves[f'SYN{i}'] = result['equity_curve']['equity']
+
+    start = time.perf_counter()
+    out = relative_metrics(curves, bench)
+    elapsed = time.perf_counter() - start
+    print(out['table'].head(10).to_string())
+    print(f"\n⏱️ {len(curves)} 條曲線 × {len(bench)} 天：{elapsed * 1000:.1f} ms")
@@ -2,6 +2,7 @@
 """
 backtest.py — 輕量回測引擎
 設計原則：簡單、透明、容易理解每一步在幹嘛
+進場策略與出場規則是外掛（見 plugins.py），在 screening_rules.yaml 的 entry / exit 區塊選擇
 """
 
 import pandas as pd
@@ -10,6 +11,8 @@ from datetime import datetime
 import os
 import yaml
 
+from plugins import load_plugins, prepare_indicators, first_exit
+
 
 def load_rules(config_path: str = None) -> dict:
     if config_path is None:
@@ -18,20 +21,11 @@ def load_rules(config_path: str = None) -> dict:
         return yaml.safe_load(f)
 
 
-def compute_rsi(series: pd.Series, period: int = 14) -> pd.Series:
-    delta = series.diff()
-    gain = delta.where(delta > 0, 0).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs))
-
-
-def compute_ma(series: pd.Series, period: int) -> pd.Series:
-    return series.rolling(window=period).mean()
-
-
 class Trade:
-    """單筆交易紀錄"""
+    """單筆交易紀錄（組合回測用；單檔回測改用 TradeLedger）"""
+    __slots__ = ('symbol', 'entry_date', 'entry_price', 'shares', 'entry_reason',
+                 'exit_date', 'exit_price', 'exit_reason', 'pnl', 'pnl_pct', 'holding_days')
+
     def __init__(self, symbol, entry_date, entry_price, shares, reason):
         self.symbol = symbol
         self.entry_date = entry_date
@@ -73,92 +67,174 @@ class Trade:
         }
 
 
-def backtest_stock(symbol: str, history: pd.DataFrame, rules: dict) -> dict:
-    """對單一個股執行回測"""
-    
+class TradeLedger:
+    """
+    單檔的交易帳本：每個欄位一條 NumPy 陣列（容量不夠時加倍），不為每筆交易建物件；
+    日期只存 bar 的位置，輸出時才轉成 dates[i]。
+    """
+    __slots__ = ('symbol', 'dates', 'commission', 'tax', 'n', 'entry_idx', 'exit_idx',
+                 'entry_price', 'exit_price', 'shares', '_pnl', '_pnl_pct', 'entry_reason', 'exit_reason')
+
+    def __init__(self, symbol: str, dates: pd.Index, commission: float, tax: float, capacity: int = 16):
+        self.symbol = symbol
+        self.dates = dates
+        self.commission = commission
+        self.tax = tax
+        self.n = 0
+        self.entry_idx = np.zeros(capacity, dtype=np.int64)
+        self.exit_idx = np.zeros(capacity, dtype=np.int64)
+        self.entry_price = np.zeros(capacity)
+        self.exit_price = np.zeros(capacity)
+        self.shares = np.zeros(capacity, dtype=np.int64)
+        self._pnl = np.zeros(capacity)
+        self._pnl_pct = np.zeros(capacity)
+        self.entry_reason = []
+        self.exit_reason = []
+
+    def __len__(self):
+        return self.n
+
+    def _grow(self):
+        for name in ('entry_idx', 'exit_idx', 'entry_price', 'exit_price', 'shares', '_pnl', '_pnl_pct'):
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def open(self, idx: int, price: float, shares: int, reason: str) -> int:
+        """記錄進場，回傳這筆交易的列號"""
+        if self.n == len(self.entry_idx):
+            self._grow()
+        row = self.n
+        self.entry_idx[row] = idx
+        self.entry_price[row] = price
+        self.shares[row] = shares
+        self.entry_reason.append(reason)
+        self.exit_reason.append(None)
+        self.n += 1
+        return row
+
+    def close(self, row: int, idx: int, price: float, reason: str):
+        """記錄出場與損益（公式與 Trade.close 相同）"""
+        entry_price, shares = self.entry_price[row], self.shares[row]
+        gross_pnl = (price - entry_price) * shares
+        entry_cost = entry_price * shares * self.commission
+        exit_cost = price * shares * (self.commission + self.tax)
+        self.exit_idx[row] = idx
+        self.exit_price[row] = price
+        self.exit_reason[row] = reason
+        self._pnl[row] = gross_pnl - entry_cost - exit_cost
+        self._pnl_pct[row] = self._pnl[row] / (entry_price * shares)
+
+    @property
+    def pnl(self) -> np.ndarray:
+        return self._pnl[:self.n]
+
+    @property
+    def holding_days(self) -> np.ndarray:
+        if not self.n or not isinstance(self.dates, pd.DatetimeIndex):
+            return np.zeros(self.n, dtype=np.int64)
+        raw = self.dates.values  # datetime64 陣列直接相減，不逐筆建 Timestamp
+        return (raw[self.exit_idx[:self.n]] - raw[self.entry_idx[:self.n]]) // np.timedelta64(1, 'D')
+
+    def to_dicts(self) -> list:
+        holding = self.holding_days
+        return [{
+            'symbol': self.symbol,
+            'entry_date': str(self.dates[self.entry_idx[i]]),
+            'entry_price': float(self.entry_price[i]),
+            'exit_date': str(self.dates[self.exit_idx[i]]),
+            'exit_price': float(self.exit_price[i]),
+            'shares': int(self.shares[i]),
+            'pnl': round(float(self._pnl[i]), 2),
+            'pnl_pct': round(float(self._pnl_pct[i]) * 100, 2),
+            'holding_days': int(holding[i]),
+            'entry_reason': self.entry_reason[i],
+            'exit_reason': self.exit_reason[i],
+        } for i in range(self.n)]
+
+
+def _config(rules: dict) -> tuple:
     bt_config = rules.get('backtest', {})
-    entry_rules = rules.get('entry', {})
-    exit_rules = rules.get('exit', {})
-    
-    commission = bt_config.get('commission_rate', 0.001425)
-    tax = bt_config.get('tax_rate', 0.003)
-    capital = bt_config.get('initial_capital', 1000000)
-    position_pct = bt_config.get('position_size', 0.20)
-    
-    take_profit = exit_rules.get('take_profit', 0.15)
-    stop_loss = exit_rules.get('stop_loss', -0.08)
-    rsi_exit = exit_rules.get('rsi_overbought', 75)
-    trailing_pct = exit_rules.get('trailing_stop', 0.10)
+    return (bt_config.get('commission_rate', 0.001425), bt_config.get('tax_rate', 0.003),
+            bt_config.get('initial_capital', 1000000), bt_config.get('position_size', 0.20))
+
+
+def backtest_stock(symbol: str, history: pd.DataFrame, rules: dict) -> dict:
+    """
+    對單一個股執行回測（事件驅動：逐根 bar 推進，持有中交給出場規則、空手時交給進場策略）
+    """
+    commission, tax, capital, position_pct = _config(rules)
+    strategy, exits = load_plugins(rules)
     
     close = history['Close']
-    rsi = compute_rsi(close, 14)
-    ma60 = compute_ma(close, 60)
+    dates = history.index
+    ind = prepare_indicators(strategy, exits, close, symbol)
+    signal = strategy.signals(ind) if strategy.vectorized else None
+    price_arr = ind['close']
+    warmup = strategy.warmup
     
-    trades = []
-    current_trade = None
+    ledger = TradeLedger(symbol, dates, commission, tax)
+    current = None  # 持倉中交易的列號
+    entry_idx = 0
+    entry_price = 0.0
+    shares = 0
     peak_price = 0
-    equity_curve = []
+    equity = np.empty(max(len(history) - warmup, 0))
     cash = capital
     
-    for i in range(60, len(history)):
-        date = history.index[i]
-        price = close.iloc[i]
-        current_rsi = rsi.iloc[i]
-        current_ma60 = ma60.iloc[i]
+    for i in range(warmup, len(history)):
+        price = price_arr[i]
         
         # 持有中 → 檢查出場
-        if current_trade is not None:
+        if current is not None:
             peak_price = max(peak_price, price)
-            unrealized_pct = (price / current_trade.entry_price) - 1
-            trailing_drawdown = (price / peak_price) - 1
+            ctx = {key: value[i] for key, value in ind.items()}
+            ctx.update(price=price, entry_price=entry_price, held=i - entry_idx,
+                       unrealized=(price / entry_price) - 1, trailing=(price / peak_price) - 1)
             
             exit_reason = None
-            
-            if unrealized_pct >= take_profit:
-                exit_reason = f'停利 ({unrealized_pct*100:.1f}%)'
-            elif unrealized_pct <= stop_loss:
-                exit_reason = f'停損 ({unrealized_pct*100:.1f}%)'
-            elif current_rsi > rsi_exit:
-                exit_reason = f'RSI 超買 ({current_rsi:.0f})'
-            elif trailing_drawdown <= -trailing_pct:
-                exit_reason = f'追蹤停損 (從高點回落 {trailing_drawdown*100:.1f}%)'
+            for rule in exits:
+                if rule.hits(ctx):
+                    exit_reason = rule.reason(ctx)
+                    break
             
             if exit_reason:
-                current_trade.close(date, price, exit_reason, commission, tax)
-                cash += price * current_trade.shares
-                trades.append(current_trade)
-                current_trade = None
+                ledger.close(current, i, price, exit_reason)
+                cash += price * shares
+                current = None
+                shares = 0
                 peak_price = 0
         
         # 未持有 → 檢查進場
-        if current_trade is None:
-            # RSI 從超賣回升 + 在季線之上
-            prev_rsi = rsi.iloc[i-1] if i > 0 else 50
-            if prev_rsi < 35 and current_rsi >= 35 and price > current_ma60:
-                position_capital = capital * position_pct
-                shares = int(position_capital / price / 1000) * 1000  # 台股整張
-                if shares > 0 and cash >= price * shares:
-                    current_trade = Trade(symbol, date, price, shares, 
-                                         f'RSI 回升 ({prev_rsi:.0f}→{current_rsi:.0f}), 在 MA60 之上')
-                    cash -= price * shares
-                    peak_price = price
+        if current is None and strategy.on_bar(ind, signal, i):
+            position_capital = capital * position_pct
+            lot_shares = int(position_capital / price / 1000) * 1000  # 台股整張
+            if lot_shares > 0 and cash >= price * lot_shares:
+                current = ledger.open(i, price, lot_shares, strategy.reason(ind, i))
+                shares = lot_shares
+                entry_idx = i
+                entry_price = price
+                cash -= price * shares
+                peak_price = price
         
         # 記錄權益
-        holding_value = current_trade.shares * price if current_trade else 0
-        equity_curve.append({
-            'date': date,
-            'equity': cash + holding_value,
-        })
+        equity[i - warmup] = cash + shares * price
     
     # 如果還有持倉，強制平倉
-    if current_trade is not None:
-        last_price = close.iloc[-1]
-        current_trade.close(history.index[-1], last_price, '回測結束平倉', commission, tax)
-        cash += last_price * current_trade.shares
-        trades.append(current_trade)
+    if current is not None:
+        ledger.close(current, len(history) - 1, price_arr[-1], '回測結束平倉')
+        cash += price_arr[-1] * shares
     
     # 計算績效
-    equity_df = pd.DataFrame(equity_curve)
+    equity_df = pd.DataFrame()
+    if len(equity):
+        equity_df = pd.DataFrame({'equity': equity}, index=pd.Index(dates[warmup:], name='date'))
+    return _build_result(symbol, ledger, equity_df, capital)
+
+
+def _build_result(symbol: str, trades, equity_df: pd.DataFrame, capital: float) -> dict:
+    """由交易紀錄（TradeLedger 或 Trade 清單）與權益曲線計算績效（各引擎共用）"""
     if equity_df.empty:
         return {
             'symbol': symbol,
@@ -166,8 +242,16 @@ def backtest_stock(symbol: str, history: pd.DataFrame, rules: dict) -> dict:
             'metrics': {'total_return': 0, 'note': '無交易信號'},
         }
     
-    equity_df.set_index('date', inplace=True)
-    final_equity = equity_df['equity'].iloc[-1]
+    if isinstance(trades, TradeLedger):
+        pnl, holding, records = trades.pnl, trades.holding_days, trades.to_dicts()
+    else:
+        pnl = np.array([t.pnl for t in trades], dtype=float)
+        holding = [t.holding_days for t in trades]
+        records = [t.to_dict() for t in trades]
+    
+    # 以下都在 NumPy 陣列上算（walk-forward / sweep 每個視窗、每組參數都會呼叫）
+    equity = equity_df['equity'].to_numpy(dtype=float)
+    final_equity = equity[-1]
     total_return = (final_equity / capital) - 1
     
     # 年化報酬
@@ -175,43 +259,195 @@ def backtest_stock(symbol: str, history: pd.DataFrame, rules: dict) -> dict:
     annual_return = (1 + total_return) ** (365 / max(days, 1)) - 1
     
     # 最大回撤
-    rolling_max = equity_df['equity'].cummax()
-    drawdown = (equity_df['equity'] / rolling_max) - 1
+    rolling_max = np.maximum.accumulate(equity)
+    drawdown = (equity / rolling_max) - 1
     max_drawdown = drawdown.min()
     
     # Sharpe Ratio (簡化版，假設無風險利率 2%)
-    daily_returns = equity_df['equity'].pct_change().dropna()
-    if len(daily_returns) > 0 and daily_returns.std() > 0:
-        sharpe = (daily_returns.mean() - 0.02/252) / daily_returns.std() * np.sqrt(252)
+    daily_returns = equity[1:] / equity[:-1] - 1
+    std = daily_returns.std(ddof=1) if len(daily_returns) > 1 else 0
+    if std > 0:
+        sharpe = (daily_returns.mean() - 0.02/252) / std * np.sqrt(252)
     else:
         sharpe = 0
     
     # 勝率
-    winning = [t for t in trades if t.pnl > 0]
-    win_rate = len(winning) / len(trades) if trades else 0
+    n_trades = len(records)
+    winning = int(np.sum(pnl > 0))
+    win_rate = winning / n_trades if n_trades else 0
     
     metrics = {
         'total_return': round(total_return * 100, 2),
         'annual_return': round(annual_return * 100, 2),
         'max_drawdown': round(max_drawdown * 100, 2),
         'sharpe_ratio': round(sharpe, 2),
-        'total_trades': len(trades),
+        'total_trades': n_trades,
         'win_rate': round(win_rate * 100, 1),
-        'winning_trades': len(winning),
-        'losing_trades': len(trades) - len(winning),
-        'avg_holding_days': round(np.mean([t.holding_days for t in trades]), 1) if trades else 0,
+        'winning_trades': winning,
+        'losing_trades': n_trades - winning,
+        'avg_holding_days': round(np.mean(holding), 1) if n_trades else 0,
         'final_equity': round(final_equity, 0),
         'initial_capital': capital,
     }
     
     return {
         'symbol': symbol,
-        'trades': [t.to_dict() for t in trades],
+        'trades': records,
         'metrics': metrics,
         'equity_curve': equity_df,
     }
 
 
+def backtest_stock_vectorized(symbol: str, history: pd.DataFrame, rules: dict) -> dict:
+    """
+    backtest_stock 的向量化版本（同一組外掛）。
+    進場信號、出場條件、權益曲線都以 NumPy 整列運算；Python 迴圈只跑「每筆交易」而不是「每個 bar」。
+    回傳結構（trades / metrics / equity_curve）與 backtest_stock 完全相同。
+    策略的 on_bar 需要持倉狀態（vectorized = False）時改走 backtest_stock。
+    """
+    capital = _config(rules)[2]
+    strategy, exits = load_plugins(rules)
+    if not strategy.vectorized:
+        return backtest_stock(symbol, history, rules)
+    
+    warmup = strategy.warmup
+    if len(history) <= warmup:
+        return _build_result(symbol, [], pd.DataFrame(), capital)
+    
+    ind = prepare_indicators(strategy, exits, history['Close'], symbol)
+    ledger, equity_df = simulate(symbol, ind, strategy.signals(ind), history.index, rules,
+                                 strategy, exits, start=warmup)
+    return _build_result(symbol, ledger, equity_df, capital)
+
+
+def simulate(symbol: str, ind: dict, signal: np.ndarray, dates: pd.Index, rules: dict,
+             strategy, exits: list, start: int) -> tuple:
+    """
+    向量化引擎本體：在算好的指標與進場信號上推進，回傳 (TradeLedger, equity_df)
+    ind / signal / dates 可以是整段歷史或其中一段的切片（walk-forward 每個視窗共用同一份指標），
+    start 之前不進場、權益曲線從 start 開始；切片結束時還有持倉就以最後一根平倉
+    """
+    commission, tax, capital, position_pct = _config(rules)
+    price = ind['close']
+    n = len(price)
+    
+    signal = signal.copy()
+    signal[:start] = False
+    
+    position_capital = capital * position_pct
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lots = np.floor(position_capital / price / 1000)
+    shares_at = np.where(np.isfinite(lots), lots, 0).astype(np.int64) * 1000  # 台股整張
+    signal &= shares_at > 0
+    candidates = np.flatnonzero(signal)
+    
+    ledger = TradeLedger(symbol, dates, commission, tax)
+    cash = capital
+    # 只在進出場的 bar 記下現金與持股，之後向前填滿（同一 bar 先出後進，後寫入者為準）
+    event_idx = [start]
+    event_cash = [capital]
+    event_shares = [0]
+    pos = 0  # 下一個可進場的 bar（出場當天可以再進場）
+    
+    while True:
+        c = np.searchsorted(candidates, pos)
+        # 資金不足的信號跳過（逐日迴圈中同樣不進場）
+        while c < len(candidates) and cash < price[candidates[c]] * shares_at[candidates[c]]:
+            c += 1
+        if c >= len(candidates):
+            break
+        
+        e = int(candidates[c])
+        entry_price = price[e]
+        shares = int(shares_at[e])
+        row = ledger.open(e, entry_price, shares, strategy.reason(ind, e))
+        cash -= entry_price * shares
+        event_idx.append(e)
+        event_cash.append(cash)
+        event_shares.append(shares)
+        
+        x, reason = _first_exit(exits, ind, e, entry_price)
+        if x is None:
+            # 持有到最後，強制平倉（不影響權益曲線）
+            ledger.close(row, n - 1, price[-1], '回測結束平倉')
+            cash += price[-1] * shares
+            break
+        
+        ledger.close(row, x, price[x], reason)
+        cash += price[x] * shares
+        event_idx.append(x)
+        event_cash.append(cash)
+        event_shares.append(0)
+        pos = x
+    
+    # 權益曲線：現金與持股數都是階梯函數，向前填滿後一次算完
+    last_event = np.zeros(n, dtype=np.int64)
+    last_event[event_idx] = np.arange(len(event_idx))
+    last_event = np.maximum.accumulate(last_event)[start:]
+    cash_curve = np.asarray(event_cash)[last_event]
+    held = np.asarray(event_shares, dtype=np.int64)[last_event]
+    equity = cash_curve + held * price[start:]
+    equity_df = pd.DataFrame({'equity': equity}, index=pd.Index(dates[start:], name='date'))
+    return ledger, equity_df
+
+
+def _first_exit(exits: list, ind: dict, entry_idx: int, entry_price: float):
+    """從進場隔日起，一次找出第一個觸發出場的 bar，回傳 (index, 出場理由)；未觸發回傳 (None, None)"""
+    price = ind['close']
+    window = price[entry_idx + 1:]
+    if len(window) == 0:
+        return None, None
+    
+    # 峰值包含進場當天價格，與逐日迴圈的 peak_price 更新順序一致
+    peak = np.maximum.accumulate(price[entry_idx:])[1:]
+    ctx = {key: value[entry_idx + 1:] for key, value in ind.items()}
+    ctx.update(price=window, entry_price=entry_price, held=np.arange(1, len(window) + 1),
+               unrealized=window / entry_price - 1, trailing=window / peak - 1)
+    k, reason = first_exit(exits, ctx)
+    if k is None:
+        return None, None
+    return entry_idx + 1 + k, reason
+
+
+def check_parity(symbol: str, history: pd.DataFrame, rules: dict) -> list:
+    """比對逐日迴圈與向量化引擎的結果，回傳差異清單（空清單代表一致）"""
+    loop = backtest_stock(symbol, history, rules)
+    fast = backtest_stock_vectorized(symbol, history, rules)
+    diffs = []
+    
+    if loop['metrics'] != fast['metrics']:
+        diffs.append(f"metrics: {loop['metrics']} != {fast['metrics']}")
+    if len(loop['trades']) != len(fast['trades']):
+        diffs.append(f"trades: {len(loop['trades'])} != {len(fast['trades'])} 筆")
+    for a, b in zip(loop['trades'], fast['trades']):
+        if a != b:
+            diffs.append(f"trade: {a} != {b}")
+    if 'equity_curve' in loop:
+        gap = (loop['equity_curve']['equity'] - fast['equity_curve']['equity']).abs().max()
+        if not gap <= 1e-6 * loop['metrics']['initial_capital']:
+            diffs.append(f"equity_curve 最大誤差 {gap}")
+    return diffs
+
+
+def _backtest_one(symbol: str, item: dict, rules: dict, engine: str) -> dict:
+    run = backtest_stock_vectorized if engine == 'vectorized' else backtest_stock
+    return run(symbol, item['history'], rules)
+
+
+def backtest_all(data: dict, rules: dict, symbols: list = None, workers: int = 1,
+                 engine: str = 'vectorized', mp_context=None) -> dict:
+    """
+    多檔回測，回傳 {symbol: result}
+    workers > 1 時用 process pool，每個 worker 唯讀 memory-map 同一份價格矩陣（見 price_matrix.map_symbols）
+    """
+    if workers > 1:
+        from price_matrix import map_symbols
+        return map_symbols(_backtest_one, data, symbols, (rules, engine), workers, price_fields=('Close',),
+                           mp_context=mp_context)
+    symbols = symbols if symbols is not None else list(data.keys())
+    return {s: _backtest_one(s, data[s], rules, engine) for s in symbols if s in data}
+
+
 def format_report(symbol: str, name: str, result: dict) -> str:
     """格式化單股回測報告"""
     m = result['metrics']
@@ -232,11 +468,58 @@ def format_report(symbol: str, name: str, result: dict) -> str:
     return report
 
 
+def synthetic_history(n_days: int = 750, seed: int = 0, start: str = '2023-01-02') -> pd.DataFrame:
+    """產生幾何隨機漫步的 OHLCV（離線驗證用）"""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, 0.02, n_days)
+    close = 100 * np.exp(np.cumsum(returns))
+    spread = np.abs(rng.normal(0, 0.01, n_days))
+    index = pd.bdate_range(start, periods=n_days)
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.005, n_days)),
+        'High': close * (1 + spread),
+        'Low': close * (1 - spread),
+        'Close': close,
+        'Volume': rng.integers(500_000, 20_000_000, n_days).astype(float),
+    }, index=index)
+
+
+def run_parity_check(rules: dict, seeds: int = 50) -> bool:
+    """
+    在合成資料上比對兩種引擎（含幾組不同的出場參數）
+    這裡只比兩個引擎彼此；兩者與原本逐日迴圈的比對在 tests/test_backtest_parity.py
+    """
+    variants = [
+        {},
+        {'take_profit': 0.05, 'stop_loss': -0.03, 'trailing_stop': 0.04},
+        {'take_profit': 0.30, 'stop_loss': -0.20, 'rsi_overbought': 60, 'trailing_stop': 0.25},
+    ]
+    failures = 0
+    for v in variants:
+        variant_rules = {**rules, 'exit': {**rules.get('exit', {}), **v}}
+        for seed in range(seeds):
+            history = synthetic_history(seed=seed)
+            diffs = check_parity(f'SYN{seed}', history, variant_rules)
+            if diffs:
+                failures += 1
+                print(f"  ❌ seed={seed} exit={v}")
+                for d in diffs[:3]:
+                    print(f"     {d}")
+    total = len(variants) * seeds
+    print(f"{'✅' if failures == 0 else '❌'} 一致性檢查：{total - failures}/{total} 通過")
+    return failures == 0
+
+
 if __name__ == "__main__":
+    import sys
     from data_fetch import fetch_history
     
     rules = load_rules()
     
+    # python3 backtest.py --parity：離線比對逐日迴圈與向量化引擎
+    if '--parity' in sys.argv:
+        sys.exit(0 if run_parity_check(rules) else 1)
+    
     # 測試單一個股
     symbol = "2330.TW"
     print(f"📈 回測 {symbol}...")
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+bench.py — quant-invest 效能基準
+用合成的 OHLCV（幾何隨機漫步，N 檔 × M 年）量測各階段的耗時、每根 K 棒吞吐量與記憶體峰值，
+完全離線：資料先寫進暫存的本地價格庫與基本面快取，fetch_all 走的是「快取命中」路徑。
+
+結果存到 results/bench/<commit>.json，可與其他 commit 比較：
+    python3 bench.py --symbols 200 --years 3
+    python3 bench.py --compare a02da4a          # 比較並在退步超過門檻時 exit 1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import data_fetch
+import indicators
+from backtest import backtest_all, backtest_stock, backtest_stock_vectorized, load_rules
+from portfolio import backtest_portfolio
+from price_matrix import fetch_matrix
+from screener import run_screening
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'results', 'bench')
+BENCHMARK_SYMBOL = '^TWII'
+
+
+# === 合成資料 ===
+
+def synthetic_universe(n_symbols: int, years: float, seed: int = 0) -> dict:
+    """N 檔幾何隨機漫步（含大盤），回傳 {sym: {'history', 'info'}}"""
+    rng = np.random.default_rng(seed)
+    n_days = int(years * 252)
+    index = pd.bdate_range(end=pd.Timestamp(datetime.now().date()), periods=n_days)
+    data = {}
+    for i in range(n_symbols + 1):
+        sym = BENCHMARK_SYMBOL if i == n_symbols else f"{9000 + i}.TW"
+        drift, vol = rng.normal(0.0004, 0.0003), rng.uniform(0.01, 0.03)
+        close = rng.uniform(20, 500) * np.exp(np.cumsum(rng.normal(drift, vol, n_days)))
+        spread = np.abs(rng.normal(0, vol / 2, n_days))
+        history = pd.DataFrame({
+            'Open': close * (1 + rng.normal(0, vol / 4, n_days)),
+            'High': close * (1 + spread),
+            'Low': close * (1 - spread),
+            'Close': close,
+            'Volume': rng.lognormal(15, 1, n_days).round(),
+            'Dividends': 0.0,
+            'Stock Splits': 0.0,
+        }, index=index)
+        info = {
+            'symbol': sym, 'name': f'SYN{i}', 'sector': 'Synthetic', 'industry': 'N/A',
+            'market_cap': float(rng.uniform(1e10, 5e12)), 'pe_ratio': float(rng.uniform(3, 50)),
+            'forward_pe': None, 'dividend_yield': None,
+            'revenue_growth': float(rng.normal(0.05, 0.2)), 'profit_margin': None,
+            'fifty_day_avg': None, 'two_hundred_day_avg': None,
+        }
+        data[sym] = {'history': history, 'info': info}
+    return data
+
+
+@contextlib.contextmanager
+def temporary_store(data: dict, years: float):
+    """把合成資料寫進暫存的價格庫 / 基本面快取，結束後還原 data_fetch 的路徑"""
+    saved = (data_fetch.STORE_DIR, data_fetch.FUNDAMENTALS_PATH, data_fetch._fundamentals)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_fetch.STORE_DIR = tmp
+        data_fetch.FUNDAMENTALS_PATH = os.path.join(tmp, 'fundamentals.json')
+        data_fetch._fundamentals = {}
+        # 起日至少涵蓋 3 年，週報抓大盤（period_years=3）時也不會觸發下載
+        start = datetime.now() - timedelta(days=int(max(years, 3) * 365) + 7)
+        now = datetime.now().isoformat(timespec='seconds')
+        meta = {}
+        for sym, item in data.items():
+            data_fetch.store_history(sym, item['history'], start, meta=meta)
+            values = {k: v for k, v in item['info'].items() if k in data_fetch.FIELD_TTL_HOURS}
+            data_fetch._fundamentals[sym] = {k: {'value': v, 'fetched_at': now} for k, v in values.items()}
+        data_fetch._save_store_meta(meta)
+        data_fetch._save_fundamentals()
+        try:
+            yield tmp
+        finally:
+            data_fetch.STORE_DIR, data_fetch.FUNDAMENTALS_PATH, data_fetch._fundamentals = saved
+
+
+# === 量測 ===
+
+def _reset_peak_rss() -> bool:
+    """Linux：寫 5 到 clear_refs 可以重設 VmHWM，讓每個階段各自量峰值"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _rss_kb(field: str) -> int:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # 非 Linux：整個 process 的峰值
+
+
+def measure(name: str, fn, bars: int, repeat: int = 1) -> dict:
+    """跑 fn，回傳 wall / cpu 時間、每秒 K 棒數、RSS 峰值與增量（MB）"""
+    indicators.clear_cache()
+    _reset_peak_rss()
+    rss_before = _rss_kb('VmRSS')
+    walls = []
+    cpu_start = time.process_time()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        walls.append(time.perf_counter() - start)
+        indicators.clear_cache()
+    cpu = (time.process_time() - cpu_start) / repeat
+    wall = min(walls)
+    peak = _rss_kb('VmHWM')
+    return {
+        'stage': name,
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'bars': bars,
+        'bars_per_s': round(bars / wall) if wall > 0 else None,
+        'peak_rss_mb': round(peak / 1024, 1),
+        'rss_delta_mb': round(max(peak - rss_before, 0) / 1024, 1),
+    }
+
+
+def run_benchmarks(n_symbols: int, years: float, repeat: int = 3, seed: int = 0) -> dict:
+    rules = load_rules()
+    data = synthetic_universe(n_symbols, years, seed)
+    benchmark = data.pop(BENCHMARK_SYMBOL)
+    symbols = list(data.keys())
+    n_bars = sum(len(d['history']) for d in data.values())
+    one = symbols[0]
+    one_bars = len(data[one]['history'])
+
+    results = []
+    with temporary_store({**data, BENCHMARK_SYMBOL: benchmark}, years), \
+            tempfile.TemporaryDirectory() as out_dir:
+        results.append(measure('fetch_all', lambda: data_fetch.fetch_all(symbols, years), n_bars, repeat))
+        results.append(measure('fetch_matrix',
+                               lambda: fetch_matrix(symbols, years, price_fields=('Close',)), n_bars, repeat))
+        results.append(measure('run_screening', lambda: run_screening(data, rules), n_bars, repeat))
+        with contextlib.redirect_stdout(io.StringIO()):
+            matrix = fetch_matrix(symbols, years, price_fields=('Close',))
+        results.append(measure('run_screening[matrix]', lambda: run_screening(matrix, rules), n_bars, repeat))
+        results.append(measure('run_screening[stock]',
+                               lambda: run_screening(data, rules, mode='stock'), n_bars, repeat))
+        results.append(measure('backtest_stock', lambda: backtest_stock(one, data[one]['history'], rules),
+                               one_bars, repeat))
+        results.append(measure('backtest_stock_vectorized',
+                               lambda: backtest_stock_vectorized(one, data[one]['history'], rules),
+                               one_bars, repeat))
+        results.append(measure('backtest_stock[all]',
+                               lambda: [backtest_stock_vectorized(s, d['history'], rules) for s, d in data.items()],
+                               n_bars, repeat))
+        results.append(measure('backtest_all[workers=4]',
+                               lambda: backtest_all(data, rules, workers=4), n_bars, repeat))
+        results.append(measure('backtest_portfolio', lambda: backtest_portfolio(data, rules), n_bars, repeat))
+
+        from report import generate_weekly_report
+        results.append(measure('generate_weekly_report',
+                               lambda: generate_weekly_report(os.path.join(out_dir, 'report.md'), rules, symbols,
+                                                              use_cache=False),
+                               n_bars, 1))
+
+    return {
+        'commit': _git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'symbols': n_symbols,
+        'years': years,
+        'seed': seed,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'stages': results,
+    }
+
+
+# === 跨 commit 比較 ===
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--', '.'], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        return out.stdout.strip() + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _load_result(ref: str) -> dict:
+    path = ref if os.path.exists(ref) else os.path.join(RESULTS_DIR, f"{ref}.json")
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.10) -> list:
+    """回傳退步超過 threshold 的階段（wall 時間或 RSS 增量）"""
+    if (current['symbols'], current['years']) != (baseline['symbols'], baseline['years']):
+        print(f"⚠️ 資料規模不同（{baseline['symbols']} 檔 × {baseline['years']} 年），比較僅供參考")
+    base = {s['stage']: s for s in baseline['stages']}
+    regressions = []
+    print(f"\n📊 {baseline['commit']} → {current['commit']}")
+    print(f"{'stage':<28}{'wall (s)':>20}{'Δ':>9}{'RSS Δ (MB)':>22}")
+    for s in current['stages']:
+        b = base.get(s['stage'])
+        if b is None:
+            print(f"{s['stage']:<28}{s['wall_s']:>20.4f}{'new':>9}")
+            continue
+        change = s['wall_s'] / b['wall_s'] - 1 if b['wall_s'] else 0
+        flag = ''
+        if change > threshold:
+            flag = ' ❌'
+            regressions.append(s['stage'])
+        elif change < -threshold:
+            flag = ' ✅'
+        print(f"{s['stage']:<28}{b['wall_s']:>9.4f} → {s['wall_s']:<9.4f}{change*100:>+8.1f}%"
+              f"{b['rss_delta_mb']:>10.1f} → {s['rss_delta_mb']:<9.1f}{flag}")
+    return regressions
+
+
+def print_results(result: dict):
+    print(f"\n⏱️ {result['symbols']} 檔 × {result['years']} 年（commit {result['commit']}）")
+    print(f"{'stage':<28}{'wall (s)':>10}{'cpu (s)':>10}{'bars/s':>14}{'peak RSS':>11}{'RSS Δ':>9}")
+    for s in result['stages']:
+        print(f"{s['stage']:<28}{s['wall_s']:>10.4f}{s['cpu_s']:>10.4f}{s['bars_per_s'] or 0:>14,}"
+              f"{s['peak_rss_mb']:>9.1f}MB{s['rss_delta_mb']:>7.1f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="quant-invest 效能基準（離線合成資料）")
+    parser.add_argument("--symbols", type=int, default=37)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--repeat", type=int, default=3, help="每階段重複次數（取最快）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", default=None, help="要比較的 commit 或結果檔")
+    parser.add_argument("--threshold", type=float, default=0.10, help="退步門檻（預設 10%%）")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    result = run_benchmarks(args.symbols, args.years, args.repeat, args.seed)
+    print_results(result)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{result['commit']}.json")
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 {path}")
+
+    if args.compare:
+        regressions = compare(result, _load_result(args.compare), args.threshold)
+        if regressions:
+            print(f"\n❌ 退步：{', '.join(regressions)}")
+            sys.exit(1)
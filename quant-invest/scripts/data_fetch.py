@@ -9,13 +9,24 @@ import pandas as pd
 from datetime import datetime, timedelta
 import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+try:
+    import pyarrow  # noqa: F401 — 有裝才用 Parquet
+    STORE_EXT = 'parquet'
+except ImportError:
+    STORE_EXT = 'pkl'
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
+STORE_DIR = os.path.join(DATA_DIR, 'store')
+os.makedirs(STORE_DIR, exist_ok=True)
 
 
 # 台股主要標的池（市值前 100 + 熱門 ETF）
-# 這個清單會隨著策略調整而更新
+# 完整上市櫃清單見 config/universe/tw_listed.csv（universe.py）；這裡保留為 fetch_all 的預設值
 TW_UNIVERSE = [
     # 半導體
     "2330.TW",  # 台積電
@@ -64,29 +75,328 @@ TW_UNIVERSE = [
 ]
 
 
-def fetch_history(symbol: str, period_years: int = 3) -> pd.DataFrame:
-    """抓取個股歷史價格"""
-    end = datetime.now()
-    start = end - timedelta(days=period_years * 365)
+# === 抓取統計 ===
+# 記錄價格庫 / 基本面快取命中與每檔連網耗時，report 的效能紀錄會讀取
+
+_stats_lock = threading.Lock()
+
+
+def _empty_fetch_stats() -> dict:
+    return {
+        'history': {'fresh': 0, 'incremental': 0, 'full': 0, 'reload': 0},
+        'info': {'hit': 0, 'miss': 0},
+        'latency': {},   # {symbol: {'history_s', 'info_s'}}
+        'batches': [],   # yf.download 批次：{'symbols', 'seconds'}
+    }
+
+
+_fetch_stats = _empty_fetch_stats()
+
+
+def reset_fetch_stats():
+    global _fetch_stats
+    with _stats_lock:
+        _fetch_stats = _empty_fetch_stats()
+
+
+def fetch_stats() -> dict:
+    """目前累計的抓取統計（含命中率）"""
+    with _stats_lock:
+        stats = json.loads(json.dumps(_fetch_stats))
+    hist_total = sum(stats['history'].values())
+    info_total = sum(stats['info'].values())
+    stats['history']['hit_ratio'] = round(stats['history']['fresh'] / hist_total, 3) if hist_total else None
+    stats['info']['hit_ratio'] = round(stats['info']['hit'] / info_total, 3) if info_total else None
+    return stats
+
+
+def _count(kind: str, key: str):
+    with _stats_lock:
+        _fetch_stats[kind][key] += 1
+
+
+def _record_latency(symbol: str, field: str, seconds: float):
+    with _stats_lock:
+        _fetch_stats['latency'].setdefault(symbol, {})[field] = round(seconds, 4)
+
+
+# === 本地價格庫 ===
+# 每檔一個檔案（data/store/<symbol>.parquet），另有 _meta.json 記錄涵蓋起日與最後更新時間。
+# 之後的執行只補抓最後一筆之後的資料。
+
+def _store_path(symbol: str) -> str:
+    return os.path.join(STORE_DIR, f"{symbol.replace('.', '_').replace('^', '_')}.{STORE_EXT}")
+
+
+def _meta_path() -> str:
+    return os.path.join(STORE_DIR, '_meta.json')
+
+
+# 價格庫 meta 的讀-改-寫要互斥（週報管線中，大盤與個股會在不同 thread 同時更新）
+_meta_lock = threading.RLock()
+
+
+def load_store_meta() -> dict:
+    if not os.path.exists(_meta_path()):
+        return {}
+    with open(_meta_path(), 'r') as f:
+        return json.load(f)
+
+
+def _save_store_meta(meta: dict):
+    tmp = _meta_path() + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, _meta_path())
+
+
+def load_stored(symbol: str) -> pd.DataFrame:
+    """讀取本地價格庫，沒有則回傳空 DataFrame"""
+    path = _store_path(symbol)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    if STORE_EXT == 'parquet':
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def store_history(symbol: str, df: pd.DataFrame, start: datetime = None, meta: dict = None):
+    """寫入本地價格庫並更新 meta（傳入 meta 時只更新該 dict，由呼叫端統一寫回）"""
+    if df.empty:
+        return
+    path = _store_path(symbol)
+    tmp = path + '.tmp'
+    if STORE_EXT == 'parquet':
+        df.to_parquet(tmp)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, path)
     
+    deferred = meta is not None
+    if deferred:
+        _update_meta_entry(meta, symbol, df, start)
+        return
+    with _meta_lock:
+        meta = load_store_meta()
+        _update_meta_entry(meta, symbol, df, start)
+        _save_store_meta(meta)
+
+
+def _update_meta_entry(meta: dict, symbol: str, df: pd.DataFrame, start: datetime = None):
+    entry = meta.get(symbol, {})
+    if start is not None:
+        entry['start'] = min(entry.get('start', start.strftime('%Y-%m-%d')), start.strftime('%Y-%m-%d'))
+    entry['last_bar'] = df.index[-1].strftime('%Y-%m-%d')
+    entry['avg_volume_20d'] = float(df['Volume'].tail(20).mean())  # 給 universe 預篩用，不必讀整個檔
+    entry['updated'] = datetime.now().strftime('%Y-%m-%d')
+    meta[symbol] = entry
+
+
+def merge_store_meta(meta: dict, symbols: list):
+    """把延後寫入的 meta 中這些標的的項目合併回檔案（不覆蓋其他 thread 同時寫入的標的）"""
+    with _meta_lock:
+        merged = load_store_meta()
+        merged.update({s: meta[s] for s in symbols if s in meta})
+        _save_store_meta(merged)
+
+
+def _download(symbol: str, start: datetime, end: datetime) -> pd.DataFrame:
     ticker = yf.Ticker(symbol)
     df = ticker.history(start=start, end=end)
+    if not df.empty:
+        df.index = df.index.tz_localize(None)
+    return df
+
+
+def _plan_update(symbol: str, start: datetime, end: datetime, refresh: bool, meta: dict):
+    """
+    決定這檔要怎麼更新，回傳 (mode, stored)
+    - 'fresh'：當天已更新過，直接用庫存
+    - 'incremental'：只補抓最後一根 K 棒（含，可能是盤中未收盤）之後的資料
+    - 'full'：下載完整區間
+    """
+    stored = pd.DataFrame() if refresh else load_stored(symbol)
+    entry = meta.get(symbol, {})
+    covered = not stored.empty and entry.get('start', '9999') <= start.strftime('%Y-%m-%d')
+    if covered and entry.get('updated') == end.strftime('%Y-%m-%d'):
+        return 'fresh', stored
+    if covered:
+        return 'incremental', stored
+    return 'full', stored
+
+
+def _incremental_start(stored: pd.DataFrame) -> datetime:
+    """
+    增量更新的起點：倒數第二根 K 棒。最後一根可能是盤中抓的、本來就會變；
+    倒數第二根已收盤，重抓後價格不同就代表 yfinance 重新還原過（見 _needs_reload）
+    """
+    return stored.index[-2 if len(stored) > 1 else -1].to_pydatetime()
+
+
+def _needs_reload(stored: pd.DataFrame, fresh: pd.DataFrame) -> bool:
+    """
+    庫存是以前還原過的價格，新 K 棒是今天還原的；中間有除權息或分割時兩段接不起來，要整段重抓：
+    - 新 K 棒有 Dividends / Stock Splits
+    - 重疊的已收盤 K 棒價格對不上
+    """
+    if fresh.empty or stored.empty:
+        return False
+    new = fresh[fresh.index > stored.index[-1]]
+    for col in ('Dividends', 'Stock Splits'):
+        if col in new.columns and (new[col].fillna(0) != 0).any():
+            return True
+    if len(stored) > 1 and stored.index[-2] in fresh.index:
+        before = float(stored['Close'].iloc[-2])
+        after = float(fresh.at[stored.index[-2], 'Close'])
+        if abs(after - before) > 1e-4 * abs(before):
+            return True
+    return False
+
+
+def _merge_history(stored: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+    """用新抓的資料覆蓋庫存最後一根 K 棒之後的部分"""
+    if fresh.empty:
+        return stored
+    if stored.empty:
+        return fresh
+    return pd.concat([stored[stored.index < fresh.index[0]], fresh])
+
+
+def _window(df: pd.DataFrame, start: datetime) -> pd.DataFrame:
+    return df[df.index >= pd.Timestamp(start.date())] if not df.empty else df
+
+
+def fetch_history(symbol: str, period_years: int = 3, refresh: bool = False) -> pd.DataFrame:
+    """
+    抓取個股歷史價格（優先使用本地價格庫）
+    當天已更新過則完全不連網；refresh=True 重新下載完整區間
+    """
+    end = datetime.now()
+    start = end - timedelta(days=period_years * 365)
+    
+    mode, stored = _plan_update(symbol, start, end, refresh, load_store_meta())
+    _count('history', mode)
+    t0 = time.perf_counter()
+    if mode == 'fresh':
+        df = stored
+    elif mode == 'incremental':
+        fresh = _download(symbol, _incremental_start(stored), end)
+        if _needs_reload(stored, fresh):
+            _count('history', 'reload')
+            df = _download(symbol, start, end)
+        else:
+            df = _merge_history(stored, fresh)
+        store_history(symbol, df, start)
+    else:
+        df = _download(symbol, start, end)
+        store_history(symbol, df, start)
+    if mode != 'fresh':
+        _record_latency(symbol, 'history_s', time.perf_counter() - t0)
     
     if df.empty:
         print(f"  ⚠️ {symbol}: 無資料")
         return df
     
-    df.index = df.index.tz_localize(None)
-    return df
+    return _window(df, start)
+
+
+# === 基本面快取 ===
+# ticker.info 是最慢的 yfinance 呼叫，但基本面最多一天變一次。
+# 每個欄位各自記錄抓取時間，依 FIELD_TTL_HOURS 判斷是否過期；全部欄位都沒過期才不連網。
+
+FUNDAMENTALS_PATH = os.path.join(STORE_DIR, 'fundamentals.json')
+FIELD_TTL_HOURS = {
+    'name': 24 * 30,
+    'sector': 24 * 30,
+    'industry': 24 * 30,
+    'market_cap': 24,
+    'pe_ratio': 24,
+    'forward_pe': 24,
+    'dividend_yield': 24 * 7,
+    'revenue_growth': 24 * 7,
+    'profit_margin': 24 * 7,
+    'fifty_day_avg': 24,
+    'two_hundred_day_avg': 24,
+}
 
+_fundamentals = None
+_fundamentals_lock = threading.Lock()
 
-def fetch_info(symbol: str) -> dict:
-    """抓取個股基本面資訊"""
+
+def _load_fundamentals() -> dict:
+    global _fundamentals
+    if _fundamentals is None:
+        if os.path.exists(FUNDAMENTALS_PATH):
+            with open(FUNDAMENTALS_PATH, 'r') as f:
+                _fundamentals = json.load(f)
+        else:
+            _fundamentals = {}
+    return _fundamentals
+
+
+def load_fundamentals() -> dict:
+    """基本面快取的淺拷貝 {symbol: {field: {'value', 'fetched_at'}}}"""
+    with _fundamentals_lock:
+        return dict(_load_fundamentals())
+
+
+def _save_fundamentals():
+    tmp = FUNDAMENTALS_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(_fundamentals, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, FUNDAMENTALS_PATH)
+
+
+def stale_fields(info: dict, fields: list = None, now: datetime = None) -> list:
+    """回傳 info 中已超過 TTL 的欄位（沒有抓取時間的欄位視為過期）"""
+    now = now or datetime.now()
+    fetched_at = info.get('fetched_at', {})
+    stale = []
+    for field in fields or FIELD_TTL_HOURS:
+        ts = fetched_at.get(field)
+        if ts is None or now - datetime.fromisoformat(ts) > timedelta(hours=FIELD_TTL_HOURS[field]):
+            stale.append(field)
+    return stale
+
+
+def _info_from_cache(symbol: str, allow_stale: bool = False) -> dict:
+    """從快取組出 info；有欄位過期且 allow_stale=False 時回傳 None"""
+    with _fundamentals_lock:
+        entry = _load_fundamentals().get(symbol)
+        if not entry:
+            return None
+        entry = {k: dict(v) for k, v in entry.items()}
+    info = {'symbol': symbol, 'from_cache': True,
+            'fetched_at': {k: v['fetched_at'] for k, v in entry.items()}}
+    info.update({k: v['value'] for k, v in entry.items()})
+    if not allow_stale and stale_fields(info):
+        return None
+    return info
+
+
+def cached_info(symbol: str) -> dict:
+    """所有欄位都還在 TTL 內時回傳快取的 info，否則回傳 None"""
+    return _info_from_cache(symbol)
+
+
+def fetch_info(symbol: str, raise_errors: bool = False, refresh: bool = False) -> dict:
+    """
+    抓取個股基本面資訊（優先使用快取）
+    refresh=True 強制連網；raise_errors=True 時把錯誤交給呼叫端重試
+    """
+    if not refresh:
+        cached = cached_info(symbol)
+        if cached is not None:
+            _count('info', 'hit')
+            return cached
+    
+    _count('info', 'miss')
+    t0 = time.perf_counter()
     ticker = yf.Ticker(symbol)
     try:
         info = ticker.info
-        return {
-            'symbol': symbol,
+        _record_latency(symbol, 'info_s', time.perf_counter() - t0)
+        values = {
             'name': info.get('longName', info.get('shortName', symbol)),
             'sector': info.get('sector', 'N/A'),
             'industry': info.get('industry', 'N/A'),
@@ -100,14 +410,39 @@ def fetch_info(symbol: str) -> dict:
             'two_hundred_day_avg': info.get('twoHundredDayAverage', None),
         }
     except Exception as e:
-        print(f"  ⚠️ {symbol}: 無法取得資訊 ({e})")
-        return {'symbol': symbol, 'error': str(e)}
+        if raise_errors:
+            raise
+        return info_fallback(symbol, e)
+    
+    now = datetime.now().isoformat(timespec='seconds')
+    with _fundamentals_lock:
+        _load_fundamentals()[symbol] = {k: {'value': v, 'fetched_at': now} for k, v in values.items()}
+        _save_fundamentals()
+    
+    return {'symbol': symbol, **values, 'from_cache': False,
+            'fetched_at': {k: now for k in values}}
+
 
+def info_fallback(symbol: str, error: Exception) -> dict:
+    """連網失敗時退回過期的快取（screen_stock 會標示資料過期），沒有快取才回傳錯誤"""
+    stale = _info_from_cache(symbol, allow_stale=True)
+    if stale is not None:
+        print(f"  ⚠️ {symbol}: 無法更新資訊，沿用快取 ({error})")
+        return stale
+    print(f"  ⚠️ {symbol}: 無法取得資訊 ({error})")
+    return {'symbol': symbol, 'error': str(error)}
 
-def fetch_all(symbols: list = None, period_years: int = 3) -> dict:
-    """批量抓取所有標的"""
+
+def fetch_all(symbols: list = None, period_years: int = 3, refresh: bool = False,
+              workers: int = 1, progress=None, refresh_info: bool = False) -> dict:
+    """
+    批量抓取所有標的
+    workers > 1 時改用並行模式（見 fetch_all_concurrent），回傳格式相同
+    """
     if symbols is None:
         symbols = TW_UNIVERSE
+    if workers > 1:
+        return fetch_all_concurrent(symbols, period_years, refresh, workers, progress, refresh_info)
     
     results = {}
     total = len(symbols)
@@ -116,12 +451,12 @@ def fetch_all(symbols: list = None, period_years: int = 3) -> dict:
         print(f"  [{i+1}/{total}] {sym}...", end=" ")
         
         # 價格
-        hist = fetch_history(sym, period_years)
+        hist = fetch_history(sym, period_years, refresh=refresh)
         if hist.empty:
             continue
         
         # 基本面
-        info = fetch_info(sym)
+        info = fetch_info(sym, refresh=refresh_info)
         
         results[sym] = {
             'history': hist,
@@ -132,23 +467,245 @@ def fetch_all(symbols: list = None, period_years: int = 3) -> dict:
     return results
 
 
-def save_cache(results: dict):
-    """儲存快取"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    cache_dir = os.path.join(DATA_DIR, today)
-    os.makedirs(cache_dir, exist_ok=True)
+# === 並行抓取 ===
+# Yahoo 對同一主機的請求頻率很敏感：所有請求都經過 per-host 限速器，失敗時指數退避重試。
+
+YAHOO_HOST = 'query2.finance.yahoo.com'
+HOST_RATE_LIMITS = {YAHOO_HOST: 4.0}  # 每秒請求數
+BATCH_SIZE = 50  # yf.download 一次下載的檔數
+HISTORY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+
+
+class RateLimiter:
+    """簡單的最小間隔限速器（thread-safe）"""
+    
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter(host: str) -> RateLimiter:
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = RateLimiter(HOST_RATE_LIMITS.get(host, 2.0))
+        return _limiters[host]
+
+
+def with_retry(fn, *args, retries: int = 3, base_delay: float = 1.0, host: str = YAHOO_HOST, **kwargs):
+    """限速 + 指數退避重試（加少量隨機抖動避免同時重試）"""
+    for attempt in range(retries + 1):
+        _limiter(host).wait()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(base_delay * (2 ** attempt) * (1 + random.random() * 0.25))
+
+
+def _download_batch(symbols: list, start: datetime, end: datetime) -> dict:
+    """用 yf.download 一次抓多檔，回傳 {sym: df}（欄位與 Ticker.history 相同）"""
+    raw = yf.download(symbols, start=start, end=end, actions=True, auto_adjust=True,
+                      group_by='ticker', threads=False, progress=False)
+    frames = {}
+    if raw is None or raw.empty:
+        return frames
+    for sym in symbols:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if sym not in raw.columns.get_level_values(0):
+                continue
+            df = raw[sym]
+        else:
+            df = raw
+        df = df.dropna(how='all')
+        if df.empty:
+            continue
+        df = df[[c for c in HISTORY_COLUMNS if c in df.columns]].copy()
+        df.columns.name = None
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        frames[sym] = df
+    return frames
+
+
+def _download_group(syms: list, group_start: datetime, end: datetime) -> dict:
+    """同一起日的標的分批用 yf.download 抓；批次沒拿到的改用單檔 API，回傳 {sym: df}"""
+    out = {}
+    for i in range(0, len(syms), BATCH_SIZE):
+        chunk = syms[i:i + BATCH_SIZE]
+        t0 = time.perf_counter()
+        try:
+            fresh = with_retry(_download_batch, chunk, group_start, end)
+        except Exception as e:
+            print(f"  ⚠️ 批次下載失敗，改逐檔抓取 ({e})")
+            fresh = {}
+        batch_s = time.perf_counter() - t0
+        with _stats_lock:
+            _fetch_stats['batches'].append({'symbols': len(chunk), 'seconds': round(batch_s, 4)})
+        for sym in chunk:
+            if sym in fresh:
+                _record_latency(sym, 'history_s', batch_s)  # 批次內共用
+            else:
+                # 批次沒拿到的（例如批次失敗）改用單檔 API
+                t0 = time.perf_counter()
+                try:
+                    fresh[sym] = with_retry(_download, sym, group_start, end)
+                except Exception as e:
+                    print(f"  ⚠️ {sym}: 下載失敗 ({e})")
+                    fresh[sym] = pd.DataFrame()
+                _record_latency(sym, 'history_s', batch_s + time.perf_counter() - t0)
+            out[sym] = fresh[sym]
+    return out
+
+
+def _fetch_histories_batched(plans: dict, start: datetime, end: datetime) -> dict:
+    """依更新模式分組批次下載，回傳 {sym: 合併後完整 df}"""
+    histories = {sym: stored for sym, (mode, stored) in plans.items() if mode == 'fresh'}
     
+    groups = {}
+    for sym, (mode, stored) in plans.items():
+        if mode == 'full':
+            groups.setdefault(start, []).append(sym)
+        elif mode == 'incremental':
+            # 同一天起點的放一起，一次批次抓
+            groups.setdefault(_incremental_start(stored), []).append(sym)
+    
+    reload = []
+    for group_start, syms in groups.items():
+        for sym, fresh in _download_group(syms, group_start, end).items():
+            stored = plans[sym][1]
+            if plans[sym][0] == 'incremental' and _needs_reload(stored, fresh):
+                reload.append(sym)
+            else:
+                histories[sym] = _merge_history(stored, fresh)
+    
+    # 除權息 / 分割：庫存的舊還原價格接不上，整段重抓
+    for sym in reload:
+        _count('history', 'reload')
+    if reload:
+        histories.update(_download_group(reload, start, end))
+    return histories
+
+
+def fetch_all_concurrent(symbols: list, period_years: int = 3, refresh: bool = False,
+                         workers: int = 8, progress=None, refresh_info: bool = False) -> dict:
+    """
+    並行批量抓取：
+    - 歷史價格：依本地價格庫決定更新模式，同模式的標的用 yf.download 批次抓
+    - 基本面：快取仍有效的直接使用；其餘 ticker.info 無法批次，用 bounded thread pool 並行
+    - progress(done, total, symbol)：每完成一檔呼叫一次
+    """
+    end = datetime.now()
+    start = end - timedelta(days=period_years * 365)
+    total = len(symbols)
+    
+    meta = load_store_meta()
+    plans = {sym: _plan_update(sym, start, end, refresh, meta) for sym in symbols}
+    for mode, _ in plans.values():
+        _count('history', mode)
+    
+    # 基本面先丟進 pool，與歷史價格下載重疊（快取命中的不佔用限速額度）
+    pool = ThreadPoolExecutor(max_workers=workers)
+    info_futures = {}
+    for sym in symbols:
+        cached = None if refresh_info else cached_info(sym)
+        if cached is not None:
+            _count('info', 'hit')
+            future = Future()
+            future.set_result(cached)
+        else:
+            future = pool.submit(with_retry, fetch_info, sym, raise_errors=True, refresh=True)
+        info_futures[future] = sym
+    
+    try:
+        histories = _fetch_histories_batched(plans, start, end)
+        updated = [sym for sym, df in histories.items() if plans[sym][0] != 'fresh']
+        for sym in updated:
+            store_history(sym, histories[sym], start, meta=meta)
+        merge_store_meta(meta, updated)
+        
+        results = {}
+        done = 0
+        for future in as_completed(info_futures):
+            sym = info_futures[future]
+            done += 1
+            hist = _window(histories.get(sym, pd.DataFrame()), start)
+            if hist.empty:
+                print(f"  ⚠️ {sym}: 無資料")
+            else:
+                try:
+                    info = future.result()
+                except Exception as e:
+                    info = info_fallback(sym, e)
+                results[sym] = {'history': hist, 'info': info}
+            if progress is not None:
+                progress(done, total, sym)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    
+    # 維持輸入順序
+    return {sym: results[sym] for sym in symbols if sym in results}
+
+
+def fetch_quotes(symbols: list) -> dict:
+    """
+    盤中即時報價：{sym: (最新價, 當日累計成交量)}，取自當日 1 分 K（批次下載，經過限速與重試）
+    """
+    quotes = {}
+    for i in range(0, len(symbols), BATCH_SIZE):
+        batch = symbols[i:i + BATCH_SIZE]
+        try:
+            raw = with_retry(yf.download, batch, period='1d', interval='1m', auto_adjust=True,
+                             group_by='ticker', threads=False, progress=False)
+        except Exception as e:
+            print(f"  ⚠️ 即時報價失敗（{len(batch)} 檔）: {e}")
+            continue
+        if raw is None or raw.empty:
+            continue
+        for sym in batch:
+            if isinstance(raw.columns, pd.MultiIndex):
+                if sym not in raw.columns.get_level_values(0):
+                    continue
+                df = raw[sym]
+            else:
+                df = raw
+            df = df.dropna(subset=['Close'])
+            if not df.empty:
+                quotes[sym] = (float(df['Close'].iloc[-1]), float(df['Volume'].sum()))
+    return quotes
+
+
+def save_cache(results: dict):
+    """把 results 寫進本地價格庫（fetch_history 已自動寫入，這裡用於外部傳入的資料）"""
     for sym, data in results.items():
-        safe_name = sym.replace('.', '_')
-        data['history'].to_csv(os.path.join(cache_dir, f"{safe_name}_history.csv"))
-        with open(os.path.join(cache_dir, f"{safe_name}_info.json"), 'w') as f:
-            json.dump(data['info'], f, ensure_ascii=False, indent=2)
+        if not os.path.exists(_store_path(sym)):
+            store_history(sym, data['history'])
     
-    print(f"💾 快取已存入 {cache_dir}")
+    print(f"💾 價格庫：{STORE_DIR}（{len(load_store_meta())} 檔）")
 
 
 if __name__ == "__main__":
+    import sys
+    
+    # python3 data_fetch.py --full：忽略本地價格庫，重新下載完整區間
+    # python3 data_fetch.py --refresh-info：忽略基本面快取
+    refresh = '--full' in sys.argv
+    refresh_info = '--refresh-info' in sys.argv
     print("📊 開始抓取台股資料...")
-    results = fetch_all()
+    results = fetch_all(refresh=refresh, workers=8, refresh_info=refresh_info,
+                        progress=lambda done, total, sym: print(f"  [{done}/{total}] {sym} ✅"))
     save_cache(results)
     print(f"✅ 完成，共 {len(results)} 檔")
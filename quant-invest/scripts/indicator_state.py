@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+indicator_state.py — 串流式技術指標狀態（每日增量篩選用）
+每天收盤後只多一根 K 棒，沒必要每檔從 3 年歷史重算 60 日均線與 RSI。
+每檔保留：
+- 最近 K 根收盤價 / 成交量的環狀緩衝（K = 最長的均線週期，至少 20）
+- 各均線週期的收盤價滾動和、20 日成交量滾動和
+- RSI 14 的漲跌幅滾動和（簡單平均，與 indicators.compute_rsi 預設相同）與 Wilder 平均
+新的一根 K 棒進來只做固定次數的加減，跟歷史長度無關；狀態存在 data/store/indicator_state.npz。
+
+所有標的放在同一組陣列裡，同一天的 K 棒一次推進（向量運算），冷啟動就是把整段歷史逐日推一遍。
+最後一根 K 棒被改寫（盤中資料被收盤價覆蓋、除權息後整段還原價格調整）時該檔會自動重建。
+
+盤中模式：snapshot(ticks=...) 把即時報價當成「今天的 K 棒」算出指標，但不寫回狀態。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from price_matrix import PriceMatrix
+
+RSI_PERIOD = 14
+VOLUME_WINDOW = 20
+MOMENTUM_WINDOW = 20
+
+
+def default_state_path() -> str:
+    import data_fetch
+    return os.path.join(data_fetch.STORE_DIR, 'indicator_state.npz')
+
+
+def _ma_periods(rules: dict) -> tuple:
+    return tuple(int(p) for p in rules.get('technicals', {}).get('above_ma', [60]))
+
+
+class IndicatorState:
+    """(標的 × ...) 陣列形式的串流指標狀態"""
+
+    ARRAYS = ('closes', 'volumes', 'pos', 'bars', 'last_date', 'ma_sum', 'vol_sum',
+              'gain_sum', 'loss_sum', 'wilder_gain', 'wilder_loss')
+
+    def __init__(self, ma_periods: tuple = (60,)):
+        self.ma_periods = tuple(ma_periods)
+        self.window = max(self.ma_periods + (VOLUME_WINDOW, MOMENTUM_WINDOW, RSI_PERIOD + 1))
+        self.symbols = []
+        self._row = {}
+        k, m = self.window, len(self.ma_periods)
+        self.closes = np.zeros((0, k))
+        self.volumes = np.zeros((0, k))
+        self.pos = np.zeros(0, dtype=np.int64)      # 下一根 K 棒要寫入的位置
+        self.bars = np.zeros(0, dtype=np.int64)     # 累計 K 棒數
+        self.last_date = np.zeros(0, dtype='datetime64[ns]')
+        self.ma_sum = np.zeros((0, m))
+        self.vol_sum = np.zeros(0)
+        self.gain_sum = np.zeros(0)
+        self.loss_sum = np.zeros(0)
+        self.wilder_gain = np.zeros(0)
+        self.wilder_loss = np.zeros(0)
+
+    # === 列管理 ===
+
+    def _add_symbols(self, symbols: list):
+        new = [s for s in symbols if s not in self._row]
+        if not new:
+            return
+        n = len(new)
+        for s in new:
+            self._row[s] = len(self.symbols)
+            self.symbols.append(s)
+        for name in self.ARRAYS:
+            arr = getattr(self, name)
+            blank = np.zeros((n,) + arr.shape[1:], dtype=arr.dtype)
+            if name == 'last_date':
+                blank[:] = np.datetime64('NaT')
+            setattr(self, name, np.concatenate([arr, blank]))
+
+    def _reset(self, rows: np.ndarray):
+        for name in self.ARRAYS:
+            arr = getattr(self, name)
+            arr[rows] = np.datetime64('NaT') if name == 'last_date' else 0
+
+    # === 推進一根 K 棒 ===
+
+    def _lag(self, buf: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+        """寫入新 K 棒之前，往前數第 k 根（k=1 是目前最新一根）"""
+        return buf[rows, (self.pos[rows] - k) % self.window]
+
+    def _advance(self, rows: np.ndarray, close: np.ndarray, volume: np.ndarray) -> dict:
+        """算出加入新 K 棒後的各個和（不寫回）"""
+        b = self.bars[rows]
+        n = RSI_PERIOD
+        delta = np.where(b > 0, close - self._lag(self.closes, rows, 1), 0.0)
+        dropped = np.where(b >= n + 1, self._lag(self.closes, rows, n) - self._lag(self.closes, rows, n + 1), 0.0)
+        gain, loss = np.maximum(delta, 0), np.maximum(-delta, 0)
+
+        ma_sum = self.ma_sum[rows].copy()
+        for i, p in enumerate(self.ma_periods):
+            ma_sum[:, i] += close - np.where(b >= p, self._lag(self.closes, rows, p), 0.0)
+        alpha = 1 / n
+        return {
+            'close': close,
+            'bars': b + 1,
+            'ma_sum': ma_sum,
+            'vol_sum': self.vol_sum[rows] + volume
+                       - np.where(b >= VOLUME_WINDOW, self._lag(self.volumes, rows, VOLUME_WINDOW), 0.0),
+            'gain_sum': self.gain_sum[rows] + gain - np.maximum(dropped, 0),
+            'loss_sum': self.loss_sum[rows] + loss - np.maximum(-dropped, 0),
+            # 與 ewm(alpha=1/n, adjust=False) 相同：第一根的漲跌視為 0
+            'wilder_gain': self.wilder_gain[rows] * (1 - alpha) + alpha * gain,
+            'wilder_loss': self.wilder_loss[rows] * (1 - alpha) + alpha * loss,
+            # 加入後往前數第 MOMENTUM_WINDOW - 1 根 = 加入前的第 MOMENTUM_WINDOW - 1 根
+            'base_close': np.where(b >= MOMENTUM_WINDOW - 1,
+                                   self._lag(self.closes, rows, MOMENTUM_WINDOW - 1), np.nan),
+        }
+
+    def _push(self, rows: np.ndarray, date: np.datetime64, close: np.ndarray, volume: np.ndarray):
+        new = self._advance(rows, close, volume)
+        slot = self.pos[rows]
+        self.closes[rows, slot] = close
+        self.volumes[rows, slot] = volume
+        self.pos[rows] = (slot + 1) % self.window
+        self.bars[rows] = new['bars']
+        self.last_date[rows] = date
+        for name in ('ma_sum', 'vol_sum', 'gain_sum', 'loss_sum', 'wilder_gain', 'wilder_loss'):
+            getattr(self, name)[rows] = new[name]
+
+    # === 從價格資料更新 ===
+
+    def update(self, data: dict, before=None) -> dict:
+        """
+        把 data（fetch_all 的 dict 或 PriceMatrix）裡比狀態新的 K 棒推進去
+        before：只收這個日期之前的 K 棒（盤中模式用，今天的 K 棒還沒收完）
+        回傳 {'appended': 推進的 K 棒數, 'rebuilt': 重建的檔數}
+        """
+        symbols = list(data.keys())
+        self._add_symbols(symbols)
+        cutoff = np.datetime64(pd.Timestamp(before), 'ns') if before is not None else None
+        if isinstance(data, PriceMatrix):
+            rows, dates, closes, volumes, rebuild = self._queue_matrix(data, cutoff)
+        else:
+            rows, dates, closes, volumes, rebuild = self._queue_frames(data, cutoff)
+
+        if len(rebuild):
+            self._reset(rebuild)
+        order = np.lexsort((rows, dates))
+        rows, dates, closes, volumes = rows[order], dates[order], closes[order], volumes[order]
+        cuts = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+        for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(dates)]):
+            if hi > lo:
+                self._push(rows[lo:hi], dates[lo], closes[lo:hi], volumes[lo:hi])
+        return {'appended': len(dates), 'rebuilt': len(rebuild)}
+
+    def _matches_last(self, rows: np.ndarray, dates: np.ndarray, close: np.ndarray) -> np.ndarray:
+        """狀態的最後一根 K 棒還在、收盤價也沒被改過（除權息還原、盤中價被收盤價覆蓋都會改）"""
+        last_close = self._lag(self.closes, rows, 1)
+        return (self.bars[rows] > 0) & (dates == self.last_date[rows]) & \
+            (np.abs(close - last_close) <= 1e-6 * np.abs(last_close))
+
+    def _queue_matrix(self, matrix: PriceMatrix, cutoff) -> tuple:
+        """PriceMatrix：所有標的一次向量化找出新的 K 棒"""
+        n_dates = len(matrix.dates)
+        hi = np.searchsorted(matrix.dates, cutoff) if cutoff is not None else n_dates
+        cols = np.arange(len(matrix.symbols))
+        rows = np.array([self._row[s] for s in matrix.symbols], dtype=np.int64)
+        pos = np.minimum(np.searchsorted(matrix.dates, self.last_date[rows]), max(hi - 1, 0))
+        close = matrix.field('Close')
+        matched = (hi > 0) & matrix.valid[pos, cols] & \
+            self._matches_last(rows, matrix.dates[pos], close[pos, cols].astype(float))
+        start = np.where(matched, pos + 1, 0)
+        lo = int(start.min()) if len(start) else hi
+        block = matrix.valid[lo:hi] & (np.arange(lo, hi)[:, None] >= start[None, :])
+        d_idx, c_idx = np.nonzero(block)
+        d_idx += lo
+        return (rows[c_idx], matrix.dates[d_idx], close[d_idx, c_idx].astype(float),
+                matrix.field('Volume')[d_idx, c_idx].astype(float), rows[~matched])
+
+    def _queue_frames(self, data: dict, cutoff) -> tuple:
+        """逐檔 DataFrame：每檔只切出最後一根之後的部分"""
+        queue, rebuild = [], []
+        for sym in data.keys():
+            row = self._row[sym]
+            since = self.last_date[row] if self.bars[row] else None
+            dates, close, volume = _series(data, sym, since, cutoff)
+            one = np.array([row])
+            if since is not None and len(dates) and self._matches_last(one, dates[:1], close[:1])[0]:
+                dates, close, volume = dates[1:], close[1:], volume[1:]
+            else:
+                rebuild.append(row)
+                if since is not None:
+                    dates, close, volume = _series(data, sym, None, cutoff)
+            queue.append((np.full(len(dates), row), dates, close, volume))
+        if not queue:
+            empty = np.zeros(0)
+            return empty.astype(np.int64), empty.astype('datetime64[ns]'), empty, empty, np.zeros(0, np.int64)
+        return (*(np.concatenate([q[i] for q in queue]) for i in range(4)), np.asarray(rebuild, dtype=np.int64))
+
+    # === 目前指標 ===
+
+    def snapshot(self, symbols: list = None, ticks: dict = None) -> dict:
+        """
+        每檔最新的指標，格式與 screener.panel_indicators 相同
+        ticks：{symbol: (price, volume)}，盤中即時報價當成今天的 K 棒試算（不寫回狀態）
+        """
+        symbols = list(symbols) if symbols is not None else list(self.symbols)
+        self._add_symbols(symbols)  # 沒有狀態的標的 bars = 0，指標都是 NaN
+        rows = np.array([self._row[s] for s in symbols], dtype=np.int64)
+        b = self.bars[rows]
+        values = {
+            'close': self._lag(self.closes, rows, 1),
+            'bars': b.copy(),
+            'base_close': np.where(b >= MOMENTUM_WINDOW, self._lag(self.closes, rows, MOMENTUM_WINDOW), np.nan),
+        }
+        for name in ('ma_sum', 'vol_sum', 'gain_sum', 'loss_sum', 'wilder_gain', 'wilder_loss'):
+            values[name] = getattr(self, name)[rows].copy()
+
+        if ticks:
+            idx = np.array([i for i, s in enumerate(symbols) if s in ticks and b[i] > 0], dtype=np.int64)
+            if len(idx):
+                price = np.array([ticks[symbols[i]][0] for i in idx], dtype=float)
+                volume = np.array([ticks[symbols[i]][1] for i in idx], dtype=float)
+                new = self._advance(rows[idx], price, volume)
+                for name, v in new.items():
+                    values[name][idx] = v
+
+        return _indicators_from_sums(symbols, values, self.ma_periods)
+
+    # === 存檔 ===
+
+    def save(self, path: str = None):
+        path = path or default_state_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, symbols=np.array(self.symbols, dtype=str), ma_periods=np.array(self.ma_periods),
+                 **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, rules: dict, path: str = None) -> 'IndicatorState':
+        """讀取狀態；檔案不存在或均線週期變了就回傳空狀態（下次 update 會從完整歷史重建）"""
+        path = path or default_state_path()
+        state = cls(_ma_periods(rules))
+        if not os.path.exists(path):
+            return state
+        with np.load(path, allow_pickle=False) as f:
+            if tuple(int(p) for p in f['ma_periods']) != state.ma_periods or f['closes'].shape[1] != state.window:
+                print("ℹ️ 均線參數已變更，指標狀態將重建")
+                return state
+            state.symbols = [str(s) for s in f['symbols']]
+            state._row = {s: i for i, s in enumerate(state.symbols)}
+            for name in cls.ARRAYS:
+                setattr(state, name, f[name].copy())
+        return state
+
+
+def _series(data: dict, sym: str, since=None, cutoff=None) -> tuple:
+    """
+    (日期, 收盤價, 成交量) 陣列，只取 since（含）之後、cutoff 之前的部分；成交量缺值視為 0
+    每日更新時只切最後幾根，不會複製整段歷史
+    """
+    if isinstance(data, PriceMatrix):
+        j = data._col[sym]
+        lo = np.searchsorted(data.dates, since) if since is not None else 0
+        hi = np.searchsorted(data.dates, cutoff) if cutoff is not None else len(data.dates)
+        rows = lo + np.flatnonzero(data.valid[lo:hi, j])
+        dates = data.dates[rows]
+        close = data.field('Close')[rows, j].astype(float)
+        volume = data.field('Volume')[rows, j].astype(float)
+        return dates, close, volume
+
+    item = data[sym]
+    history = item['history'] if isinstance(item, dict) else item
+    dates = history.index.to_numpy(dtype='datetime64[ns]')
+    lo = np.searchsorted(dates, since) if since is not None else 0
+    hi = np.searchsorted(dates, cutoff) if cutoff is not None else len(dates)
+    close = history['Close'].to_numpy(dtype=float)[lo:hi]
+    volume = history['Volume'].to_numpy(dtype=float)[lo:hi] if 'Volume' in history else np.zeros(hi - lo)
+    return dates[lo:hi], close, np.nan_to_num(volume)
+
+
+def _indicators_from_sums(symbols: list, v: dict, ma_periods: tuple) -> dict:
+    b = v['bars']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        price = np.where(b > 0, v['close'], np.nan)
+        ma = {p: np.where(b >= p, v['ma_sum'][:, i] / p, np.nan) for i, p in enumerate(ma_periods)}
+        gain, loss = np.maximum(v['gain_sum'], 0), np.maximum(v['loss_sum'], 0)
+        rsi = np.where(b >= RSI_PERIOD + 1, 100 - (100 / (1 + gain / loss)), np.nan)
+        rsi_wilder = np.where(b >= RSI_PERIOD, 100 - (100 / (1 + v['wilder_gain'] / v['wilder_loss'])), np.nan)
+        avg_vol = np.where(b > 0, v['vol_sum'] / np.minimum(b, VOLUME_WINDOW), np.nan)
+        momentum = (price / v['base_close'] - 1) * 100
+    return {
+        'symbols': list(symbols),
+        'bars': b,
+        'price': price,
+        'ma': ma,
+        'rsi': rsi,
+        'rsi_wilder': rsi_wilder,
+        'avg_volume_20d': avg_vol,
+        'momentum_20d': momentum,
+    }
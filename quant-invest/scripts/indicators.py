@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+indicators.py — 技術指標（screener / backtest / report 共用）
+同一次執行中，同一檔同一序列同一組參數只計算一次（傳入 symbol 才會快取）。
+快取以序列內容為 key（還原權值後整段價格改變也不會讀到舊結果），最多保留 CACHE_SIZE 筆（LRU）。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+CACHE_SIZE = 4096  # 約 1000 檔 × 4 種指標
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _content_key(series: pd.Series) -> tuple:
+    """(長度, 第一天, 最後一天, 數值的 blake2b)：比指標本身便宜得多，內容一變 key 就不同"""
+    if not len(series):
+        return (0,)
+    values = np.ascontiguousarray(series.to_numpy(dtype=float))
+    return (len(series), series.index[0], series.index[-1],
+            hashlib.blake2b(values.tobytes(), digest_size=16).digest())
+
+
+def _memo(symbol, series: pd.Series, name: str, params: tuple, compute):
+    """以 (symbol, 序列名稱, 指標, 參數, 序列內容) 為 key 快取結果"""
+    if symbol is None:
+        return compute()
+    key = (symbol, series.name, name, params, _content_key(series))
+    with _lock:
+        if key in _cache:
+            _stats['hits'] += 1
+            _cache.move_to_end(key)
+            return _cache[key]
+        _stats['misses'] += 1
+    value = compute()
+    with _lock:
+        _cache[key] = value
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    total = stats['hits'] + stats['misses']
+    return {**stats, 'hit_ratio': round(stats['hits'] / total, 3) if total else 0}
+
+
+def compute_rsi(series: pd.Series, period: int = 14, method: str = 'sma', symbol: str = None) -> pd.Series:
+    """
+    計算 RSI
+    method='sma'：漲跌幅簡單平均（原本的算法，選股規則以此校準）
+    method='wilder'：Wilder 平滑（alpha = 1/period）
+    """
+    def compute():
+        delta = series.diff()
+        gain = delta.where(delta > 0, 0)
+        loss = -delta.where(delta < 0, 0)
+        if method == 'wilder':
+            avg_gain = gain.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+            avg_loss = loss.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+        else:
+            avg_gain = gain.rolling(window=period).mean()
+            avg_loss = loss.rolling(window=period).mean()
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+    return _memo(symbol, series, 'rsi', (period, method), compute)
+
+
+def compute_ma(series: pd.Series, period: int, kind: str = 'sma', symbol: str = None) -> pd.Series:
+    """計算移動平均（kind='sma' 或 'ema'）"""
+    def compute():
+        if kind == 'ema':
+            return series.ewm(span=period, adjust=False, min_periods=period).mean()
+        return series.rolling(window=period).mean()
+    return _memo(symbol, series, 'ma', (period, kind), compute)
+
+
+def compute_momentum(series: pd.Series, window: int = 20, symbol: str = None) -> pd.Series:
+    """window 根 K 棒內的漲跌幅（今天 / window 窗口第一天 - 1），與 screener 的 20 日動能相同"""
+    def compute():
+        return series / series.shift(window - 1) - 1
+    return _memo(symbol, series, 'momentum', (window,), compute)
+
+
+# === 多參數一次算 ===
+
+def compute_mas(series: pd.Series, periods: list, kind: str = 'sma', symbol: str = None) -> pd.DataFrame:
+    """
+    一次計算多個週期的移動平均，回傳 columns = periods 的 DataFrame
+    SMA 用一次 cumsum 搭配廣播相減，不必每個週期各跑一次 rolling
+    """
+    periods = tuple(int(p) for p in periods)
+
+    def compute():
+        if kind == 'ema':
+            return pd.DataFrame({p: compute_ma(series, p, 'ema') for p in periods}, index=series.index)
+        values = series.to_numpy(dtype=float)
+        n = len(values)
+        csum = np.concatenate([[0.0], np.cumsum(values)])
+        p = np.asarray(periods)
+        end = np.arange(1, n + 1)[:, None]
+        start = end - p[None, :]
+        out = (csum[end] - csum[np.clip(start, 0, None)]) / p
+        out[start < 0] = np.nan
+        return pd.DataFrame(out, index=series.index, columns=list(periods))
+    return _memo(symbol, series, 'mas', (periods, kind), compute)
+
+
+def compute_rsis(series: pd.Series, periods: list, method: str = 'sma', symbol: str = None) -> pd.DataFrame:
+    """一次計算多個週期的 RSI，回傳 columns = periods 的 DataFrame"""
+    periods = tuple(int(p) for p in periods)
+
+    def compute():
+        delta = series.diff()
+        gain = delta.where(delta > 0, 0)
+        loss = -delta.where(delta < 0, 0)
+        if method == 'wilder':
+            return pd.DataFrame({p: compute_rsi(series, p, 'wilder') for p in periods}, index=series.index)
+        avg_gain = compute_mas(gain, periods)
+        avg_loss = compute_mas(loss, periods)
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+    return _memo(symbol, series, 'rsis', (periods, method), compute)
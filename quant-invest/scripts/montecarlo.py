@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+montecarlo.py — 回測結果的穩健度分析
+一條歷史路徑只給一個 Sharpe / 最大回撤；這裡把同一份結果重抽幾千次，看數字有多「運氣」：
+- 交易重抽：交易損益有放回地抽樣、重新排列 → 總報酬與最大回撤的區間
+- 區塊 bootstrap：日報酬切成固定長度的區塊（保留波動聚集）循環抽樣 → 總報酬、最大回撤、Sharpe 的區間
+
+所有模擬路徑一起向量化，Python 迴圈只跑標的與區塊數（見 bootstrap_returns）。
+
+用法:
+    python3 montecarlo.py [--paths 10000] [--symbols 37]   # 合成資料計時
+"""
+
+import argparse
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+METRICS = ('total_return', 'max_drawdown', 'sharpe_ratio')
+PERCENTILES = (5, 50, 95)
+
+
+def _rng(seed: int, symbol: str) -> np.random.Generator:
+    """每檔各自的亂數流：同一個 seed、同一檔，不論順序或挑了哪些標的，結果都一樣"""
+    return np.random.default_rng([seed, zlib.crc32(symbol.encode())])
+
+
+def _summarize(samples: dict, scale: dict) -> dict:
+    """{metric: 每條路徑的值} → {metric: {'p5', 'p50', 'p95'}}（單位與 backtest 的 metrics 相同）"""
+    out = {}
+    for name, values in samples.items():
+        q = np.percentile(values, PERCENTILES)
+        out[name] = {f'p{p}': round(float(v) * scale.get(name, 1), 2) for p, v in zip(PERCENTILES, q)}
+    return out
+
+
+def _block_stats(returns: np.ndarray, log_r: np.ndarray, length: int) -> dict:
+    """
+    每個起點、長 length 的（循環）區塊摘要，對數權益以區塊起點為 0：
+    S 區塊終點、M 最高點（含起點）、m 最低點、D 區塊內最大回撤、r1 / r2 日報酬和與平方和
+    """
+    n = len(returns)
+    idx = (np.arange(n)[:, None] + np.arange(length)) % n
+    cum = np.cumsum(log_r[idx], axis=1)
+    run_max = np.maximum.accumulate(np.maximum(cum, 0), axis=1)
+    raw = returns[idx]
+    return {'S': cum[:, -1], 'M': run_max[:, -1], 'm': cum.min(axis=1),
+            'D': (cum - run_max).min(axis=1), 'r1': raw.sum(axis=1), 'r2': (raw * raw).sum(axis=1)}
+
+
+def bootstrap_returns(returns: np.ndarray, n_paths: int = 10000, block: int = 20,
+                      rng: np.random.Generator = None) -> dict:
+    """
+    循環區塊 bootstrap：每條路徑由隨機起點的 block 天連續報酬拼成，長度與原序列相同
+    回傳每條路徑的 total_return / max_drawdown / sharpe_ratio（比例，非百分比）
+
+    不展開成 (路徑 × 天) 矩陣：先對每個可能的起點算好區塊摘要，每條路徑只把各區塊的摘要串起來，
+    成本是 路徑數 × 區塊數。對數權益在水位 L、前高 P 接上區塊 b 時，
+    區塊內的最大回撤是 min(D_b, L + m_b - P)，之後 P = max(P, L + M_b)、L += S_b。
+    """
+    rng = rng or np.random.default_rng()
+    returns = np.asarray(returns, dtype=float)
+    n = len(returns)
+    block = max(1, min(block, n))
+    n_blocks = -(-n // block)
+    log_r = np.log1p(returns)
+    full = _block_stats(returns, log_r, block)
+    last = _block_stats(returns, log_r, n - (n_blocks - 1) * block)
+
+    starts = rng.integers(0, n, size=(n_blocks, n_paths))
+    level = np.zeros(n_paths)
+    peak = np.zeros(n_paths)
+    drawdown = np.zeros(n_paths)
+    r1 = np.zeros(n_paths)
+    r2 = np.zeros(n_paths)
+    for b in range(n_blocks):
+        st = full if b < n_blocks - 1 else last
+        s = starts[b]
+        drawdown = np.minimum(drawdown, np.minimum(st['D'][s], level + st['m'][s] - peak))
+        peak = np.maximum(peak, level + st['M'][s])
+        level += st['S'][s]
+        r1 += st['r1'][s]
+        r2 += st['r2'][s]
+
+    # 與 backtest._build_result 同一算法：日報酬、樣本標準差、無風險利率 2%
+    mean = r1 / n
+    std = np.sqrt(np.maximum(r2 - n * mean * mean, 0) / (n - 1)) if n > 1 else np.zeros(n_paths)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = (mean - 0.02 / 252) / std * np.sqrt(252)
+    return {'total_return': np.expm1(level), 'max_drawdown': np.expm1(drawdown),
+            'sharpe_ratio': np.where(std > 0, sharpe, 0)}
+
+
+def resample_trades(pnl: np.ndarray, capital: float, n_paths: int = 10000,
+                    rng: np.random.Generator = None) -> dict:
+    """
+    交易損益有放回地重抽（筆數不變）：總報酬看「換一批交易」的分布，最大回撤同時反映交易順序
+    回傳每條路徑的 total_return / max_drawdown（比例）
+    """
+    rng = rng or np.random.default_rng()
+    pnl = np.asarray(pnl, dtype=float)
+    draws = pnl[rng.integers(0, len(pnl), size=(n_paths, len(pnl)))]
+    equity = capital + np.concatenate([np.zeros((n_paths, 1)), np.cumsum(draws, axis=1)], axis=1)
+    return {'total_return': equity[:, -1] / capital - 1,
+            'max_drawdown': (equity / np.maximum.accumulate(equity, axis=1) - 1).min(axis=1)}
+
+
+def confidence_intervals(result: dict, n_paths: int = 10000, block: int = 20, seed: int = 42) -> dict:
+    """
+    對一份 backtest 結果（backtest_stock / backtest_portfolio 的回傳值）做兩種重抽
+    回傳 {'paths', 'block', 'bootstrap': {metric: {p5, p50, p95}}, 'trades': {...}}；
+    沒有交易（權益曲線是一條直線）回傳 None
+    """
+    if 'equity_curve' not in result or not result['trades']:
+        return None
+    rng = _rng(seed, result['symbol'])
+    equity = result['equity_curve']['equity'].to_numpy(dtype=float)
+    returns = equity[1:] / equity[:-1] - 1
+    if len(returns) < 2:
+        return None
+
+    scale = {'total_return': 100, 'max_drawdown': 100}
+    out = {'paths': n_paths, 'block': block,
+           'bootstrap': _summarize(bootstrap_returns(returns, n_paths, block, rng), scale)}
+    pnl = [t['pnl'] for t in result['trades']]
+    if len(pnl) >= 2:
+        capital = result['metrics']['initial_capital']
+        out['trades'] = _summarize(resample_trades(pnl, capital, n_paths, rng), scale)
+    return out
+
+
+def run_monte_carlo(results: dict, rules: dict = None) -> dict:
+    """{symbol: backtest 結果} → {symbol: 區間}；參數取自 rules['backtest']['monte_carlo']"""
+    config = (rules or {}).get('backtest', {}).get('monte_carlo', {})
+    n_paths = config.get('paths', 10000)
+    block = config.get('block_days', 20)
+    seed = config.get('seed', 42)
+    return {sym: confidence_intervals(result, n_paths, block, seed) for sym, result in results.items()}
+
+
+def format_intervals(ci: dict) -> str:
+    """週報用的 Markdown 區塊"""
+    if not ci:
+        return ''
+    b = ci['bootstrap']
+    text = (f"**穩健度（區塊 bootstrap {ci['paths']:,} 條路徑，{ci['block']} 日區塊；5% / 中位數 / 95%）：**\n"
+            f"- 總報酬率：{b['total_return']['p5']:+.1f}% / {b['total_return']['p50']:+.1f}% / "
+            f"{b['total_return']['p95']:+.1f}%\n"
+            f"- 最大回撤：{b['max_drawdown']['p5']:.1f}% / {b['max_drawdown']['p50']:.1f}% / "
+            f"{b['max_drawdown']['p95']:.1f}%\n"
+            f"- Sharpe Ratio：{b['sharpe_ratio']['p5']:.2f} / {b['sharpe_ratio']['p50']:.2f} / "
+            f"{b['sharpe_ratio']['p95']:.2f}\n")
+    if 'trades' in ci:
+        t = ci['trades']
+        text += (f"- 交易重抽：總報酬 {t['total_return']['p5']:+.1f}% ~ {t['total_return']['p95']:+.1f}%，"
+                 f"最大回撤 {t['max_drawdown']['p5']:.1f}% ~ {t['max_drawdown']['p95']:.1f}%\n")
+    return text + "\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回測結果的 Monte Carlo 穩健度分析（合成資料計時）")
+    parser.add_argument("--paths", type=int, default=10000, help="每檔模擬路徑數")
+    parser.add_argument("--symbols", type=int, default=37, help="合成標的數")
+    args = parser.parse_args()
+
+    from backtest import load_rules, backtest_stock_vectorized, synthetic_history
+    rules = load_rules()
+    results = {f'SYN{i}': backtest_stock_vectorized(f'SYN{i}', synthetic_history(seed=i), rules)
+               for i in range(args.symbols)}
+    rules['backtest'] = {**rules.get('backtest', {}),
+                         'monte_carlo': {**rules.get('backtest', {}).get('monte_carlo', {}), 'paths': args.paths}}
+
+    start = time.perf_counter()
+    intervals = run_monte_carlo(results, rules)
+    elapsed = time.perf_counter() - start
+    print(f"🎲 {args.symbols} 檔 × {args.paths:,} 條路徑：{elapsed:.2f}s")
+    sym = next(s for s, ci in intervals.items() if ci)
+    print(f"\n📊 {sym}（實際 {results[sym]['metrics']['total_return']:+.1f}% / "
+          f"MDD {results[sym]['metrics']['max_drawdown']:.1f}% / Sharpe {results[sym]['metrics']['sharpe_ratio']:.2f}）")
+    print(format_intervals(intervals[sym]))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+perf.py — 執行階段的效能紀錄
+每個階段的 wall / CPU 時間、抓取延遲與快取命中率，可選擇性開 cProfile；
+結果寫成 JSON，跟週報 markdown 放在一起，方便長期追蹤哪一步最慢。
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import data_fetch
+import indicators
+
+
+class RunProfiler:
+    """
+    用法：with prof.stage('fetch'): ...，或在線性流程中 prof.begin('fetch') 切換階段；
+    最後 prof.write(path)
+    """
+
+    def __init__(self, profile: bool = False, top: int = 30):
+        self.stages = []
+        self.started_at = datetime.now()
+        self.top = top
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._current = None
+        self._profiler = cProfile.Profile() if profile else None
+        data_fetch.reset_fetch_stats()
+        indicators.clear_cache()
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - wall0, time.process_time() - cpu0)
+
+    def record(self, name: str, wall_s: float, cpu_s: float, **extra):
+        """直接記一筆階段耗時（平行執行的階段由執行器自己計時；extra 例如 status='cached'）"""
+        self.stages.append({'stage': name, 'wall_s': round(wall_s, 4), 'cpu_s': round(cpu_s, 4), **extra})
+
+    def begin(self, name: str):
+        """結束目前階段（如果有）並開始新階段"""
+        self.end()
+        self._current = (name, time.perf_counter(), time.process_time())
+
+    def end(self):
+        if self._current is None:
+            return
+        name, wall0, cpu0 = self._current
+        self.record(name, time.perf_counter() - wall0, time.process_time() - cpu0)
+        self._current = None
+
+    def _profile_summary(self, prof_path: str) -> list:
+        self._profiler.disable()
+        self._profiler.dump_stats(prof_path)
+        stats = pstats.Stats(self._profiler).sort_stats('cumulative')
+        rows = []
+        for func in stats.fcn_list[:self.top]:
+            cc, nc, tt, ct, _ = stats.stats[func]
+            filename, line, name = func
+            rows.append({
+                'function': f"{os.path.basename(filename)}:{line}({name})",
+                'ncalls': nc,
+                'tottime_s': round(tt, 4),
+                'cumtime_s': round(ct, 4),
+            })
+        return rows
+
+    def finish(self, prof_path: str = None) -> dict:
+        self.end()
+        total_wall = time.perf_counter() - self._wall0
+        fetch = data_fetch.fetch_stats()
+        latencies = [v.get('history_s', 0) + v.get('info_s', 0) for v in fetch['latency'].values()]
+        result = {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'total_wall_s': round(total_wall, 4),
+            'total_cpu_s': round(time.process_time() - self._cpu0, 4),
+            'stages': [{**s, 'share': round(s['wall_s'] / total_wall, 3) if total_wall else 0}
+                       for s in self.stages],
+            'fetch': {
+                'history': fetch['history'],
+                'info': fetch['info'],
+                'network_symbols': len(fetch['latency']),
+                'latency_max_s': round(max(latencies), 4) if latencies else 0,
+                'latency_sum_s': round(sum(latencies), 4),
+                'batches': fetch['batches'],
+                'per_symbol': fetch['latency'],
+            },
+            'indicator_cache': indicators.cache_stats(),
+        }
+        if self._profiler is not None and prof_path:
+            result['profile'] = {'file': os.path.basename(prof_path),
+                                 'top_cumulative': self._profile_summary(prof_path)}
+        return result
+
+    def write(self, markdown_path: str) -> str:
+        """寫到 markdown 旁邊：2026-W42.md → 2026-W42.perf.json（開 cProfile 時另有 .prof）"""
+        base = os.path.splitext(markdown_path)[0]
+        result = self.finish(base + '.prof' if self._profiler is not None else None)
+        path = base + '.perf.json'
+        with open(path, 'w') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        return path
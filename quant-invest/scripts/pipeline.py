@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+pipeline.py — 小型 DAG 執行器（週報用）
+每個階段宣告依賴；依賴都完成的階段就丟進 thread pool，互不相依的階段（例如大盤與選股）同時跑。
+
+快取：每個階段有一個 digest
+- source 階段（always=True，例如抓資料）：一定執行，digest 由輸出內容算出（價格庫版本）
+- 其他階段：digest = hash(階段名稱, 額外輸入如規則 hash, 程式碼版本, 上游 digest)；
+  與上次執行存下的 digest 相同就直接讀上次的結果，不執行
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def digest(*parts) -> str:
+    """任意可 JSON 化（或 str() 後穩定）的值 → sha1"""
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str, ensure_ascii=False).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """DataFrame 內容（含 index）的 sha1"""
+    if df is None or df.empty:
+        return digest('empty')
+    return digest(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes(), list(df.columns))
+
+
+def code_version() -> str:
+    """scripts/*.py 的內容 hash：程式改了，舊的快取就不再適用"""
+    h = hashlib.sha1()
+    for name in sorted(os.listdir(SCRIPTS_DIR)):
+        if name.endswith('.py'):
+            with open(os.path.join(SCRIPTS_DIR, name), 'rb') as f:
+                h.update(name.encode() + b'\0' + f.read())
+    return h.hexdigest()
+
+
+class Pipeline:
+    """
+    用法：
+        pipe = Pipeline(cache_dir, prof)
+        pipe.add('fetch', fetch_fn, always=True, version=lambda m: m.digest())
+        pipe.add('screen', lambda fetch: run_screening(fetch), deps=('fetch',), inputs=rules_hash)
+        results = pipe.run()
+    fn 以依賴的階段名稱為關鍵字參數接收上游結果
+    workers=0：所有階段依序在呼叫端的 thread 執行（cProfile 只看得到目前 thread，開 --profile 時用）
+    """
+
+    def __init__(self, cache_dir: str = None, prof=None, workers: int = 4):
+        self.cache_dir = cache_dir
+        self.prof = prof
+        self.workers = workers
+        self.stages = {}
+        self.digests = {}
+        self.status = {}  # name → 'run' / 'cached'
+        self._code = code_version() if cache_dir else None
+
+    def add(self, name: str, fn, deps: tuple = (), inputs=None, always: bool = False,
+            version=None, cache: bool = True):
+        """
+        inputs：除了上游結果以外會影響輸出的東西（例如規則 hash）
+        always / version：source 階段，一定執行；version(輸出) 當作 digest 傳給下游
+        cache=False：一定執行、也不寫快取（例如輸出檔案的 render）
+        """
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"{name} 依賴的階段 {dep} 尚未加入")
+        self.stages[name] = {'fn': fn, 'deps': tuple(deps), 'inputs': inputs, 'always': always,
+                             'version': version, 'cache': cache}
+
+    def _cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}.pkl")
+
+    def _load(self, name: str, key: str):
+        """快取命中回傳 (True, 值)，否則 (False, None)"""
+        if not self.cache_dir or not os.path.exists(self._cache_path(name)):
+            return False, None
+        try:
+            with open(self._cache_path(name), 'rb') as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return False, None
+        if cached.get('digest') != key:
+            return False, None
+        return True, cached['value']
+
+    def _save(self, name: str, key: str, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self._cache_path(name) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'digest': key, 'value': value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._cache_path(name))
+
+    def _execute(self, name: str, results: dict):
+        stage = self.stages[name]
+        kwargs = {dep: results[dep] for dep in stage['deps']}
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+
+        if stage['always']:
+            value = stage['fn'](**kwargs)
+            key = stage['version'](value) if stage['version'] else digest(name, time.time())
+            status = 'run'
+        else:
+            key = digest(name, stage['inputs'], self._code, [self.digests[d] for d in stage['deps']])
+            hit, value = self._load(name, key) if stage['cache'] else (False, None)
+            if hit:
+                status = 'cached'
+            else:
+                value = stage['fn'](**kwargs)
+                if stage['cache'] and self.cache_dir:
+                    self._save(name, key, value)
+                status = 'run'
+
+        if self.prof is not None:
+            self.prof.record(name, time.perf_counter() - wall0, time.thread_time() - cpu0, status=status)
+        return name, key, status, value
+
+    def run(self) -> dict:
+        """依 DAG 執行所有階段，回傳 {階段名稱: 結果}"""
+        results = {}
+        if self.workers == 0:
+            # self.stages 依加入順序排列，而依賴一定先加入（見 add），照順序跑就滿足 DAG
+            for name in self.stages:
+                name, key, status, value = self._execute(name, results)
+                results[name] = value
+                self.digests[name] = key
+                self.status[name] = status
+            return results
+        pending = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or running:
+                ready = [n for n, s in pending.items() if all(d in results for d in s['deps'])]
+                for name in ready:
+                    del pending[name]
+                    running[pool.submit(self._execute, name, results)] = name
+                if not running:
+                    raise RuntimeError(f"無法執行的階段（依賴未滿足）：{', '.join(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    name, key, status, value = future.result()
+                    results[name] = value
+                    self.digests[name] = key
+                    self.status[name] = status
+        return results
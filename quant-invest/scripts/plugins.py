@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+plugins.py — 回測的進場策略與出場規則外掛
+在 screening_rules.yaml 指定：
+    entry.strategy / entry.params  → 進場策略
+    exit.rules                     → 出場規則（依序判斷，先觸發者為準；參數沿用 exit 區塊）
+
+同一個外掛同時服務兩種引擎：
+- 進場：signals() 一次算出整條信號陣列；逐日引擎每根 bar 呼叫 on_bar()，預設就是讀信號陣列。
+  需要看持倉狀態的策略可以改寫 on_bar()，並設 vectorized = False（向量化引擎會自動改走逐日迴圈）。
+- 出場：hits(ctx) 只用 NumPy 運算，ctx 的值是純量時判斷單一 bar，是陣列時一次判斷整段持有期。
+
+新增外掛：繼承 Strategy / ExitRule，加上 @register_strategy / @register_exit 即可。
+"""
+
+import numpy as np
+
+from indicators import compute_rsi, compute_ma
+
+STRATEGIES = {}
+EXITS = {}
+
+DEFAULT_EXITS = ['take_profit', 'stop_loss', 'rsi_overbought', 'trailing_stop']
+
+
+def register_strategy(name: str):
+    def wrap(cls):
+        cls.name = name
+        STRATEGIES[name] = cls
+        return cls
+    return wrap
+
+
+def register_exit(name: str):
+    def wrap(cls):
+        cls.name = name
+        EXITS[name] = cls
+        return cls
+    return wrap
+
+
+# === 進場策略 ===
+
+class Strategy:
+    """進場策略基底：prepare() 算指標，signals() 算整條進場信號"""
+    name = None
+    vectorized = True  # False：on_bar 依賴持倉狀態，只能逐日推進
+
+    def __init__(self, params: dict):
+        self.params = params
+
+    @property
+    def warmup(self) -> int:
+        """前幾根 bar 不交易（權益曲線也從這裡開始）"""
+        return 60
+
+    def prepare(self, close, symbol: str = None) -> dict:
+        """回傳 {指標名稱: np.ndarray}，至少要有 'close'"""
+        return {'close': close.to_numpy(dtype=float)}
+
+    def signals(self, ind: dict) -> np.ndarray:
+        raise NotImplementedError
+
+    def on_bar(self, ind: dict, signal: np.ndarray, i: int) -> bool:
+        """逐日引擎：第 i 根 bar、目前空手時是否進場"""
+        return bool(signal[i])
+
+    def reason(self, ind: dict, i: int) -> str:
+        return self.name
+
+
+@register_strategy('rsi_rebound')
+class RsiRebound(Strategy):
+    """RSI 從超賣區回升（上穿 threshold）且在均線之上"""
+
+    @property
+    def warmup(self) -> int:
+        return self.params.get('ma_period', 60)
+
+    def prepare(self, close, symbol: str = None) -> dict:
+        rsi = compute_rsi(close, self.params.get('rsi_period', 14), symbol=symbol).to_numpy(dtype=float)
+        prev_rsi = np.empty(len(rsi))
+        prev_rsi[:1] = 50
+        prev_rsi[1:] = rsi[:-1]
+        return {
+            'close': close.to_numpy(dtype=float),
+            'rsi': rsi,
+            'prev_rsi': prev_rsi,
+            'ma': compute_ma(close, self.params.get('ma_period', 60), symbol=symbol).to_numpy(dtype=float),
+        }
+
+    def signals(self, ind: dict) -> np.ndarray:
+        threshold = self.params.get('threshold', 35)
+        return (ind['prev_rsi'] < threshold) & (ind['rsi'] >= threshold) & (ind['close'] > ind['ma'])
+
+    def reason(self, ind: dict, i: int) -> str:
+        return (f"RSI 回升 ({ind['prev_rsi'][i]:.0f}→{ind['rsi'][i]:.0f}), "
+                f"在 MA{self.params.get('ma_period', 60)} 之上")
+
+
+@register_strategy('ma_breakout')
+class MaBreakout(Strategy):
+    """收盤價由下往上穿越均線"""
+
+    @property
+    def warmup(self) -> int:
+        return self.params.get('ma_period', 60)
+
+    def prepare(self, close, symbol: str = None) -> dict:
+        price = close.to_numpy(dtype=float)
+        return {'close': price,
+                'ma': compute_ma(close, self.params.get('ma_period', 60), symbol=symbol).to_numpy(dtype=float)}
+
+    def signals(self, ind: dict) -> np.ndarray:
+        above = ind['close'] > ind['ma']
+        return above & np.concatenate([[False], ~above[:-1]])
+
+    def reason(self, ind: dict, i: int) -> str:
+        return f"站上 MA{self.params.get('ma_period', 60)} ({ind['close'][i]:.1f} > {ind['ma'][i]:.1f})"
+
+
+# === 出場規則 ===
+# ctx 欄位：price / entry_price / unrealized（未實現報酬）/ trailing（距持有期高點）/ held（持有幾根 bar）
+# 以及策略指標（例如 rsi）在同一根 bar 的值
+
+class ExitRule:
+    name = None
+
+    def __init__(self, exit_rules: dict):
+        self.exit_rules = exit_rules
+
+    def prepare(self, close, ind: dict, symbol: str = None):
+        """需要策略沒算到的指標時，在這裡補進 ind"""
+
+    def hits(self, ctx: dict):
+        raise NotImplementedError
+
+    def reason(self, ctx: dict) -> str:
+        return self.name
+
+
+@register_exit('take_profit')
+class TakeProfit(ExitRule):
+    def hits(self, ctx):
+        return ctx['unrealized'] >= self.exit_rules.get('take_profit', 0.15)
+
+    def reason(self, ctx):
+        return f"停利 ({ctx['unrealized']*100:.1f}%)"
+
+
+@register_exit('stop_loss')
+class StopLoss(ExitRule):
+    def hits(self, ctx):
+        return ctx['unrealized'] <= self.exit_rules.get('stop_loss', -0.08)
+
+    def reason(self, ctx):
+        return f"停損 ({ctx['unrealized']*100:.1f}%)"
+
+
+@register_exit('rsi_overbought')
+class RsiOverbought(ExitRule):
+    def prepare(self, close, ind, symbol=None):
+        if 'rsi' not in ind:
+            ind['rsi'] = compute_rsi(close, 14, symbol=symbol).to_numpy(dtype=float)
+
+    def hits(self, ctx):
+        return ctx['rsi'] > self.exit_rules.get('rsi_overbought', 75)
+
+    def reason(self, ctx):
+        return f"RSI 超買 ({ctx['rsi']:.0f})"
+
+
+@register_exit('trailing_stop')
+class TrailingStop(ExitRule):
+    def hits(self, ctx):
+        return ctx['trailing'] <= -self.exit_rules.get('trailing_stop', 0.10)
+
+    def reason(self, ctx):
+        return f"追蹤停損 (從高點回落 {ctx['trailing']*100:.1f}%)"
+
+
+@register_exit('time_stop')
+class TimeStop(ExitRule):
+    """持有超過 max_holding_bars 根 bar 出場"""
+
+    def hits(self, ctx):
+        return ctx['held'] >= self.exit_rules.get('max_holding_bars', 60)
+
+    def reason(self, ctx):
+        return f"持有期滿 ({int(ctx['held'])} 根 K 棒)"
+
+
+def load_plugins(rules: dict) -> tuple:
+    """依規則建立 (strategy, [exit rules])；沒設定時等同原本寫死的進出場規則"""
+    entry = rules.get('entry', {})
+    exit_rules = rules.get('exit', {})
+    name = entry.get('strategy', 'rsi_rebound')
+    if name not in STRATEGIES:
+        raise ValueError(f"未知的進場策略：{name}（可用：{', '.join(STRATEGIES)}）")
+    exits = []
+    for exit_name in exit_rules.get('rules', DEFAULT_EXITS):
+        if exit_name not in EXITS:
+            raise ValueError(f"未知的出場規則：{exit_name}（可用：{', '.join(EXITS)}）")
+        exits.append(EXITS[exit_name](exit_rules))
+    return STRATEGIES[name](entry.get('params') or {}), exits
+
+
+def prepare_indicators(strategy: Strategy, exits: list, close, symbol: str = None) -> dict:
+    ind = strategy.prepare(close, symbol)
+    for rule in exits:
+        rule.prepare(close, ind, symbol)
+    return ind
+
+
+def first_exit(exits: list, ctx: dict):
+    """
+    整段持有期（ctx 的值是陣列）找出第一個觸發出場的位置，回傳 (k, 出場理由)；未觸發回傳 (None, None)
+    同一根 bar 多條規則同時觸發時，以 exits 的順序為準
+    """
+    hits = [np.asarray(rule.hits(ctx)) for rule in exits]
+    any_hit = np.logical_or.reduce(hits) if hits else np.zeros(0, dtype=bool)
+    if not any_hit.any():
+        return None, None
+    k = int(np.argmax(any_hit))
+    at_k = {key: value[k] if np.ndim(value) else value for key, value in ctx.items()}
+    for rule, hit in zip(exits, hits):
+        if hit[k]:
+            return k, rule.reason(at_k)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+portfolio.py — 組合回測（多檔共用一個資金池）
+所有標的對齊到同一條日期軸，在 (日期 × 標的) 矩陣上逐日推進；
+每一天的進出場判斷都是整列向量運算，所以 37 檔和 1 檔的時間差不多。
+進出場規則與單檔回測相同，來自 plugins（entry.strategy / entry.params、exit.rules）。
+"""
+
+import numpy as np
+import pandas as pd
+
+from backtest import Trade, _build_result
+from plugins import load_plugins, prepare_indicators
+from price_matrix import PriceMatrix
+
+
+def align_panel(data: dict, field: str = 'Close') -> pd.DataFrame:
+    """把 {sym: {'history': df}}、{sym: df} 或 PriceMatrix 對齊成 (日期 × 標的) 矩陣"""
+    if isinstance(data, PriceMatrix):
+        return data.frame(field)
+    columns = {}
+    for sym, item in data.items():
+        history = item['history'] if isinstance(item, dict) else item
+        if history is not None and not history.empty:
+            columns[sym] = history[field]
+    if not columns:
+        return pd.DataFrame()
+    return pd.DataFrame(columns).sort_index()
+
+
+def _panel_indicators(strategy, exits: list, histories: dict, symbols: list, dates: pd.Index) -> tuple:
+    """
+    指標與進場信號各自在原始序列上計算（停牌日不會污染 rolling window；與單檔回測共用快取），
+    再對齊成 {指標名稱: (日期 × 標的) 矩陣} 與進場信號矩陣
+    """
+    panel = {}
+    signal = np.zeros((len(dates), len(symbols)), dtype=bool)
+    for j, sym in enumerate(symbols):
+        close = histories[sym]['Close']
+        rows = dates.get_indexer(close.index)
+        ind = prepare_indicators(strategy, exits, close, sym)
+        with np.errstate(invalid='ignore'):
+            signal[rows, j] = strategy.signals(ind)
+        for key, values in ind.items():
+            if key not in panel:
+                panel[key] = np.full((len(dates), len(symbols)), np.nan)
+            panel[key][rows, j] = values
+    return panel, signal
+
+
+def backtest_portfolio(data: dict, rules: dict) -> dict:
+    """
+    組合回測：所有標的共用 initial_capital，每檔部位上限 position_size。
+    data 的順序即進場優先順序（例如選股分數由高到低），同一天資金不夠時排前面的先買。
+    與單檔回測不同，手續費與證交稅會直接從現金扣除。
+    """
+    bt_config = rules.get('backtest', {})
+    strategy, exits = load_plugins(rules)
+    if not strategy.vectorized:
+        raise ValueError(f"組合回測只支援向量化進場策略，{strategy.name} 需要逐檔的持倉狀態")
+
+    commission = bt_config.get('commission_rate', 0.001425)
+    tax = bt_config.get('tax_rate', 0.003)
+    capital = bt_config.get('initial_capital', 1000000)
+    position_pct = bt_config.get('position_size', 0.20)
+    warmup = strategy.warmup
+
+    close_df = align_panel(data)
+    if len(close_df) <= warmup:
+        result = _build_result('PORTFOLIO', [], pd.DataFrame(), capital)
+        result['symbols'] = list(close_df.columns)
+        return result
+
+    symbols = list(close_df.columns)
+    dates = close_df.index
+    histories = {s: (item['history'] if isinstance(item, dict) else item) for s, item in data.items()}
+    ind, signal = _panel_indicators(strategy, exits, histories, symbols, dates)
+
+    price = close_df.to_numpy(dtype=float)
+    tradable = ~np.isnan(price)
+    mark = close_df.ffill().fillna(0).to_numpy(dtype=float)  # 估值用價格（停牌沿用前收）
+    signal &= tradable
+    signal[:warmup] = False
+
+    position_capital = capital * position_pct
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lots = np.floor(position_capital / price / 1000)
+    lot_shares = np.where(np.isfinite(lots), lots, 0).astype(np.int64) * 1000  # 台股整張
+
+    n_sym = len(symbols)
+    shares = np.zeros(n_sym, dtype=np.int64)
+    entry_price = np.zeros(n_sym)
+    peak = np.zeros(n_sym)
+    held_bars = np.zeros(n_sym, dtype=np.int64)
+    open_trades = [None] * n_sym
+    cash = float(capital)
+    trades = []
+    equity = np.empty(len(dates) - warmup)
+
+    for t in range(warmup, len(dates)):
+        p = price[t]
+
+        # 持有中 → 一次檢查所有部位的出場條件
+        held = (shares > 0) & tradable[t]
+        if held.any():
+            peak = np.where(held, np.maximum(peak, p), peak)
+            held_bars += held
+            ctx = {key: values[t] for key, values in ind.items()}
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ctx.update(price=p, entry_price=entry_price, held=held_bars,
+                           unrealized=p / entry_price - 1, trailing=p / peak - 1)
+                hits = [np.asarray(rule.hits(ctx)) for rule in exits]
+            # code = 第一條觸發的出場規則在 exits 中的位置 + 1（同一根 bar 多條同時觸發時以順序為準）
+            code = np.select(hits, np.arange(1, len(exits) + 1), 0) if exits else np.zeros(n_sym, dtype=int)
+            exiting = held & (code > 0)
+            if exiting.any():
+                proceeds = p[exiting] * shares[exiting]
+                cash += float(np.sum(proceeds * (1 - commission - tax)))
+                for j in np.flatnonzero(exiting):
+                    trade = open_trades[j]
+                    reason = exits[code[j] - 1].reason({key: value[j] for key, value in ctx.items()})
+                    trade.close(dates[t], p[j], reason, commission, tax)
+                    trades.append(trade)
+                    open_trades[j] = None
+                shares[exiting] = 0
+
+        # 未持有 → 依優先順序分配剩餘現金
+        entering = signal[t] & (shares == 0) & (lot_shares[t] > 0)
+        if entering.any():
+            idx = np.flatnonzero(entering)
+            cost = p[idx] * lot_shares[t, idx] * (1 + commission)
+            fits = np.cumsum(cost) <= cash
+            idx, cost = idx[fits], cost[fits]
+            if len(idx):
+                cash -= float(np.sum(cost))
+                shares[idx] = lot_shares[t, idx]
+                entry_price[idx] = p[idx]
+                peak[idx] = p[idx]
+                held_bars[idx] = 0
+                for j in idx:
+                    open_trades[j] = Trade(symbols[j], dates[t], p[j], int(shares[j]),
+                                           strategy.reason({key: values[:, j] for key, values in ind.items()}, t))
+
+        equity[t - warmup] = cash + float(np.dot(shares, mark[t]))
+
+    # 還有持倉 → 以最後可交易價格強制平倉
+    for j in np.flatnonzero(shares > 0):
+        last = close_df[symbols[j]].dropna()
+        trade = open_trades[j]
+        trade.close(last.index[-1], last.iloc[-1], '回測結束平倉', commission, tax)
+        cash += last.iloc[-1] * shares[j] * (1 - commission - tax)
+        trades.append(trade)
+
+    equity_df = pd.DataFrame({'equity': equity}, index=pd.Index(dates[warmup:], name='date'))
+    result = _build_result('PORTFOLIO', trades, equity_df, capital)
+    result['symbols'] = symbols
+
+    # 各檔貢獻
+    contribution = {s: {'trades': 0, 'pnl': 0.0} for s in symbols}
+    for trade in trades:
+        contribution[trade.symbol]['trades'] += 1
+        contribution[trade.symbol]['pnl'] += trade.pnl
+    result['per_symbol'] = {s: {'trades': c['trades'], 'pnl': round(c['pnl'], 2)}
+                            for s, c in contribution.items()}
+
+    return result
+
+
+def format_portfolio_report(result: dict) -> str:
+    """格式化組合回測摘要"""
+    m = result['metrics']
+    if 'note' in m:
+        return f"💼 組合回測（{len(result.get('symbols', []))} 檔）\n  ⚠️ {m['note']}\n"
+
+    return f"""💼 組合回測（{len(result['symbols'])} 檔，共用資金）
+  總報酬率：{m['total_return']:+.1f}%
+  年化報酬：{m['annual_return']:+.1f}%
+  最大回撤：{m['max_drawdown']:.1f}%
+  Sharpe Ratio：{m['sharpe_ratio']:.2f}
+  勝率：{m['win_rate']:.0f}%（{m['winning_trades']} 勝 / {m['losing_trades']} 負）
+  交易次數：{m['total_trades']}
+  最終資金：${m['final_equity']:,.0f}（本金 ${m['initial_capital']:,.0f}）"""
+
+
+if __name__ == "__main__":
+    import time
+    from backtest import load_rules, synthetic_history
+
+    rules = load_rules()
+    data = {f'SYN{i}': synthetic_history(seed=i) for i in range(37)}
+
+    start = time.perf_counter()
+    result = backtest_portfolio(data, rules)
+    elapsed = time.perf_counter() - start
+    print(format_portfolio_report(result))
+    print(f"\n⏱️ {len(data)} 檔 × {len(result['equity_curve'])} 天：{elapsed:.2f}s")
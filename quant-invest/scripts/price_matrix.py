@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+price_matrix.py — 精簡的 OHLCV 矩陣（全市場 × 多年用）
+每檔一個 yfinance DataFrame（float64 × 7 欄、各自一份 DatetimeIndex）時，記憶體大多花在
+重複的日期索引、用不到的 Dividends / Stock Splits 與 DataFrame 本身的開銷。
+
+PriceMatrix 把所有標的放在同一條日期軸上：
+- prices：float32（可指定 float64），預設 Open / High / Low / Close，沒有資料的格子是 NaN；
+  篩選與回測只用收盤價，可以只留 Close（每格 8 bytes，逐檔 DataFrame 約 64 bytes）
+- volume：無號整數，沒有資料為 0；最大值放得進 uint32 就用 uint32
+- dates：共用的日期軸
+實際存放是 (欄位 × 標的 × 日期)：同一檔的整段歷史是連續的一塊，逐檔回測只讀到自己那一段；
+field() 回傳的是 (日期 × 標的) 的轉置 view，不複製。
+
+PriceMatrix 同時是唯讀的 {symbol: {'history', 'info'}} mapping，既有程式不用改就能吃；
+history 只有在取用時才組成 DataFrame。screener.build_tail_panel 與 portfolio.align_panel
+則直接讀陣列，不經過逐檔 DataFrame。
+
+=== 磁碟格式（多進程共用）===
+save_matrix 把矩陣寫成一個目錄（prices.npy / volume.npy / valid.npy / dates.npy / meta.json），
+open_matrix 以唯讀 memory-map 開啟；map_symbols 的每個 worker 都 map 同一組檔案，
+資料由作業系統的 page cache 共用，task 只傳標的代號，不 pickle 任何價格資料。
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+PRICE_FIELDS = ('Open', 'High', 'Low', 'Close')
+CHUNK_SIZE = 200  # fetch_matrix 每次轉換的檔數：同時存在的 DataFrame 不超過這麼多
+MATRIX_FILES = ('prices', 'volume', 'valid', 'dates')
+
+
+class _Entry(dict):
+    """data[sym] 的相容介面：'info' 直接給，'history' 用到時才組 DataFrame"""
+
+    def __init__(self, matrix: 'PriceMatrix', symbol: str):
+        super().__init__(info=matrix.info.get(symbol, {}))
+        self._matrix = matrix
+        self._symbol = symbol
+
+    def __missing__(self, key):
+        if key != 'history':
+            raise KeyError(key)
+        return self._matrix.history(self._symbol)
+
+
+class PriceMatrix(Mapping):
+    """所有標的共用一條日期軸的 OHLCV 陣列"""
+
+    def __init__(self, dates: np.ndarray, symbols: list, prices: np.ndarray, volume: np.ndarray,
+                 info: dict = None, price_fields: tuple = PRICE_FIELDS, valid: np.ndarray = None,
+                 path: str = None):
+        """prices: (欄位 × 標的 × 日期)；volume / valid: (標的 × 日期)"""
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.symbols = list(symbols)
+        self.price_fields = tuple(price_fields)
+        self.prices = prices
+        self.volume = volume
+        self.info = info if info is not None else {}
+        self.path = path  # 由 open_matrix 開啟時為矩陣目錄
+        self._col = {s: j for j, s in enumerate(self.symbols)}
+        if valid is None:
+            valid = ~np.isnan(self.prices[self.price_fields.index('Close')])
+        self._valid = valid
+        self.lengths = np.asarray(valid.sum(axis=1))
+
+    # === mapping 介面 ===
+
+    def __getitem__(self, symbol: str) -> dict:
+        if symbol not in self._col:
+            raise KeyError(symbol)
+        return _Entry(self, symbol)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __contains__(self, symbol) -> bool:
+        return symbol in self._col
+
+    # === 陣列存取 ===
+
+    @property
+    def nbytes(self) -> int:
+        return self.prices.nbytes + self.volume.nbytes + self.dates.nbytes + self._valid.nbytes
+
+    def digest(self) -> str:
+        """內容的 sha1（日期、標的、價格、成交量、基本面），週報管線用來判斷價格庫有沒有變"""
+        h = hashlib.sha1()
+        h.update(json.dumps([self.symbols, self.price_fields]).encode())
+        for array in (self.dates, self.prices, self.volume, self._valid):
+            h.update(np.ascontiguousarray(array).tobytes())
+        h.update(json.dumps(self.info, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    @property
+    def fields(self) -> tuple:
+        return self.price_fields + ('Volume',)
+
+    @property
+    def valid(self) -> np.ndarray:
+        """(日期 × 標的) 是否有資料"""
+        return self._valid.T
+
+    def field(self, name: str) -> np.ndarray:
+        """(日期 × 標的) 的原始陣列（轉置 view，不複製）"""
+        if name == 'Volume':
+            return self.volume.T
+        if name not in self.price_fields:
+            raise KeyError(f"{name} 不在矩陣中（只有 {', '.join(self.fields)}）")
+        return self.prices[self.price_fields.index(name)].T
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """(日期 × 標的) float64 DataFrame，與 portfolio.align_panel 對逐檔資料的結果相同（缺值為 NaN）"""
+        values = self.field(name).astype(float)
+        if name == 'Volume':
+            values[~self.valid] = np.nan
+        return pd.DataFrame(values, index=pd.DatetimeIndex(self.dates), columns=self.symbols, copy=False)
+
+    def history(self, symbol: str, fields: tuple = None) -> pd.DataFrame:
+        """單檔的 float64 DataFrame（只含有資料的日期）"""
+        fields = fields or self.fields
+        j = self._col[symbol]
+        valid = self._valid[j]
+        rows = slice(None) if valid.all() else np.flatnonzero(valid)
+        columns = {}
+        for f in fields:
+            source = self.volume if f == 'Volume' else self.prices[self.price_fields.index(f)]
+            columns[f] = np.asarray(source[j, rows], dtype=float)
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(self.dates[rows]))
+
+    def tail(self, bars: int, fields: tuple = ('Close', 'Volume')) -> dict:
+        """
+        每檔最後 bars 根有資料的 K 棒，靠右對齊成 (bars × 標的) float64 陣列，不足的上方補 NaN
+        （與 screener.build_tail_panel 對逐檔資料的結果相同）
+        """
+        n = len(self.symbols)
+        panels = {f: np.full((bars, n), np.nan) for f in fields}
+        # 大部分標的最後 bars 天都有資料，直接切；停牌 / 新上市的再逐檔處理
+        full = self.valid[-bars:].all(axis=0) if len(self.dates) >= bars else np.zeros(n, dtype=bool)
+        for f in fields:
+            panels[f][:, full] = self.field(f)[-bars:, full]
+        for j in np.flatnonzero(~full):
+            rows = np.flatnonzero(self._valid[j])[-bars:]
+            for f in fields:
+                panels[f][bars - len(rows):, j] = self.field(f)[rows, j]
+        return panels
+
+    def select(self, symbols: list) -> 'PriceMatrix':
+        """只保留部分標的（欄位順序依傳入順序）"""
+        cols = [self._col[s] for s in symbols if s in self._col]
+        keep = [self.symbols[j] for j in cols]
+        return PriceMatrix(self.dates, keep, self.prices[:, cols], self.volume[cols],
+                           {s: self.info[s] for s in keep if s in self.info}, self.price_fields,
+                           self._valid[cols])
+
+
+class MatrixBuilder:
+    """逐檔加入資料，最後一次組成 PriceMatrix；加入後原 DataFrame 即可釋放"""
+
+    def __init__(self, price_fields: tuple = PRICE_FIELDS, dtype=np.float32):
+        if 'Close' not in price_fields:
+            raise ValueError("price_fields 必須包含 Close")
+        self.price_fields = tuple(price_fields)
+        self.dtype = dtype
+        self._pieces = []
+        self.info = {}
+
+    def add(self, symbol: str, history: pd.DataFrame, info: dict = None):
+        if history is None or history.empty:
+            return
+        dates = history.index.to_numpy(dtype='datetime64[ns]')
+        # 同一市場的標的日期幾乎都一樣，跟上一檔相同就共用同一個陣列
+        if self._pieces and np.array_equal(self._pieces[-1][1], dates):
+            dates = self._pieces[-1][1]
+        prices = np.vstack([history[f].to_numpy(dtype=self.dtype) for f in self.price_fields])
+        volume = np.nan_to_num(history['Volume'].to_numpy(dtype=float)) if 'Volume' in history \
+            else np.zeros(len(history))
+        volume = volume.astype(np.uint32 if volume.max() <= np.iinfo(np.uint32).max else np.uint64)
+        self._pieces.append((symbol, dates, prices, volume))
+        if info is not None:
+            self.info[symbol] = info
+
+    def add_all(self, data: dict):
+        for sym, item in data.items():
+            history = item['history'] if isinstance(item, dict) else item
+            self.add(sym, history, item.get('info', {}) if isinstance(item, dict) else {})
+
+    def build(self) -> PriceMatrix:
+        if not self._pieces:
+            return PriceMatrix(np.array([], dtype='datetime64[ns]'), [],
+                               np.empty((len(self.price_fields), 0, 0), self.dtype),
+                               np.empty((0, 0), np.uint32), self.info, self.price_fields)
+        distinct = {id(p[1]): p[1] for p in self._pieces}
+        dates = np.unique(np.concatenate(list(distinct.values())))
+        max_volume = max((int(p[3].max()) for p in self._pieces if len(p[3])), default=0)
+        vol_dtype = np.uint32 if max_volume <= np.iinfo(np.uint32).max else np.uint64
+
+        n_dates, n_symbols = len(dates), len(self._pieces)
+        prices = np.full((len(self.price_fields), n_symbols, n_dates), np.nan, dtype=self.dtype)
+        volume = np.zeros((n_symbols, n_dates), dtype=vol_dtype)
+        symbols = []
+        for j, (sym, d, p, v) in enumerate(self._pieces):
+            rows = np.searchsorted(dates, d)
+            prices[:, j, rows] = p
+            volume[j, rows] = v
+            symbols.append(sym)
+        self._pieces = []
+        return PriceMatrix(dates, symbols, prices, volume, self.info, self.price_fields)
+
+
+def to_matrix(data: dict, price_fields: tuple = PRICE_FIELDS, dtype=np.float32) -> PriceMatrix:
+    """把 fetch_all 的 {sym: {'history', 'info'}} 轉成 PriceMatrix"""
+    if isinstance(data, PriceMatrix):
+        return data
+    builder = MatrixBuilder(price_fields, dtype)
+    builder.add_all(data)
+    return builder.build()
+
+
+def fetch_matrix(symbols: list, period_years: int = 3, refresh: bool = False, workers: int = 1,
+                 refresh_info: bool = False, price_fields: tuple = PRICE_FIELDS,
+                 chunk_size: int = CHUNK_SIZE) -> PriceMatrix:
+    """
+    分批呼叫 fetch_all，每批轉成精簡格式後就釋放 DataFrame，
+    記憶體峰值 ≈ 最終矩陣 + 一批的 DataFrame，而不是整個標的池的 DataFrame
+    """
+    from data_fetch import fetch_all
+    builder = MatrixBuilder(price_fields)
+    for i in range(0, len(symbols), chunk_size):
+        chunk = fetch_all(symbols[i:i + chunk_size], period_years, refresh=refresh, workers=workers,
+                          refresh_info=refresh_info)
+        builder.add_all(chunk)
+        del chunk
+        _release_store_memory()
+    return builder.build()
+
+
+def _release_store_memory():
+    """讀 Parquet 的 DataFrame 放在 pyarrow 的記憶體池，釋放後池子不會主動還給作業系統"""
+    from data_fetch import STORE_EXT
+    if STORE_EXT == 'parquet':
+        import pyarrow
+        pyarrow.default_memory_pool().release_unused()
+
+
+# === 磁碟格式 / memory-map ===
+
+def default_matrix_dir() -> str:
+    import data_fetch
+    return os.path.join(data_fetch.STORE_DIR, 'matrix')
+
+
+def save_matrix(matrix: PriceMatrix, path: str = None) -> str:
+    """
+    寫成 .npy 目錄，回傳路徑。每個檔先寫 .tmp 再 os.replace：
+    已經 map 舊檔的 process 仍讀到舊 inode，不會看到寫到一半的資料
+    """
+    path = path or default_matrix_dir()
+    os.makedirs(path, exist_ok=True)
+    arrays = {'prices': matrix.prices, 'volume': matrix.volume, 'valid': matrix._valid,
+              'dates': matrix.dates}
+    for name in MATRIX_FILES:
+        tmp = os.path.join(path, f'{name}.tmp.npy')
+        np.save(tmp, np.ascontiguousarray(arrays[name]))
+        os.replace(tmp, os.path.join(path, f'{name}.npy'))
+    meta = {
+        'symbols': matrix.symbols,
+        'price_fields': list(matrix.price_fields),
+        'shape': [len(matrix.symbols), len(matrix.dates)],
+        'info': matrix.info,
+    }
+    tmp = os.path.join(path, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+    os.replace(tmp, os.path.join(path, 'meta.json'))
+    return path
+
+
+def open_matrix(path: str = None, mmap: bool = True) -> PriceMatrix:
+    """開啟 save_matrix 寫出的目錄；mmap=True 時陣列是唯讀 memory-map，不讀進記憶體"""
+    path = path or default_matrix_dir()
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode) for name in MATRIX_FILES}
+    if arrays['prices'].shape[1:] != tuple(meta['shape']):
+        raise ValueError(f"{path}: meta.json 與 prices.npy 的大小不一致（寫入中斷？）")
+    return PriceMatrix(arrays['dates'], meta['symbols'], arrays['prices'], arrays['volume'],
+                       meta.get('info', {}), tuple(meta['price_fields']), arrays['valid'], path=path)
+
+
+@contextlib.contextmanager
+def shared_matrix(data: dict, price_fields: tuple = PRICE_FIELDS):
+    """
+    給 worker map 的矩陣目錄：本來就是 open_matrix 開的就直接用，否則寫到暫存目錄、用完刪除。
+    逐檔 DataFrame 轉成 float64 矩陣，worker 看到的數值與原本完全相同
+    """
+    if isinstance(data, PriceMatrix) and data.path:
+        yield data.path
+        return
+    with tempfile.TemporaryDirectory(prefix='price_matrix_') as tmp:
+        matrix = data if isinstance(data, PriceMatrix) else to_matrix(data, price_fields, np.float64)
+        yield save_matrix(matrix, tmp)
+
+
+# === 多進程：每個 worker map 同一份矩陣 ===
+
+_WORKER_MATRIX = None
+
+
+def init_matrix_worker(path: str):
+    global _WORKER_MATRIX
+    _WORKER_MATRIX = open_matrix(path, mmap=True)
+
+
+def worker_matrix() -> PriceMatrix:
+    """worker 內 map 好的矩陣（由 map_symbols 或自訂 pool 的 initializer 設定）"""
+    return _WORKER_MATRIX
+
+
+def _run_chunk(fn, symbols: list, args: tuple) -> list:
+    return [(sym, fn(sym, _WORKER_MATRIX[sym], *args)) for sym in symbols]
+
+
+def map_symbols(fn, data: dict, symbols: list = None, args: tuple = (), workers: int = None,
+                price_fields: tuple = PRICE_FIELDS, mp_context=None) -> dict:
+    """
+    在 process pool 裡對每檔跑 fn(symbol, {'history', 'info'}, *args)，回傳 {symbol: 結果}（依 symbols 順序）
+    fn 必須是模組層級的函式（要能 pickle）；price_fields 是 fn 會用到的價格欄位
+    mp_context：從多執行緒程式呼叫時傳 multiprocessing.get_context('forkserver')，避免在有其他 thread 時 fork
+    """
+    symbols = [s for s in (symbols if symbols is not None else list(data.keys())) if s in data]
+    workers = workers or os.cpu_count() or 1
+    n_chunks = min(len(symbols), workers * 4) or 1
+    chunks = [symbols[i::n_chunks] for i in range(n_chunks)]
+    results = {}
+    with shared_matrix(data, price_fields) as matrix_path, ProcessPoolExecutor(
+            max_workers=workers, initializer=init_matrix_worker, initargs=(matrix_path,),
+            mp_context=mp_context) as pool:
+        for part in pool.map(_run_chunk, [fn] * n_chunks, chunks, [args] * n_chunks):
+            results.update(part)
+    return {s: results[s] for s in symbols}
+
+
+if __name__ == "__main__":
+    # python3 price_matrix.py：把目前的標的池寫成 data/store/matrix，之後 open_matrix() 直接 map
+    from screener import load_rules
+    from universe import select_universe
+    rules = load_rules()
+    matrix = fetch_matrix(select_universe(rules), rules.get('backtest', {}).get('period_years', 3),
+                          workers=8)
+    path = save_matrix(matrix)
+    print(f"💾 {len(matrix.symbols)} 檔 × {len(matrix.dates)} 天（{matrix.nbytes / 1e6:.1f} MB）→ {path}")
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+replay.py — 選股歷史重播（「如果在 X 日跑 screener，會選到哪些？」）
+在每週最後一個交易日重跑技術面篩選，輸出每週選股與之後的報酬，用來檢驗選股命中率。
+
+每檔的指標在自己的序列上各算一次 rolling（停牌缺 K 棒時與 screener 看到的相同），
+之後只取週末那幾列對齊成 (週 × 標的) 矩陣，不需要逐日重新切 DataFrame。
+週末當天沒有 K 棒的標的沿用最後一根（等同把歷史截到那天再跑 screener）。
+
+注意：歷史基本面沒有時間點資料，預設只重播技術面條件與排除清單（個股、產業；產業取自 info['sector']）；
+use_fundamentals=True 會再套用「目前」的市值 / PE / 營收成長，有前視偏差，只適合做對照。
+
+用法:
+    python3 replay.py [--horizons 1,4] [--no-prefilter]
+    python3 replay.py --check     # 離線比對重播與逐週 screen_all
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from indicators import compute_rsi, compute_ma, compute_mas, compute_momentum
+from portfolio import align_panel
+from screener import load_rules, MIN_BARS
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'results', 'replay')
+
+
+def week_end_rows(index: pd.DatetimeIndex) -> np.ndarray:
+    """每週最後一個交易日在 index 中的位置"""
+    weeks = index.to_period('W-FRI')
+    is_last = np.append(weeks[1:] != weeks[:-1], True)
+    return np.flatnonzero(is_last)
+
+
+def _max_count(rules: dict) -> int:
+    select_count = rules.get('select_count', '3-5')
+    if isinstance(select_count, str):
+        return int(select_count.split('-')[-1])
+    return select_count
+
+
+def replay_screening(data: dict, rules: dict = None, horizons: tuple = (1, 4),
+                     use_fundamentals: bool = False) -> dict:
+    """
+    回傳:
+    - picks：每週選中的標的（week, rank, symbol, score, rsi, price, fwd_{h}w）
+    - weekly：每週通過 / 選中檔數、選股平均報酬、全體平均報酬
+    - summary：整體統計
+    """
+    if rules is None:
+        rules = load_rules()
+    tech = rules.get('technicals', {})
+    exclude = rules.get('exclude', {})
+
+    close = align_panel(data, 'Close')
+    volume = align_panel(data, 'Volume').reindex(index=close.index, columns=close.columns)
+    symbols = list(close.columns)
+    ma_periods = list(tech.get('above_ma', [60]))
+
+    # === 指標：每檔在自己的序列上算，只取週末那幾列 ===
+    rows = week_end_rows(close.index)
+    dates = close.index[rows]
+    histories = {s: (item['history'] if isinstance(item, dict) else item) for s, item in data.items()}
+    ind = _week_end_indicators(close, volume, histories, rows, ma_periods)
+    px, rsi_w, mom_w = ind['price'], ind['rsi'], ind['momentum']
+
+    with np.errstate(invalid='ignore'):
+        rsi_rules = tech.get('rsi_14', {})
+        rsi_ok = (rsi_w >= rsi_rules.get('min', 0)) & (rsi_w <= rsi_rules.get('max', 100))
+        ok = (ind['bars'] >= MIN_BARS) & ~np.isnan(px) & rsi_ok
+        ok &= ind['avg_volume'] >= tech.get('min_avg_volume_20d', 1000) * 1000
+        score = rsi_ok.astype(np.int64)
+        for p in ma_periods:
+            a_w = px > ind[f'ma_{p}']
+            ok &= a_w
+            score += a_w
+        score += (mom_w > 0) & (mom_w < 15)
+
+    # 排除條件（與 screener 相同，不論是否套用基本面；沒有產業資訊的標的不會被產業排除）
+    sectors = [(data[s].get('info') or {}).get('sector', '') if isinstance(data[s], dict) else '' for s in symbols]
+    excluded = np.isin(symbols, exclude.get('symbols', [])) | np.isin(sectors, exclude.get('sectors', []))
+    ok &= ~excluded[None, :]
+
+    if use_fundamentals:
+        fund_ok, fund_score = _current_fundamentals(symbols, data, rules)
+        ok &= fund_ok[None, :]
+        score += fund_score[None, :]
+
+    # === 每週依分數取前 N（同分維持原始順序，與 run_screening 的穩定排序一致）===
+    k = _max_count(rules)
+    ranked = np.argsort(np.where(ok, -score, 1), axis=1, kind='stable')[:, :k]
+    chosen = np.take_along_axis(ok, ranked, axis=1)
+
+    # === 之後 h 週的報酬 ===
+    forward = {}
+    for h in horizons:
+        fwd = np.full_like(px, np.nan)
+        fwd[:-h] = px[h:] / px[:-h] - 1
+        forward[h] = fwd
+
+    w_idx, r_idx = np.nonzero(chosen)
+    s_idx = ranked[w_idx, r_idx]
+    picks = pd.DataFrame({
+        'week': dates[w_idx].strftime('%Y-%m-%d'),
+        'rank': r_idx + 1,
+        'symbol': np.asarray(symbols)[s_idx],
+        'score': score[w_idx, s_idx],
+        'rsi': np.round(rsi_w[w_idx, s_idx], 1),
+        'price': px[w_idx, s_idx],
+    })
+    for h, fwd in forward.items():
+        picks[f'fwd_{h}w'] = np.round(fwd[w_idx, s_idx] * 100, 2)
+
+    weekly = pd.DataFrame({'week': dates.strftime('%Y-%m-%d'), 'picked': chosen.sum(axis=1),
+                           'passed': ok.sum(axis=1)})
+    summary = {'weeks': len(dates), 'symbols': len(symbols), 'picks': int(chosen.sum())}
+    for h, fwd in forward.items():
+        picked_fwd = np.where(chosen, np.take_along_axis(fwd, ranked, axis=1), np.nan)
+        valid = ~np.isnan(picked_fwd)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)  # 沒選股 / 沒有未來資料的週
+            weekly[f'pick_mean_{h}w'] = np.round(np.nanmean(picked_fwd, axis=1) * 100, 2)
+            weekly[f'all_mean_{h}w'] = np.round(np.nanmean(fwd, axis=1) * 100, 2)
+        if valid.any():
+            summary[f'hit_rate_{h}w'] = round(float((picked_fwd[valid] > 0).mean() * 100), 1)
+            summary[f'pick_mean_{h}w'] = round(float(picked_fwd[valid].mean() * 100), 2)
+        else:
+            summary[f'hit_rate_{h}w'] = summary[f'pick_mean_{h}w'] = None
+        summary[f'all_mean_{h}w'] = round(float(np.nanmean(fwd) * 100), 2)
+
+    return {'picks': picks, 'weekly': weekly, 'summary': summary}
+
+
+def _week_end_indicators(close: pd.DataFrame, volume: pd.DataFrame, histories: dict,
+                         rows: np.ndarray, ma_periods: list) -> dict:
+    """
+    {指標名稱: (週 × 標的) 陣列}：price / ma_{p} / rsi / avg_volume / momentum（%）/ bars（累計 K 棒數）
+    週末沒有 K 棒時取之前最後一根；最後一根 K 棒之後（下市、資料結束）為 NaN
+
+    K 棒連續（第一根到最後一根之間沒有缺日）的標的，矩陣上那一欄就是它自己的序列（只是前後補 NaN），
+    整批一次 rolling；中間有停牌缺口的標的才逐檔在自己的序列上算，再對齊回週末。
+    """
+    valid = close.notna().to_numpy()
+    count = valid.sum(axis=0)
+    first = valid.argmax(axis=0)
+    last = len(valid) - 1 - valid[::-1].argmax(axis=0)
+    gapped = (count > 0) & (last - first + 1 != count)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = {
+            'price': close.to_numpy()[rows],
+            'rsi': compute_rsi(close, 14).to_numpy()[rows],
+            'avg_volume': volume.rolling(20, min_periods=1).mean().to_numpy()[rows],
+            'momentum': compute_momentum(close, 20).to_numpy()[rows] * 100,
+            'bars': valid.cumsum(axis=0)[rows],
+        }
+        out.update({f'ma_{p}': compute_ma(close, p).to_numpy()[rows] for p in ma_periods})
+
+    dates = close.index[rows]
+    for j in np.flatnonzero(gapped):
+        sym = close.columns[j]
+        history = histories[sym].dropna(subset=['Close'])
+        own = history['Close']
+        columns = {
+            'price': own,
+            'rsi': compute_rsi(own, 14, symbol=sym),
+            'avg_volume': history['Volume'].rolling(20, min_periods=1).mean(),
+            'momentum': compute_momentum(own, 20, symbol=sym) * 100,
+            'bars': pd.Series(np.arange(1, len(own) + 1), index=own.index),
+        }
+        mas = compute_mas(own, ma_periods, symbol=sym)
+        columns.update({f'ma_{p}': mas[p] for p in ma_periods})
+        frame = pd.DataFrame(columns).reindex(dates, method='ffill')
+        frame.loc[dates > own.index[-1]] = np.nan
+        for name in out:
+            out[name][:, j] = frame[name].to_numpy(dtype=float)
+    out['bars'] = np.nan_to_num(out['bars']).astype(np.int64)
+    return out
+
+
+def _current_fundamentals(symbols: list, data: dict, rules: dict) -> tuple:
+    """用目前的基本面算出每檔是否通過與加分（有前視偏差）"""
+    fund = rules.get('fundamentals', {})
+    min_cap = fund.get('min_market_cap_tw_billion', 50) * 1e9
+    pe_rules = fund.get('pe_ratio', {})
+    ok = np.ones(len(symbols), dtype=bool)
+    score = np.zeros(len(symbols), dtype=np.int64)
+    for j, sym in enumerate(symbols):
+        info = data[sym].get('info', {}) if isinstance(data[sym], dict) else {}
+        cap = info.get('market_cap')
+        if cap and cap < min_cap:
+            ok[j] = False
+        pe = info.get('pe_ratio')
+        if pe is not None:
+            if pe < pe_rules.get('min', 0) or pe > pe_rules.get('max', 999):
+                ok[j] = False
+            else:
+                score[j] += 1
+        growth = info.get('revenue_growth')
+        if growth is not None and growth > 0:
+            score[j] += 2
+    return ok, score
+
+
+def check_against_screener(data: dict, rules: dict) -> list:
+    """
+    逐週把每檔歷史截到週末那天、跑 screen_all，比對通過檔數與選股（只比技術面與排除條件：
+    info 只留 sector，與 replay_screening 預設相同）。回傳不一致的週 [(week, replay, screener)]
+    """
+    from screener import screen_all
+    result = replay_screening(data, rules, horizons=(1,))
+    picks = result['picks'].groupby('week')['symbol'].apply(list)
+    histories = {s: (item['history'] if isinstance(item, dict) else item) for s, item in data.items()}
+    infos = {s: {'sector': (item.get('info') or {}).get('sector', '')} if isinstance(item, dict) else {}
+             for s, item in data.items()}
+    k = _max_count(rules)
+    mismatches = []
+    for week, passed in zip(result['weekly']['week'], result['weekly']['passed']):
+        end = pd.Timestamp(week)
+        truncated = {s: {'history': h.loc[:end], 'info': infos[s]} for s, h in histories.items()}
+        ok = [r for r in screen_all(truncated, rules) if r['passed']]
+        ok.sort(key=lambda r: r['score'], reverse=True)
+        expected = (len(ok), [r['symbol'] for r in ok[:k]])
+        actual = (int(passed), picks.get(week, []))
+        if actual != expected:
+            mismatches.append((week, actual, expected))
+    return mismatches
+
+
+def synthetic_check_data(n_symbols: int = 60, gapped: int = 10, seed: int = 0) -> dict:
+    """
+    合成標的池；前 gapped 檔各隨機拿掉一根 K 棒（其中一半剛好是週末那天），模擬停牌。
+    每 7 檔有 1 檔的產業是 'Excluded'，給產業排除條件用
+    """
+    from backtest import synthetic_history
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(n_symbols):
+        history = synthetic_history(seed=seed * 1000 + i)
+        if i < gapped:
+            candidates = week_end_rows(history.index) if i % 2 else np.arange(len(history))
+            candidates = candidates[candidates >= 130]
+            history = history.drop(history.index[rng.choice(candidates)])
+        data[f'SYN{i}'] = {'history': history, 'info': {'sector': 'Excluded' if i % 7 == 3 else 'Synthetic'}}
+    return data
+
+
+def run_replay_check(rules: dict) -> bool:
+    """離線比對：沒有缺 K 棒與有停牌缺口的合成資料，重播結果都要與逐週 screen_all 相同（含產業排除）"""
+    rules = {**rules, 'exclude': {**rules.get('exclude', {}), 'sectors': ['Excluded']}}
+    ok = True
+    for label, gapped in (('無缺口', 0), ('停牌缺口', 10)):
+        data = synthetic_check_data(gapped=gapped)
+        mismatches = check_against_screener(data, rules)
+        weeks = len(week_end_rows(align_panel(data).index))
+        print(f"  {'✅' if not mismatches else '❌'} {label}：{weeks} 週中 {len(mismatches)} 週不一致")
+        for week, actual, expected in mismatches[:5]:
+            print(f"     {week}：重播 {actual} ≠ screener {expected}")
+        ok &= not mismatches
+    return ok
+
+
+def load_from_store(symbols: list, sectors: dict = None) -> dict:
+    """直接從本地價格庫讀取（不連網）；sectors（symbol → 產業，例如清單快照）給產業排除用"""
+    from data_fetch import load_stored
+    sectors = sectors or {}
+    data = {}
+    for sym in symbols:
+        history = load_stored(sym)
+        if not history.empty:
+            data[sym] = {'history': history, 'info': {'sector': sectors[sym]} if sectors.get(sym) else {}}
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="選股歷史重播")
+    parser.add_argument("--horizons", default="1,4", help="之後幾週的報酬，例如 1,4,12")
+    parser.add_argument("--no-prefilter", action="store_true", help="不套用 universe 預篩")
+    parser.add_argument("--check", action="store_true", help="離線比對重播與逐週 screen_all（合成資料）")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if run_replay_check(load_rules()) else 1)
+
+    from universe import load_universe, select_universe
+    rules = load_rules()
+    horizons = tuple(int(h) for h in args.horizons.split(','))
+    symbols = select_universe(rules, use_prefilter=not args.no_prefilter)
+
+    start = time.perf_counter()
+    data = load_from_store(symbols, load_universe(rules)['sector'].to_dict())
+    loaded = time.perf_counter()
+    result = replay_screening(data, rules, horizons)
+    done = time.perf_counter()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result['picks'].to_csv(os.path.join(RESULTS_DIR, 'picks.csv'), index=False)
+    result['weekly'].to_csv(os.path.join(RESULTS_DIR, 'weekly.csv'), index=False)
+
+    s = result['summary']
+    print(f"🔁 重播 {s['weeks']} 週 × {s['symbols']} 檔，共選出 {s['picks']} 次"
+          f"（讀取 {loaded - start:.1f}s，計算 {done - loaded:.1f}s）")
+    for h in horizons:
+        print(f"  {h} 週後：命中率 {s[f'hit_rate_{h}w']}% | 選股平均 {s[f'pick_mean_{h}w']}% | "
+              f"全體平均 {s[f'all_mean_{h}w']}%")
+    print(f"💾 結果已存入 {RESULTS_DIR}")
@@ -4,6 +4,7 @@ report.py — 產出分析報告（Markdown 格式）
 整合選股 + 回測結果
 """
 
+import multiprocessing
 import os
 import sys
 from datetime import datetime
@@ -11,15 +12,76 @@ from datetime import datetime
 # 加入 scripts 目錄到 path
 sys.path.insert(0, os.path.dirname(__file__))
 
-from data_fetch import fetch_all, fetch_history
 from screener import run_screening, load_rules
-from backtest import backtest_stock, format_report
+from backtest import backtest_all, format_report
+from portfolio import backtest_portfolio
+from montecarlo import run_monte_carlo, format_intervals
+from analytics import benchmark_history, relative_metrics, format_relative
+from universe import select_universe
+from price_matrix import fetch_matrix
+from pipeline import Pipeline, digest, frame_digest
+import data_fetch
+from perf import RunProfiler
 
 
-def generate_weekly_report(output_path: str = None) -> str:
-    """產出完整週報"""
-    
-    rules = load_rules()
+def report_cache_dir() -> str:
+    """各階段上次的結果與 digest；跟著價格庫走（呼叫時才算，bench 的暫存價格庫不會寫進正式快取）"""
+    return os.path.join(data_fetch.STORE_DIR, 'report_cache')
+
+
+def _backtest_stage(fetch, screen, rules, workers):
+    """
+    選中個股回測：檔數比 workers 多才開 process pool（見 backtest.backtest_all），
+    其餘直接在這個 thread 跑向量化引擎。此時其他階段的 thread 還在執行，所以用 forkserver 而不是 fork
+    """
+    selected = [s for s in screen['selected'] if s['symbol'] in fetch]
+    workers = workers if len(selected) > workers else 1
+    results = backtest_all(fetch, rules, symbols=[s['symbol'] for s in selected], workers=workers,
+                           mp_context=multiprocessing.get_context('forkserver') if workers > 1 else None)
+    return {s['symbol']: {'result': results[s['symbol']], 'name': s['name'], 'screening': s}
+            for s in selected}
+
+
+def _portfolio_stage(fetch, screen, rules):
+    """組合回測：選中個股共用一個資金池（依選股分數排序決定進場優先順序）"""
+    portfolio_data = {s['symbol']: fetch[s['symbol']] for s in screen['selected'] if s['symbol'] in fetch}
+    return backtest_portfolio(portfolio_data, rules) if portfolio_data else None
+
+
+def _montecarlo_stage(backtest, portfolio, rules):
+    """穩健度：每檔與組合各自重抽數千條路徑，得到總報酬 / 最大回撤 / Sharpe 的區間"""
+    mc_inputs = {sym: bt['result'] for sym, bt in backtest.items()}
+    if portfolio is not None:
+        mc_inputs['PORTFOLIO'] = portfolio
+    return run_monte_carlo(mc_inputs, rules)
+
+
+def _analytics_stage(backtest, portfolio, benchmark):
+    """各檔與組合的權益曲線對齊大盤，一次算出 alpha / beta / 追蹤誤差等"""
+    if benchmark.empty:
+        return None
+    curves = {sym: bt['result']['equity_curve']['equity'] for sym, bt in backtest.items()
+              if 'equity_curve' in bt['result']}
+    if portfolio is not None and 'equity_curve' in portfolio:
+        curves['組合'] = portfolio['equity_curve']['equity']
+    return relative_metrics(curves, benchmark['Close'])['table']
+
+
+def generate_weekly_report(output_path: str = None, rules: dict = None, symbols: list = None,
+                           profile: bool = False, workers: int = None, use_cache: bool = True) -> str:
+    """
+    產出完整週報（rules / symbols 預設取自設定檔與 universe）
+    各階段依 DAG 執行：大盤與抓資料、選股同時跑，選中個股以 workers 個 process 平行回測；
+    價格庫內容與規則都沒變的階段直接沿用上次結果（use_cache=False 全部重算）
+    各階段耗時（含 run / cached）、抓取延遲與快取命中率寫到週報旁的 .perf.json；
+    profile=True 另存 cProfile 結果，此時各階段依序在主 thread 執行、回測不開 process pool，profile 才看得到
+    """
+    prof = RunProfiler(profile=profile)
+    if rules is None:
+        rules = load_rules()
+    if symbols is None:
+        symbols = select_universe(rules)
+    workers = 1 if profile else (workers or os.cpu_count() or 1)
     now = datetime.now()
     date_str = now.strftime('%Y-%m-%d')
     week_str = now.strftime('%Y-W%W')
@@ -28,38 +90,45 @@ def generate_weekly_report(output_path: str = None) -> str:
     print(f"📈 Quant Invest 週報 — {date_str}")
     print("=" * 50)
     
-    # Step 1: 抓資料
-    print("\n📊 Step 1: 抓取資料...")
-    data = fetch_all()
+    # fetch / benchmark 是來源階段：一定執行（已是當天資料就不連網），以內容 hash 當版本；
+    # 其他階段的 digest = 規則 hash + 程式碼版本 + 上游版本
+    rules_hash = digest(rules)
+    pipe = Pipeline(report_cache_dir() if use_cache else None, prof, workers=0 if profile else 4)
+    # 篩選與回測只用收盤價與成交量，精簡矩陣只留這兩欄
+    pipe.add('fetch', lambda: fetch_matrix(symbols, workers=8, price_fields=('Close',)),
+             always=True, version=lambda m: m.digest())
+    pipe.add('benchmark', lambda: benchmark_history(rules), always=True, version=frame_digest)
+    pipe.add('screen', lambda fetch: run_screening(fetch, rules), deps=('fetch',), inputs=rules_hash)
+    pipe.add('backtest', lambda fetch, screen: _backtest_stage(fetch, screen, rules, workers),
+             deps=('fetch', 'screen'), inputs=rules_hash)
+    pipe.add('portfolio', lambda fetch, screen: _portfolio_stage(fetch, screen, rules),
+             deps=('fetch', 'screen'), inputs=rules_hash)
+    pipe.add('montecarlo', lambda backtest, portfolio: _montecarlo_stage(backtest, portfolio, rules),
+             deps=('backtest', 'portfolio'), inputs=rules_hash)
+    pipe.add('analytics', _analytics_stage, deps=('backtest', 'portfolio', 'benchmark'))
     
-    # Step 2: 選股
-    print("\n🔍 Step 2: 篩選選股...")
-    screening = run_screening(data, rules)
-    selected = screening['selected']
+    print("\n⚙️ 執行：抓資料 / 大盤 → 選股 → 回測 / 組合 → 穩健度 / 相對大盤...")
+    out = pipe.run()
+    cached = [name for name, status in pipe.status.items() if status == 'cached']
+    if cached:
+        print(f"♻️ 價格庫與規則未變，沿用上次結果：{', '.join(cached)}")
     
-    # Step 3: 回測
-    print("\n📈 Step 3: 回測選中個股...")
-    backtest_results = {}
-    for stock in selected:
-        sym = stock['symbol']
-        if sym in data:
-            result = backtest_stock(sym, data[sym]['history'], rules)
-            backtest_results[sym] = {
-                'result': result,
-                'name': stock['name'],
-                'screening': stock,
-            }
-    
-    # Step 4: 回測大盤基準
-    print("\n📊 Step 4: 回測大盤基準...")
+    data = out['fetch']
+    screening = out['screen']
+    selected = screening['selected']
+    backtest_results = out['backtest']
+    portfolio_result = out['portfolio']
+    intervals = out['montecarlo']
+    relative = out['analytics']
     benchmark_sym = rules.get('backtest', {}).get('benchmark', '^TWII')
-    benchmark_hist = fetch_history(benchmark_sym, period_years=3)
+    benchmark_hist = out['benchmark']
     benchmark_return = 0
     if not benchmark_hist.empty:
         benchmark_return = (benchmark_hist['Close'].iloc[-1] / benchmark_hist['Close'].iloc[0] - 1) * 100
     
-    # Step 5: 產出報告
-    print("\n📝 Step 5: 產出報告...")
+    # 產出報告
+    print("\n📝 產出報告...")
+    prof.begin('render')
     
     report = f"""# 📈 Quant Invest 週報 — {date_str}
 
@@ -78,6 +147,8 @@ def generate_weekly_report(output_path: str = None) -> str:
         sym = stock['symbol']
         report += f"### {sym} {stock['name']}\n\n"
         report += f"**選股理由：** {', '.join(stock['reasons'])}\n\n"
+        if stock.get('warnings'):
+            report += f"**⚠️ 注意：** {', '.join(stock['warnings'])}\n\n"
         
         if sym in backtest_results:
             bt = backtest_results[sym]['result']
@@ -93,6 +164,7 @@ def generate_weekly_report(output_path: str = None) -> str:
 - 平均持有：{m['avg_holding_days']:.0f} 天
 
 """
+                report += format_intervals(intervals.get(sym))
                 # 最近幾筆交易
                 if bt['trades']:
                     report += "**近期交易：**\n"
@@ -105,12 +177,36 @@ def generate_weekly_report(output_path: str = None) -> str:
         
         report += "---\n\n"
     
+    # 組合回測
+    if portfolio_result is not None:
+        pm = portfolio_result['metrics']
+        position_pct = rules.get('backtest', {}).get('position_size', 0.20)
+        report += f"""## 💼 組合回測（共用資金，每檔上限 {position_pct*100:.0f}%）
+
+"""
+        if 'note' not in pm:
+            report += f"""- 總報酬率：{pm['total_return']:+.1f}%（大盤同期：{benchmark_return:+.1f}%）
+- 年化報酬：{pm['annual_return']:+.1f}%
+- 最大回撤：{pm['max_drawdown']:.1f}%
+- Sharpe Ratio：{pm['sharpe_ratio']:.2f}
+- 勝率：{pm['win_rate']:.0f}%（{pm['total_trades']} 筆交易）
+
+"""
+            report += format_intervals(intervals.get('PORTFOLIO'))
+            for sym, c in portfolio_result['per_symbol'].items():
+                report += f"- {sym}：{c['trades']} 筆，損益 {c['pnl']:+,.0f}\n"
+            report += "\n"
+        else:
+            report += f"⚠️ {pm['note']}\n\n"
+    
     # 大盤概況
     report += f"""## 📊 大盤基準
 
 - 台灣加權指數（{benchmark_sym}）近 3 年報酬：{benchmark_return:+.1f}%
 
 """
+    if relative is not None and not relative.empty:
+        report += "## 📐 相對大盤\n\n" + format_relative(relative, benchmark_sym)
     
     # 篩選摘要
     report += "## 🔍 篩選摘要\n\n"
@@ -154,11 +250,14 @@ def generate_weekly_report(output_path: str = None) -> str:
     with open(output_path, 'w') as f:
         f.write(report)
     
+    perf_path = prof.write(output_path)
     print(f"\n✅ 報告已存入：{output_path}")
+    print(f"⏱️ 效能紀錄：{perf_path}")
     return report
 
 
 if __name__ == "__main__":
-    report = generate_weekly_report()
+    # python3 report.py --profile：另存 cProfile 結果（.prof）
+    report = generate_weekly_report(profile='--profile' in sys.argv)
     print("\n" + "=" * 50)
     print(report)
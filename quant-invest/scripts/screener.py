@@ -8,7 +8,10 @@ import pandas as pd
 import numpy as np
 import yaml
 import os
-from data_fetch import fetch_all, TW_UNIVERSE
+from datetime import datetime
+from data_fetch import stale_fields, TW_UNIVERSE
+from indicators import compute_rsi, compute_ma, compute_momentum
+from price_matrix import PriceMatrix, fetch_matrix, map_symbols
 
 
 def load_rules(config_path: str = None) -> dict:
@@ -19,20 +22,6 @@ def load_rules(config_path: str = None) -> dict:
         return yaml.safe_load(f)
 
 
-def compute_rsi(series: pd.Series, period: int = 14) -> pd.Series:
-    """計算 RSI"""
-    delta = series.diff()
-    gain = delta.where(delta > 0, 0).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs))
-
-
-def compute_ma(series: pd.Series, period: int) -> pd.Series:
-    """計算移動平均"""
-    return series.rolling(window=period).mean()
-
-
 def screen_stock(symbol: str, history: pd.DataFrame, info: dict, rules: dict) -> dict:
     """篩選單一個股，回傳評分結果"""
     result = {
@@ -42,6 +31,7 @@ def screen_stock(symbol: str, history: pd.DataFrame, info: dict, rules: dict) ->
         'score': 0,
         'reasons': [],
         'fails': [],
+        'warnings': [],
     }
     
     if len(history) < 120:  # 至少需要半年數據
@@ -56,6 +46,13 @@ def screen_stock(symbol: str, history: pd.DataFrame, info: dict, rules: dict) ->
     # === 基本面 ===
     fund = rules.get('fundamentals', {})
     
+    # 基本面資料新鮮度（快取過期且無法更新時仍會篩選，但要標示出來）
+    if 'fetched_at' in info:
+        stale = stale_fields(info, ['market_cap', 'pe_ratio', 'revenue_growth'])
+        if stale:
+            oldest = min(info['fetched_at'].get(f, '') for f in stale)[:10] or '未知'
+            result['warnings'].append(f"基本面資料過期（{', '.join(stale)}，抓取於 {oldest}）")
+    
     # 市值
     market_cap = info.get('market_cap', 0)
     min_cap = fund.get('min_market_cap_tw_billion', 50) * 1e9
@@ -85,7 +82,7 @@ def screen_stock(symbol: str, history: pd.DataFrame, info: dict, rules: dict) ->
     
     # 均線
     for ma_period in tech.get('above_ma', [60]):
-        ma = compute_ma(close, ma_period)
+        ma = compute_ma(close, ma_period, symbol=symbol)
         if not ma.empty and latest > ma.iloc[-1]:
             result['score'] += 1
             result['reasons'].append(f'在 {ma_period} 日均線之上')
@@ -94,7 +91,7 @@ def screen_stock(symbol: str, history: pd.DataFrame, info: dict, rules: dict) ->
             result['fails'].append(f'在 {ma_period} 日均線之下')
     
     # RSI
-    rsi = compute_rsi(close, 14)
+    rsi = compute_rsi(close, 14, symbol=symbol)
     current_rsi = rsi.iloc[-1]
     rsi_rules = tech.get('rsi_14', {})
     if current_rsi < rsi_rules.get('min', 0) or current_rsi > rsi_rules.get('max', 100):
@@ -125,7 +122,7 @@ def screen_stock(symbol: str, history: pd.DataFrame, info: dict, rules: dict) ->
     # 額外技術指標加分
     # 短期動能
     if len(close) >= 20:
-        momentum_20d = (latest / close.iloc[-20] - 1) * 100
+        momentum_20d = compute_momentum(close, 20, symbol=symbol).iloc[-1] * 100
         if 0 < momentum_20d < 15:
             result['score'] += 1
             result['reasons'].append(f'20日動能 +{momentum_20d:.1f}%')
@@ -136,21 +133,268 @@ def screen_stock(symbol: str, history: pd.DataFrame, info: dict, rules: dict) ->
     return result
 
 
-def run_screening(data: dict = None, rules: dict = None) -> list:
-    """執行完整篩選流程"""
+# === 橫斷面批次篩選 ===
+# 把所有標的的「最後 N 根 K 棒」疊成一個 (bars × symbols) 的矩陣（靠右對齊，跟逐檔版的 iloc[-k] 語意相同），
+# 所有技術面條件都是整個矩陣一次算完；只有最後產出 reasons / fails 文字時才逐列處理。
+
+MIN_BARS = 120
+
+
+def build_tail_panel(data: dict, bars: int, fields: tuple = ('Close', 'Volume')) -> tuple:
+    """回傳 (symbols, 每檔 K 棒數, {field: (bars × symbols) 陣列})，不足 bars 的上方補 NaN"""
+    if isinstance(data, PriceMatrix):
+        return list(data.symbols), data.lengths.copy(), data.tail(bars, fields)
+    symbols = list(data.keys())
+    lengths = np.zeros(len(symbols), dtype=np.int64)
+    panels = {f: np.full((bars, len(symbols)), np.nan) for f in fields}
+    for j, sym in enumerate(symbols):
+        history = data[sym]['history']
+        lengths[j] = len(history)
+        k = min(bars, len(history))
+        if k == 0:
+            continue
+        for f in fields:
+            panels[f][bars - k:, j] = history[f].to_numpy(dtype=float)[-k:]
+    return symbols, lengths, panels
+
+
+def _fundamental_arrays(symbols: list, data: dict) -> dict:
+    infos = [data.info.get(s, {}) for s in symbols] if isinstance(data, PriceMatrix) \
+        else [data[s]['info'] for s in symbols]
+
+    def col(key):
+        return np.array([np.nan if i.get(key) is None else i.get(key) for i in infos], dtype=float)
+    return {
+        'name': [i.get('name', s) for i, s in zip(infos, symbols)],
+        'sector': [i.get('sector', '') for i in infos],
+        'market_cap': col('market_cap'),
+        'pe_ratio': col('pe_ratio'),
+        'revenue_growth': col('revenue_growth'),
+    }
+
+
+def panel_indicators(data: dict, ma_periods: list) -> dict:
+    """
+    每檔最新一根 K 棒的技術指標（都是長度 = 標的數的陣列）：
+    price / ma {週期: 值} / rsi / avg_volume_20d / momentum_20d，bars 為每檔 K 棒數
+    （indicator_state.IndicatorState.snapshot 以串流狀態算出相同格式）
+    """
+    bars = max(list(ma_periods) + [15, 20])
+    symbols, lengths, panels = build_tail_panel(data, bars)
+    close, volume = panels['Close'], panels['Volume']
+    latest = close[-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ma = {p: close[-p:].mean(axis=0) for p in ma_periods}
+        # RSI 14（漲跌幅簡單平均，與 indicators.compute_rsi 預設相同）
+        delta = np.diff(close[-15:], axis=0)
+        gain = np.where(delta > 0, delta, 0).mean(axis=0)
+        loss = np.where(delta < 0, -delta, 0).mean(axis=0)
+        rsi = 100 - (100 / (1 + gain / loss))
+        rsi[np.isnan(delta).any(axis=0)] = np.nan
+        # 成交量（pandas mean 會略過 NaN）
+        avg_vol = np.nanmean(volume[-20:], axis=0)
+        momentum = (latest / close[-20] - 1) * 100
+    return {'symbols': symbols, 'bars': lengths, 'price': latest, 'ma': ma, 'rsi': rsi,
+            'avg_volume_20d': avg_vol, 'momentum_20d': momentum}
+
+
+def screen_panel(data: dict, rules: dict, indicators: dict = None) -> pd.DataFrame:
+    """
+    橫斷面篩選：一次算出所有標的的技術指標、各條件通過與否與分數
+    回傳以 symbol 為 index 的 DataFrame（screen_stock 的所有判斷都對應到一個欄位）
+    indicators：已經算好的技術指標（panel_indicators 格式，例如來自串流狀態），None 則從 data 計算
+    """
+    fund = rules.get('fundamentals', {})
+    tech = rules.get('technicals', {})
+    exclude = rules.get('exclude', {})
+    ma_periods = list(tech.get('above_ma', [60]))
+
+    if indicators is None:
+        indicators = panel_indicators(data, ma_periods)
+    symbols, lengths = indicators['symbols'], indicators['bars']
+    latest = indicators['price']
+    table = pd.DataFrame(index=pd.Index(symbols, name='symbol'))
+    f = _fundamental_arrays(symbols, data)
+    table['name'] = f['name']
+    table['bars'] = lengths
+    enough = lengths >= MIN_BARS
+    table['fail_short'] = ~enough
+    score = np.zeros(len(symbols), dtype=np.int64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 基本面
+        cap = f['market_cap']
+        min_cap = fund.get('min_market_cap_tw_billion', 50) * 1e9
+        table['market_cap'] = cap
+        table['fail_market_cap'] = (np.nan_to_num(cap) > 0) & (cap < min_cap)
+
+        pe = f['pe_ratio']
+        pe_rules = fund.get('pe_ratio', {})
+        has_pe = ~np.isnan(pe)
+        pe_bad = (pe < pe_rules.get('min', 0)) | (pe > pe_rules.get('max', 999))
+        table['pe_ratio'] = pe
+        table['fail_pe'] = has_pe & pe_bad
+        table['ok_pe'] = has_pe & ~pe_bad
+        score += table['ok_pe'].to_numpy()
+
+        rev = f['revenue_growth']
+        table['revenue_growth'] = rev
+        table['ok_revenue'] = rev > 0
+        score += 2 * table['ok_revenue'].to_numpy()
+
+        # 均線
+        for p in ma_periods:
+            ma = indicators['ma'][p]
+            above = latest > ma
+            table[f'ma_{p}'] = ma
+            table[f'ok_ma_{p}'] = above
+            table[f'fail_ma_{p}'] = ~above
+            score += above
+
+        # RSI 14
+        rsi = indicators['rsi']
+        rsi_rules = tech.get('rsi_14', {})
+        rsi_bad = (rsi < rsi_rules.get('min', 0)) | (rsi > rsi_rules.get('max', 100))
+        table['rsi'] = rsi
+        table['fail_rsi'] = rsi_bad
+        table['ok_rsi'] = ~rsi_bad
+        score += ~rsi_bad
+
+        # 成交量
+        avg_vol = indicators['avg_volume_20d']
+        min_vol = tech.get('min_avg_volume_20d', 1000)
+        table['avg_volume_20d'] = avg_vol
+        table['fail_volume'] = avg_vol < min_vol * 1000
+
+        # 排除條件
+        table['sector'] = f['sector']
+        table['fail_excluded_symbol'] = table.index.isin(exclude.get('symbols', []))
+        table['fail_excluded_sector'] = table['sector'].isin(exclude.get('sectors', []))
+
+        # 20 日動能
+        momentum = indicators['momentum_20d']
+        table['momentum_20d'] = momentum
+        table['ok_momentum'] = (momentum > 0) & (momentum < 15)
+        score += table['ok_momentum'].to_numpy()
+
+    table['price'] = latest
+    fail_cols = [c for c in table.columns if c.startswith('fail_') and c != 'fail_short']
+    table['passed'] = enough & ~table[fail_cols].any(axis=1).to_numpy()
+    table['score'] = np.where(enough, score, 0)
+    return table
+
+
+def _row_to_result(sym: str, row, info: dict, ma_periods: list) -> dict:
+    """把 screen_panel 的一列轉成與 screen_stock 相同的 dict（文字與順序一致）"""
+    result = {
+        'symbol': sym,
+        'name': row['name'],
+        'passed': bool(row['passed']),
+        'score': int(row['score']),
+        'reasons': [],
+        'fails': [],
+        'warnings': [],
+    }
+    if row['fail_short']:
+        result['fails'].append('數據不足（< 120 天）')
+        return result
+
+    if 'fetched_at' in info:
+        stale = stale_fields(info, ['market_cap', 'pe_ratio', 'revenue_growth'])
+        if stale:
+            oldest = min(info['fetched_at'].get(f, '') for f in stale)[:10] or '未知'
+            result['warnings'].append(f"基本面資料過期（{', '.join(stale)}，抓取於 {oldest}）")
+
+    reasons, fails = result['reasons'], result['fails']
+    if row['fail_market_cap']:
+        fails.append(f"市值不足（{row['market_cap']/1e9:.0f}B < {row['min_cap']/1e9:.0f}B）")
+    if row['fail_pe']:
+        fails.append(f"PE 不在範圍（{row['pe_ratio']:.1f}）")
+    elif row['ok_pe']:
+        reasons.append(f"PE {row['pe_ratio']:.1f} 合理")
+    if row['ok_revenue']:
+        reasons.append(f"營收成長 {row['revenue_growth']*100:.1f}%")
+    for p in ma_periods:
+        if row[f'ok_ma_{p}']:
+            reasons.append(f'在 {p} 日均線之上')
+        else:
+            fails.append(f'在 {p} 日均線之下')
+    if row['fail_rsi']:
+        fails.append(f"RSI {row['rsi']:.0f} 超出範圍")
+    else:
+        reasons.append(f"RSI {row['rsi']:.0f}")
+    if row['fail_volume']:
+        fails.append(f"成交量不足（{row['avg_volume_20d']/1000:.0f} 張）")
+    if row['fail_excluded_symbol']:
+        fails.append('在排除清單中')
+    if row['fail_excluded_sector']:
+        fails.append(f"產業 {row['sector']} 被排除")
+    if row['ok_momentum']:
+        reasons.append(f"20日動能 +{row['momentum_20d']:.1f}%")
+
+    result['rsi'] = row['rsi']
+    result['price'] = row['price']
+    return result
+
+
+def screen_all(data: dict, rules: dict, indicators: dict = None) -> list:
+    """批次篩選，回傳與逐檔 screen_stock 相同格式的結果清單"""
+    table = screen_panel(data, rules, indicators)
+    table['min_cap'] = rules.get('fundamentals', {}).get('min_market_cap_tw_billion', 50) * 1e9
+    ma_periods = list(rules.get('technicals', {}).get('above_ma', [60]))
+    infos = data.info if isinstance(data, PriceMatrix) else {s: data[s]['info'] for s in table.index}
+    return [_row_to_result(sym, row, infos.get(sym, {}), ma_periods)
+            for sym, row in zip(table.index, table.to_dict('records'))]
+
+
+def _screen_one(symbol: str, item: dict, rules: dict) -> dict:
+    return screen_stock(symbol, item['history'], item['info'], rules)
+
+
+def screen_incremental(data: dict, rules: dict, ticks: dict = None) -> list:
+    """
+    用串流指標狀態篩選：只把新的 K 棒推進狀態（每檔 O(1)），狀態存回 data/store
+    ticks={sym: (price, volume)}：盤中模式，狀態只收到昨天為止，即時報價當成今天的 K 棒試算
+    """
+    from indicator_state import IndicatorState
+    state = IndicatorState.load(rules)
+    before = pd.Timestamp.now().normalize() if ticks is not None else None
+    stats = state.update(data, before=before)
+    state.save()
+    print(f"⚡ 指標狀態：推進 {stats['appended']} 根 K 棒，重建 {stats['rebuilt']} 檔")
+    return screen_all(data, rules, state.snapshot(list(data.keys()), ticks))
+
+
+def run_screening(data: dict = None, rules: dict = None, mode: str = 'panel', workers: int = 1,
+                  ticks: dict = None) -> list:
+    """
+    執行完整篩選流程
+    mode='panel'：橫斷面批次篩選（預設）；mode='stock'：逐檔 screen_stock
+    （workers > 1 時分到多個 process，共用同一份 memory-map 的價格矩陣）；
+    mode='incremental'：串流指標狀態（見 screen_incremental，ticks 為盤中即時報價）
+    """
     if rules is None:
         rules = load_rules()
     
     if data is None:
+        from universe import select_universe
         print("📊 抓取資料中...")
-        data = fetch_all()
+        data = fetch_matrix(select_universe(rules), workers=8, price_fields=('Close',))
     
     print(f"\n🔍 開始篩選（{len(data)} 檔）...")
     
-    results = []
-    for sym, stock_data in data.items():
-        result = screen_stock(sym, stock_data['history'], stock_data['info'], rules)
-        results.append(result)
+    if mode == 'panel':
+        results = screen_all(data, rules)
+    elif mode == 'incremental':
+        results = screen_incremental(data, rules, ticks)
+    elif workers > 1:
+        results = list(map_symbols(_screen_one, data, args=(rules,), workers=workers,
+                                   price_fields=('Close',)).values())
+    else:
+        results = []
+        for sym, stock_data in data.items():
+            result = screen_stock(sym, stock_data['history'], stock_data['info'], rules)
+            results.append(result)
     
     # 篩選通過的
     passed = [r for r in results if r['passed']]
@@ -174,6 +418,12 @@ def run_screening(data: dict = None, rules: dict = None) -> list:
     
     for s in selected:
         print(f"  • {s['symbol']} {s['name']} (分數: {s['score']}) — {', '.join(s['reasons'])}")
+        for w in s['warnings']:
+            print(f"    ⚠️ {w}")
+    
+    stale_count = sum(1 for r in results if r.get('warnings'))
+    if stale_count:
+        print(f"⚠️ {stale_count} 檔使用過期的基本面資料")
     
     return {
         'selected': selected,
@@ -183,8 +433,41 @@ def run_screening(data: dict = None, rules: dict = None) -> list:
     }
 
 
+def run_intraday(rules: dict = None, interval: int = 300, rounds: int = None):
+    """盤中每 interval 秒抓一次即時報價重新篩選，印出精選名單的變化（Ctrl-C 結束）"""
+    import time
+    from data_fetch import fetch_quotes
+    from universe import select_universe
+    if rules is None:
+        rules = load_rules()
+    data = fetch_matrix(select_universe(rules), workers=8, price_fields=('Close',))
+    previous = None
+    done = 0
+    while rounds is None or done < rounds:
+        ticks = fetch_quotes(list(data.keys()))
+        print(f"\n⏱️ {datetime.now():%H:%M:%S} 即時報價 {len(ticks)} 檔")
+        selected = [s['symbol'] for s in run_screening(data, rules, mode='incremental', ticks=ticks)['selected']]
+        if previous is not None:
+            added = [s for s in selected if s not in previous]
+            removed = [s for s in previous if s not in selected]
+            if added or removed:
+                print(f"🔔 精選變動：新增 {', '.join(added) or '無'}｜移出 {', '.join(removed) or '無'}")
+        previous = selected
+        done += 1
+        if rounds is None or done < rounds:
+            time.sleep(interval)
+
+
 if __name__ == "__main__":
-    result = run_screening()
+    import sys
+    # python3 screener.py --incremental：每日增量（串流指標狀態）
+    # python3 screener.py --intraday [秒數]：盤中定時用即時報價重新篩選
+    if '--intraday' in sys.argv:
+        i = sys.argv.index('--intraday')
+        interval = int(sys.argv[i + 1]) if len(sys.argv) > i + 1 else 300
+        run_intraday(interval=interval)
+        sys.exit(0)
+    result = run_screening(mode='incremental' if '--incremental' in sys.argv else 'panel')
     print(f"\n🎯 最終選股：")
     for s in result['selected']:
         print(f"  {s['symbol']} — {s['name']}")
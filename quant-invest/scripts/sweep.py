@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+sweep.py — 出場參數網格搜尋
+對 exit.take_profit / stop_loss / rsi_overbought / trailing_stop 的笛卡兒積 × 整個標的池跑回測，
+輸出排名表。結果逐組寫入 JSONL，中斷後重跑會跳過已完成的組合。
+JSONL 第一行記錄價格資料、規則與回測引擎的 digest；任一項不同就把舊檔改名保留、從頭跑。
+收盤價寫成 memory-map 的價格矩陣（price_matrix），每個 worker 唯讀 map 同一份，不複製也不 pickle。
+
+用法:
+    python3 sweep.py --take-profit 0.10:0.25:0.05 --stop-loss -0.10,-0.08,-0.05 \
+                     --rsi-overbought 70,75,80 --trailing-stop 0.08:0.15:0.01 --name w11
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from backtest import load_rules, backtest_stock, backtest_stock_vectorized
+from pipeline import digest
+from price_matrix import PriceMatrix, shared_matrix, init_matrix_worker, worker_matrix, to_matrix
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'results', 'sweeps')
+SWEEP_KEYS = ['take_profit', 'stop_loss', 'rsi_overbought', 'trailing_stop']
+
+# worker 端的設定：每個 process 只在啟動時接收一次，之後的 task 只傳參數（價格在 worker_matrix()）
+_WORKER_RULES = {}
+_WORKER_ENGINE = None
+
+
+def parse_range(text: str) -> list:
+    """解析 '0.10:0.25:0.05'（含終點）或 '70,75,80'"""
+    if ':' in text:
+        start, stop, step = (float(x) for x in text.split(':'))
+        count = int(round((stop - start) / step)) + 1
+        return [round(start + i * step, 6) for i in range(count)]
+    return [float(x) for x in text.split(',') if x.strip()]
+
+
+def param_grid(ranges: dict) -> list:
+    """把 {key: [values]} 展開成參數組合清單"""
+    keys = [k for k in SWEEP_KEYS if k in ranges]
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(ranges[k] for k in keys))]
+
+
+def combo_key(params: dict) -> str:
+    return json.dumps({k: params[k] for k in sorted(params)}, sort_keys=True)
+
+
+def _init_worker(matrix_path: str, rules: dict, engine: str):
+    global _WORKER_RULES, _WORKER_ENGINE
+    init_matrix_worker(matrix_path)
+    _WORKER_RULES = rules
+    _WORKER_ENGINE = engine
+
+
+def _run_combo(params: dict) -> dict:
+    """在 worker 內：一組參數 × 全部標的"""
+    rules = {**_WORKER_RULES, 'exit': {**_WORKER_RULES.get('exit', {}), **params}}
+    run = backtest_stock_vectorized if _WORKER_ENGINE == 'vectorized' else backtest_stock
+    matrix = worker_matrix()
+    per_symbol = {}
+    for sym in matrix.symbols:
+        m = run(sym, matrix.history(sym, ('Close',)), rules)['metrics']
+        if 'note' in m:
+            continue
+        per_symbol[sym] = {k: m[k] for k in ('total_return', 'max_drawdown', 'sharpe_ratio',
+                                             'total_trades', 'winning_trades')}
+    return {'params': params, 'per_symbol': per_symbol}
+
+
+def summarize(record: dict) -> dict:
+    """單組參數的跨標的彙總"""
+    rows = list(record['per_symbol'].values())
+    row = dict(record['params'])
+    if not rows:
+        return {**row, 'symbols': 0}
+    returns = np.array([r['total_return'] for r in rows])
+    trades = sum(r['total_trades'] for r in rows)
+    wins = sum(r['winning_trades'] for r in rows)
+    row.update({
+        'symbols': len(rows),
+        'mean_return': round(float(returns.mean()), 2),
+        'median_return': round(float(np.median(returns)), 2),
+        'pct_positive': round(float((returns > 0).mean() * 100), 1),
+        'mean_sharpe': round(float(np.mean([r['sharpe_ratio'] for r in rows])), 2),
+        'mean_max_drawdown': round(float(np.mean([r['max_drawdown'] for r in rows])), 2),
+        'total_trades': trades,
+        'win_rate': round(wins / trades * 100, 1) if trades else 0,
+    })
+    return row
+
+
+def sweep_header(matrix: PriceMatrix, rules: dict, engine: str) -> dict:
+    """續跑的前提：價格、規則、引擎都和上次相同"""
+    return {'data': matrix.digest(), 'rules': digest(rules), 'engine': engine}
+
+
+def load_done(path: str, header: dict) -> dict:
+    """
+    讀取已完成的組合（忽略中斷時寫到一半的最後一行）
+    檔頭與 header 不符（或是沒有檔頭的舊檔）時，舊檔改名成 <name>.stale-<時間>.jsonl，回傳空 dict
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r') as f:
+        try:
+            stored = json.loads(f.readline()).get('header')
+        except json.JSONDecodeError:
+            stored = None
+        if stored == header:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done[combo_key(record['params'])] = record
+            return done
+
+    stale = f"{path[:-len('.jsonl')]}.stale-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+    os.replace(path, stale)
+    print(f"⚠️  價格資料、規則或引擎與上次不同，舊結果移到 {os.path.basename(stale)}，從頭跑")
+    return done
+
+
+def run_sweep(data: dict, ranges: dict, rules: dict = None, name: str = 'sweep',
+              workers: int = None, engine: str = 'vectorized', rank_by: str = 'mean_sharpe') -> pd.DataFrame:
+    """執行網格搜尋，回傳依 rank_by 排序的結果表"""
+    if rules is None:
+        rules = load_rules()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    jsonl_path = os.path.join(RESULTS_DIR, f"{name}.jsonl")
+    matrix = data if isinstance(data, PriceMatrix) else to_matrix(data, ('Close',), np.float64)
+    header = sweep_header(matrix, rules, engine)
+    done = load_done(jsonl_path, header)
+    if not os.path.exists(jsonl_path):
+        with open(jsonl_path, 'w') as out:
+            out.write(json.dumps({'header': header}) + '\n')
+    grid = param_grid(ranges)
+    todo = [p for p in grid if combo_key(p) not in done]
+
+    print(f"🧮 參數組合：{len(grid)}（已完成 {len(grid) - len(todo)}，待跑 {len(todo)}）× {len(matrix)} 檔")
+
+    if todo:
+        with open(jsonl_path, 'a') as out, shared_matrix(matrix, ('Close',)) as matrix_path, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                    initargs=(matrix_path, rules, engine)) as pool:
+            futures = [pool.submit(_run_combo, p) for p in todo]
+            for i, future in enumerate(as_completed(futures)):
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+                done[combo_key(record['params'])] = record
+                print(f"  [{i+1}/{len(todo)}] {record['params']}")
+
+    table = pd.DataFrame([summarize(done[combo_key(p)]) for p in grid])
+    if rank_by in table.columns:
+        table = table.sort_values(rank_by, ascending=False).reset_index(drop=True)
+        table.index += 1
+    table.to_csv(os.path.join(RESULTS_DIR, f"{name}.csv"), index_label='rank')
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="出場參數網格搜尋")
+    parser.add_argument("--take-profit", default=None, help="例如 0.10:0.25:0.05 或 0.1,0.15")
+    parser.add_argument("--stop-loss", default=None)
+    parser.add_argument("--rsi-overbought", default=None)
+    parser.add_argument("--trailing-stop", default=None)
+    parser.add_argument("--name", default="sweep", help="結果檔名（同名且資料、規則、引擎相同時續跑）")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", choices=["vectorized", "loop"], default="vectorized")
+    parser.add_argument("--rank-by", default="mean_sharpe")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    rules = load_rules()
+    ranges = {}
+    for key in SWEEP_KEYS:
+        text = getattr(args, key)
+        # 沒指定的參數固定為目前 screening_rules.yaml 的值
+        ranges[key] = parse_range(text) if text else [rules.get('exit', {}).get(key)]
+
+    from data_fetch import fetch_all
+    from universe import select_universe
+    symbols = select_universe(rules)
+    print(f"📊 抓取 {len(symbols)} 檔資料...")
+    data = fetch_all(symbols, rules.get('backtest', {}).get('period_years', 3), workers=8)
+
+    table = run_sweep(data, ranges, rules, name=args.name, workers=args.workers,
+                      engine=args.engine, rank_by=args.rank_by)
+    print(f"\n🏆 前 {args.top} 名（依 {args.rank_by}）：")
+    print(table.head(args.top).to_string())
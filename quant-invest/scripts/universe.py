@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+universe.py — 標的池管理
+從本地清單快照（config/universe/tw_listed.csv）載入上市櫃股票與產業資訊，
+在抓價格之前先用已知的市值 / 成交量排除不可能通過篩選的標的。
+
+清單快照來自證交所 ISIN 公開資料（上市 strMode=2、上櫃 strMode=4），存成 HTML 後匯入：
+    python3 universe.py --import listed.html TWSE --import otc.html TPEx
+"""
+
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import data_fetch
+from data_fetch import FIELD_TTL_HOURS, load_store_meta, load_fundamentals
+
+BASE_DIR = os.path.join(os.path.dirname(__file__), '..')
+DEFAULT_SNAPSHOT = os.path.join('config', 'universe', 'tw_listed.csv')
+SNAPSHOT_COLUMNS = ['symbol', 'name', 'market', 'sector', 'industry', 'market_cap', 'avg_volume_20d']
+MARKET_SUFFIX = {'TWSE': '.TW', 'TPEx': '.TWO'}
+VOLUME_MAX_AGE_DAYS = 7  # 價格庫 meta 的均量超過幾天沒更新就不採用
+
+
+def _snapshot_path(rules: dict = None) -> str:
+    path = (rules or {}).get('universe', {}).get('snapshot', DEFAULT_SNAPSHOT)
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def universe_cache_path() -> str:
+    """解析結果的快取；跟著價格庫走（呼叫時才算，bench 的暫存價格庫不會讀寫正式快取）"""
+    return os.path.join(data_fetch.STORE_DIR, 'universe.json')
+
+
+def _file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_universe(rules: dict = None) -> pd.DataFrame:
+    """
+    載入完整標的清單（index = symbol）
+    解析結果快取在 data/store/universe.json，快照檔沒變就直接讀快取
+    """
+    path = _snapshot_path(rules)
+    digest = _file_hash(path)
+    cache_path = universe_cache_path()
+
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get('snapshot_hash') == digest:
+            return pd.DataFrame(cached['rows']).set_index('symbol')
+
+    df = pd.read_csv(path, dtype={'symbol': str, 'name': str, 'market': str,
+                                  'sector': str, 'industry': str})
+    df = df.reindex(columns=SNAPSHOT_COLUMNS)
+    df = df.drop_duplicates('symbol').set_index('symbol')
+    df[['sector', 'industry']] = df[['sector', 'industry']].fillna('')
+
+    rows = df.reset_index().replace({np.nan: None}).to_dict('records')
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp = cache_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'snapshot_hash': digest, 'rows': rows}, f, ensure_ascii=False)
+    os.replace(tmp, cache_path)
+    return df
+
+
+def _known_liquidity(symbols: list, now: datetime = None) -> tuple:
+    """
+    從基本面快取與本地價格庫 meta 取得已知的市值與 20 日均量（沒有就是 NaN）
+    市值超過 FIELD_TTL_HOURS、均量超過 VOLUME_MAX_AGE_DAYS 沒更新的視為未知，不拿來排除
+    """
+    now = now or datetime.now()
+    cap_ttl = timedelta(hours=FIELD_TTL_HOURS['market_cap'])
+    oldest_volume = (now - timedelta(days=VOLUME_MAX_AGE_DAYS)).strftime('%Y-%m-%d')
+    fundamentals = load_fundamentals()
+    meta = load_store_meta()
+    caps = np.full(len(symbols), np.nan)
+    vols = np.full(len(symbols), np.nan)
+    for i, sym in enumerate(symbols):
+        cap = fundamentals.get(sym, {}).get('market_cap', {})
+        fetched_at = cap.get('fetched_at')
+        if cap.get('value') and fetched_at and now - datetime.fromisoformat(fetched_at) <= cap_ttl:
+            caps[i] = cap['value']
+        entry = meta.get(sym, {})
+        if entry.get('avg_volume_20d') is not None and entry.get('updated', '') >= oldest_volume:
+            vols[i] = entry['avg_volume_20d']
+    return caps, vols
+
+
+def prefilter(universe: pd.DataFrame, rules: dict) -> pd.DataFrame:
+    """
+    抓價格前的預篩：市值與 20 日均量「已知且不合格」的才排除，未知的一律保留
+    已知值依序取自：快照欄位 → 基本面快取 → 本地價格庫（快取過期的當作未知）
+    """
+    fund = rules.get('fundamentals', {})
+    tech = rules.get('technicals', {})
+    min_cap = fund.get('min_market_cap_tw_billion', 50) * 1e9
+    min_vol = tech.get('min_avg_volume_20d', 1000) * 1000  # 張 → 股
+
+    symbols = list(universe.index)
+    known_caps, known_vols = _known_liquidity(symbols)
+    caps = universe['market_cap'].astype(float).to_numpy()
+    vols = universe['avg_volume_20d'].astype(float).to_numpy()
+    caps = np.where(np.isnan(caps), known_caps, caps)
+    vols = np.where(np.isnan(vols), known_vols, vols)
+
+    with np.errstate(invalid='ignore'):
+        too_small = caps < min_cap
+        too_thin = vols < min_vol
+    keep = ~(too_small | too_thin)
+    return universe[keep]
+
+
+def select_universe(rules: dict, use_prefilter: bool = None) -> list:
+    """依規則回傳這次要抓價格的標的清單"""
+    cfg = rules.get('universe', {})
+    universe = load_universe(rules)
+
+    markets = cfg.get('markets')
+    if markets:
+        universe = universe[universe['market'].isin(markets)]
+
+    exclude = rules.get('exclude', {})
+    universe = universe[~universe.index.isin(exclude.get('symbols', []))]
+    if exclude.get('sectors'):
+        universe = universe[~universe['sector'].isin(exclude['sectors'])]
+
+    if use_prefilter is None:
+        use_prefilter = cfg.get('prefilter', True)
+    total = len(universe)
+    if use_prefilter:
+        universe = prefilter(universe, rules)
+        print(f"🌐 標的池：{total} 檔，預篩後 {len(universe)} 檔")
+    else:
+        print(f"🌐 標的池：{total} 檔")
+    return list(universe.index)
+
+
+# === 從證交所 ISIN 頁面匯入 ===
+
+def import_isin_html(path: str, market: str) -> pd.DataFrame:
+    """
+    解析證交所 ISIN 公開資料頁（需要 lxml）
+    只保留股票（CFICode ES*）與 ETF（CE*），產業別空白的 ETF 歸類為 ETF
+    """
+    tables = pd.read_html(path, encoding='cp950', header=0)
+    raw = max(tables, key=len)
+    raw.columns = [str(c).strip() for c in raw.columns]
+    code_col = raw.columns[0]
+    rows = []
+    for _, r in raw.iterrows():
+        cfi = str(r.get('CFICode', ''))
+        if not (cfi.startswith('ES') or cfi.startswith('CE')):
+            continue
+        parts = str(r[code_col]).replace('　', ' ').split(None, 1)
+        if len(parts) != 2:
+            continue
+        code, name = parts
+        sector = r.get('產業別')
+        sector = 'ETF' if cfi.startswith('CE') else ('' if pd.isna(sector) else str(sector))
+        rows.append({'symbol': code + MARKET_SUFFIX[market], 'name': name.strip(),
+                     'market': market, 'sector': sector, 'industry': ''})
+    return pd.DataFrame(rows, columns=SNAPSHOT_COLUMNS)
+
+
+def write_snapshot(frames: list, rules: dict = None):
+    """合併匯入結果寫成快照；舊快照中的市值 / 均量欄位保留"""
+    path = _snapshot_path(rules)
+    df = pd.concat(frames).drop_duplicates('symbol').set_index('symbol')
+    if os.path.exists(path):
+        old = pd.read_csv(path, dtype={'symbol': str}).set_index('symbol')
+        for col in ('market_cap', 'avg_volume_20d'):
+            df[col] = old[col].reindex(df.index)
+    df.reset_index().to_csv(path, index=False)
+    print(f"💾 快照已寫入 {path}（{len(df)} 檔）")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == '--import':
+        frames = []
+        while args and args[0] == '--import':
+            frames.append(import_isin_html(args[1], args[2]))
+            args = args[3:]
+        write_snapshot(frames)
+    else:
+        from screener import load_rules
+        symbols = select_universe(load_rules())
+        print(', '.join(symbols))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+walkforward.py — 出場參數的 walk-forward 最佳化
+sweep.py 在整段 3 年上挑參數、又在同一段上看績效，是樣本內最佳化。這裡把歷史切成滾動視窗：
+每個視窗在訓練期挑出最佳的 exit 參數，再拿到緊接著的測試期跑，只有測試期的結果算數；
+各測試期的權益曲線接起來，就是樣本外（out-of-sample）的權益曲線。
+
+- 指標與進場信號每檔只在整段歷史上算一次，各視窗直接切片（rolling 指標只看過去，切片不會偷看未來）；
+  出場參數不影響進場信號，所以同一檔在所有視窗、所有參數組合都共用同一份陣列
+- 視窗之間互相獨立，各自在 process pool 的 worker 上跑；價格同 sweep，map 同一份價格矩陣
+
+用法:
+    python3 walkforward.py --take-profit 0.10:0.25:0.05 --trailing-stop 0.06:0.14:0.02 \
+                           --train 252 --test 63 --name w42
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from backtest import load_rules, simulate, _build_result
+from plugins import load_plugins, prepare_indicators
+from price_matrix import PriceMatrix, shared_matrix, init_matrix_worker, worker_matrix, to_matrix
+from sweep import SWEEP_KEYS, parse_range, param_grid, summarize
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'results', 'walkforward')
+MIN_WINDOW_BARS = 20  # 視窗內少於這麼多根 K 棒的標的不列入
+
+# worker 端狀態：規則、價格矩陣，以及每檔算好的 (日期, datetime64 日期, 指標, 進場信號)
+_WORKER_RULES = {}
+_WORKER_MATRIX = None
+_WORKER_ARRAYS = {}
+
+
+def make_windows(dates: pd.DatetimeIndex, train: int = 252, test: int = 63, warmup: int = 60) -> list:
+    """
+    在共同日期軸上切滾動視窗，每次往前推一個測試期；前 warmup 根只給指標暖身，不列入訓練期
+    回傳 [{'window', 'train_start', 'train_end', 'test_start', 'test_end'}]（end 不含）
+    """
+    windows = []
+    lo = warmup
+    while lo + train < len(dates):
+        hi = min(lo + train + test, len(dates))
+        windows.append({
+            'window': len(windows) + 1,
+            'train_start': dates[lo], 'train_end': dates[lo + train],
+            'test_start': dates[lo + train],
+            'test_end': dates[hi] if hi < len(dates) else dates[-1] + pd.Timedelta(days=1),
+        })
+        lo += test
+    return windows
+
+
+def _init_worker(matrix_path: str, rules: dict):
+    init_matrix_worker(matrix_path)
+    _setup(worker_matrix(), rules)
+
+
+def _setup(matrix: PriceMatrix, rules: dict):
+    global _WORKER_RULES, _WORKER_MATRIX
+    _WORKER_RULES = rules
+    _WORKER_MATRIX = matrix
+    _WORKER_ARRAYS.clear()
+
+
+def _symbol_arrays(sym: str) -> tuple:
+    """每檔的日期、指標與進場信號，只算一次（之後所有視窗、參數組合共用）"""
+    if sym not in _WORKER_ARRAYS:
+        strategy, exits = load_plugins(_WORKER_RULES)
+        history = _WORKER_MATRIX.history(sym, ('Close',))
+        ind = prepare_indicators(strategy, exits, history['Close'], sym)
+        _WORKER_ARRAYS[sym] = (history.index, history.index.values, ind, strategy.signals(ind))
+    return _WORKER_ARRAYS[sym]
+
+
+def _run_span(params: dict, start, end) -> dict:
+    """一組出場參數在 [start, end) 上跑所有標的，回傳 {symbol: (ledger, equity_df)}"""
+    rules = {**_WORKER_RULES, 'exit': {**_WORKER_RULES.get('exit', {}), **params}}
+    strategy, exits = load_plugins(rules)
+    bounds = np.array([pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()])
+    out = {}
+    for sym in _WORKER_MATRIX.symbols:
+        dates, raw_dates, ind, signal = _symbol_arrays(sym)
+        lo, hi = np.searchsorted(raw_dates, bounds.astype(raw_dates.dtype))
+        if hi - lo < MIN_WINDOW_BARS:
+            continue
+        # 資料太短時，切片開頭還在暖身期，要從暖身結束才開始交易
+        begin = max(strategy.warmup - lo, 0)
+        if hi - lo - begin < MIN_WINDOW_BARS:
+            continue
+        window = {k: v[lo:hi] for k, v in ind.items()}
+        out[sym] = simulate(sym, window, signal[lo:hi], dates[lo:hi], rules, strategy, exits, begin)
+    return out
+
+
+def _metrics(span: dict, capital: float) -> dict:
+    """{symbol: (ledger, equity_df)} → sweep.summarize 吃的 per_symbol 格式"""
+    per_symbol = {}
+    for sym, (ledger, equity_df) in span.items():
+        m = _build_result(sym, ledger, equity_df, capital)['metrics']
+        per_symbol[sym] = {k: m[k] for k in ('total_return', 'max_drawdown', 'sharpe_ratio',
+                                             'total_trades', 'winning_trades')}
+    return per_symbol
+
+
+def _run_window(window: dict, grid: list, rank_by: str) -> dict:
+    """在 worker 內：訓練期跑完整個參數網格挑最佳，再用最佳參數跑測試期"""
+    capital = _WORKER_RULES.get('backtest', {}).get('initial_capital', 1000000)
+    scores = []
+    for params in grid:
+        row = summarize({'params': params,
+                         'per_symbol': _metrics(_run_span(params, window['train_start'], window['train_end']),
+                                                capital)})
+        scores.append(row)
+    ranked = [r for r in scores if r.get('symbols')]
+    if not ranked:
+        return {**window, 'params': None}
+    best = max(ranked, key=lambda r: r.get(rank_by, float('-inf')))
+    params = {k: best[k] for k in grid[0]}
+
+    test = _run_span(params, window['test_start'], window['test_end'])
+    test_row = summarize({'params': params, 'per_symbol': _metrics(test, capital)})
+
+    # 測試期的等權組合：每檔各自從 capital 起跑，平均後換成「相對視窗起點」的倍數
+    curves = pd.DataFrame({sym: eq['equity'] for sym, (_, eq) in test.items()}).sort_index()
+    growth = (curves.ffill().fillna(capital) / capital).mean(axis=1)
+    trades = [t for ledger, _ in test.values() for t in ledger.to_dicts()]
+    return {**window, 'params': params, 'train': best, 'test': test_row,
+            'growth': growth, 'trades': trades}
+
+
+def stitch(results: list, capital: float) -> pd.DataFrame:
+    """把各測試期的等權成長曲線接成一條樣本外權益曲線"""
+    pieces, level = [], 1.0
+    for r in results:
+        growth = r.get('growth')
+        if growth is None or growth.empty:
+            continue
+        pieces.append(growth * level)
+        level *= float(growth.iloc[-1])
+    if not pieces:
+        return pd.DataFrame()
+    equity = pd.concat(pieces) * capital
+    return pd.DataFrame({'equity': equity.to_numpy()}, index=pd.Index(equity.index, name='date'))
+
+
+def run_walk_forward(data: dict, ranges: dict, rules: dict = None, train: int = 252, test: int = 63,
+                     workers: int = 1, rank_by: str = 'mean_sharpe', name: str = None) -> dict:
+    """
+    回傳:
+    - windows：每個視窗的訓練 / 測試期間、選到的參數、訓練期與測試期分數
+    - equity：接起來的樣本外權益曲線（測試期等權組合）
+    - summary：樣本外整體績效（格式同 backtest 的 metrics）與樣本內外平均分數
+    name 有給時另存到 results/walkforward/
+    """
+    if rules is None:
+        rules = load_rules()
+    capital = rules.get('backtest', {}).get('initial_capital', 1000000)
+    grid = param_grid(ranges)
+    matrix = data if isinstance(data, PriceMatrix) else to_matrix(data, ('Close',), np.float64)
+    warmup = load_plugins(rules)[0].warmup
+    windows = make_windows(pd.DatetimeIndex(matrix.dates), train, test, warmup)
+
+    print(f"🚶 walk-forward：{len(windows)} 個視窗（訓練 {train} / 測試 {test} 根）"
+          f" × {len(grid)} 組參數 × {len(matrix.symbols)} 檔")
+
+    if workers > 1 and len(windows) > 1:
+        with shared_matrix(matrix, ('Close',)) as matrix_path, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                    initargs=(matrix_path, rules)) as pool:
+            results = list(pool.map(_run_window, windows, [grid] * len(windows), [rank_by] * len(windows)))
+    else:
+        _setup(matrix, rules)
+        results = [_run_window(w, grid, rank_by) for w in windows]
+
+    rows = []
+    for r in results:
+        row = {'window': r['window'],
+               'train': f"{r['train_start']:%Y-%m-%d}~{r['train_end']:%Y-%m-%d}",
+               'test': f"{r['test_start']:%Y-%m-%d}~{r['test_end']:%Y-%m-%d}"}
+        if r['params'] is not None:
+            row.update(r['params'])
+            row[f'train_{rank_by}'] = r['train'].get(rank_by)
+            row[f'test_{rank_by}'] = r['test'].get(rank_by)
+            row['test_mean_return'] = r['test'].get('mean_return')
+            row['test_trades'] = r['test'].get('total_trades')
+        rows.append(row)
+    table = pd.DataFrame(rows)
+
+    equity = stitch(results, capital)
+    trades = [t for r in results for t in r.get('trades', [])]
+    summary = {'windows': len(windows), 'combos': len(grid), 'train_bars': train, 'test_bars': test}
+    if not equity.empty:
+        metrics = _build_result('WALK_FORWARD', [], equity, capital)['metrics']
+        summary.update({k: metrics[k] for k in ('total_return', 'annual_return', 'max_drawdown', 'sharpe_ratio')})
+        summary['total_trades'] = len(trades)
+        summary['win_rate'] = round(sum(t['pnl'] > 0 for t in trades) / len(trades) * 100, 1) if trades else 0
+    for key in (f'train_{rank_by}', f'test_{rank_by}'):
+        if key in table.columns:
+            summary[f'mean_{key}'] = round(float(table[key].mean()), 2)
+
+    if name:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        table.to_csv(os.path.join(RESULTS_DIR, f"{name}_windows.csv"), index=False)
+        equity.to_csv(os.path.join(RESULTS_DIR, f"{name}_equity.csv"))
+        with open(os.path.join(RESULTS_DIR, f"{name}_summary.json"), 'w') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=float)
+
+    return {'windows': table, 'equity': equity, 'summary': summary}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="出場參數 walk-forward 最佳化")
+    parser.add_argument("--take-profit", default=None, help="例如 0.10:0.25:0.05 或 0.1,0.15")
+    parser.add_argument("--stop-loss", default=None)
+    parser.add_argument("--rsi-overbought", default=None)
+    parser.add_argument("--trailing-stop", default=None)
+    parser.add_argument("--train", type=int, default=252, help="訓練期長度（交易日）")
+    parser.add_argument("--test", type=int, default=63, help="測試期長度（交易日），也是視窗前進的步長")
+    parser.add_argument("--name", default="walkforward", help="結果檔名")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--rank-by", default="mean_sharpe")
+    parser.add_argument("--synthetic", type=int, default=0, help="用 N 檔合成資料（離線測試）")
+    args = parser.parse_args()
+
+    rules = load_rules()
+    ranges = {}
+    for key in SWEEP_KEYS:
+        text = getattr(args, key)
+        # 沒指定的參數固定為目前 screening_rules.yaml 的值
+        ranges[key] = parse_range(text) if text else [rules.get('exit', {}).get(key)]
+
+    if args.synthetic:
+        from backtest import synthetic_history
+        data = {f'SYN{i}': synthetic_history(seed=i) for i in range(args.synthetic)}
+    else:
+        from price_matrix import fetch_matrix
+        from universe import select_universe
+        symbols = select_universe(rules)
+        print(f"📊 抓取 {len(symbols)} 檔資料...")
+        data = fetch_matrix(symbols, rules.get('backtest', {}).get('period_years', 3), workers=8,
+                            price_fields=('Close',))
+
+    result = run_walk_forward(data, ranges, rules, train=args.train, test=args.test,
+                              workers=args.workers, rank_by=args.rank_by, name=args.name)
+    print(f"\n📋 各視窗：")
+    print(result['windows'].to_string(index=False))
+    s = result['summary']
+    if 'total_return' in s:
+        print(f"\n📈 樣本外：總報酬 {s['total_return']:+.1f}% | 年化 {s['annual_return']:+.1f}% | "
+              f"最大回撤 {s['max_drawdown']:.1f}% | Sharpe {s['sharpe_ratio']:.2f} | "
+              f"{s['total_trades']} 筆交易，勝率 {s['win_rate']:.0f}%")
+    key = f'mean_train_{args.rank_by}'
+    if key in s:
+        print(f"🔍 {args.rank_by}：訓練期平均 {s[key]} → 測試期平均 {s[f'mean_test_{args.rank_by}']}")
+    print(f"💾 結果已存入 {RESULTS_DIR}")
@@ -0,0 +1,180 @@
+"""
+兩種回測引擎都要與「原本的逐日迴圈」結果相同
+baseline_backtest 是向量化引擎與 plugins 加入前的 backtest_stock（固定不改），
+不依賴 indicators / plugins，所以兩個引擎共同的退步也會被抓到
+"""
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from backtest import (load_rules, synthetic_history, backtest_stock,  # noqa: E402
+                      backtest_stock_vectorized)
+
+SEEDS = range(20)
+EXIT_VARIANTS = [
+    {},
+    {'take_profit': 0.05, 'stop_loss': -0.03, 'trailing_stop': 0.04},
+    {'take_profit': 0.30, 'stop_loss': -0.20, 'rsi_overbought': 60, 'trailing_stop': 0.25},
+]
+
+
+# === 原本的逐日迴圈（基準） ===
+
+def _rsi(series, period=14):
+    delta = series.diff()
+    gain = delta.where(delta > 0, 0).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    return 100 - (100 / (1 + gain / loss))
+
+
+class _Trade:
+    def __init__(self, symbol, entry_date, entry_price, shares, reason):
+        self.symbol = symbol
+        self.entry_date = entry_date
+        self.entry_price = entry_price
+        self.shares = shares
+        self.entry_reason = reason
+
+    def close(self, exit_date, exit_price, reason, commission_rate, tax_rate):
+        self.exit_date = exit_date
+        self.exit_price = exit_price
+        self.exit_reason = reason
+        gross_pnl = (exit_price - self.entry_price) * self.shares
+        entry_cost = self.entry_price * self.shares * commission_rate
+        exit_cost = exit_price * self.shares * (commission_rate + tax_rate)
+        self.pnl = gross_pnl - entry_cost - exit_cost
+        self.pnl_pct = self.pnl / (self.entry_price * self.shares)
+        self.holding_days = (exit_date - self.entry_date).days if isinstance(exit_date, datetime) else 0
+
+    def to_dict(self):
+        return {
+            'symbol': self.symbol,
+            'entry_date': str(self.entry_date),
+            'entry_price': self.entry_price,
+            'exit_date': str(self.exit_date),
+            'exit_price': self.exit_price,
+            'shares': self.shares,
+            'pnl': round(self.pnl, 2),
+            'pnl_pct': round(self.pnl_pct * 100, 2),
+            'holding_days': self.holding_days,
+            'entry_reason': self.entry_reason,
+            'exit_reason': self.exit_reason,
+        }
+
+
+def baseline_backtest(symbol, history, rules):
+    bt_config = rules.get('backtest', {})
+    exit_rules = rules.get('exit', {})
+    commission = bt_config.get('commission_rate', 0.001425)
+    tax = bt_config.get('tax_rate', 0.003)
+    capital = bt_config.get('initial_capital', 1000000)
+    position_pct = bt_config.get('position_size', 0.20)
+    take_profit = exit_rules.get('take_profit', 0.15)
+    stop_loss = exit_rules.get('stop_loss', -0.08)
+    rsi_exit = exit_rules.get('rsi_overbought', 75)
+    trailing_pct = exit_rules.get('trailing_stop', 0.10)
+
+    close = history['Close']
+    rsi = _rsi(close, 14)
+    ma60 = close.rolling(window=60).mean()
+
+    trades = []
+    current_trade = None
+    peak_price = 0
+    equity_curve = []
+    cash = capital
+
+    for i in range(60, len(history)):
+        date = history.index[i]
+        price = close.iloc[i]
+        current_rsi = rsi.iloc[i]
+
+        if current_trade is not None:
+            peak_price = max(peak_price, price)
+            unrealized_pct = (price / current_trade.entry_price) - 1
+            trailing_drawdown = (price / peak_price) - 1
+            exit_reason = None
+            if unrealized_pct >= take_profit:
+                exit_reason = f'停利 ({unrealized_pct*100:.1f}%)'
+            elif unrealized_pct <= stop_loss:
+                exit_reason = f'停損 ({unrealized_pct*100:.1f}%)'
+            elif current_rsi > rsi_exit:
+                exit_reason = f'RSI 超買 ({current_rsi:.0f})'
+            elif trailing_drawdown <= -trailing_pct:
+                exit_reason = f'追蹤停損 (從高點回落 {trailing_drawdown*100:.1f}%)'
+            if exit_reason:
+                current_trade.close(date, price, exit_reason, commission, tax)
+                cash += price * current_trade.shares
+                trades.append(current_trade)
+                current_trade = None
+                peak_price = 0
+
+        if current_trade is None:
+            prev_rsi = rsi.iloc[i-1] if i > 0 else 50
+            if prev_rsi < 35 and current_rsi >= 35 and price > ma60.iloc[i]:
+                shares = int(capital * position_pct / price / 1000) * 1000
+                if shares > 0 and cash >= price * shares:
+                    current_trade = _Trade(symbol, date, price, shares,
+                                           f'RSI 回升 ({prev_rsi:.0f}→{current_rsi:.0f}), 在 MA60 之上')
+                    cash -= price * shares
+                    peak_price = price
+
+        holding_value = current_trade.shares * price if current_trade else 0
+        equity_curve.append({'date': date, 'equity': cash + holding_value})
+
+    if current_trade is not None:
+        last_price = close.iloc[-1]
+        current_trade.close(history.index[-1], last_price, '回測結束平倉', commission, tax)
+        cash += last_price * current_trade.shares
+        trades.append(current_trade)
+
+    equity_df = pd.DataFrame(equity_curve).set_index('date')
+    final_equity = equity_df['equity'].iloc[-1]
+    total_return = (final_equity / capital) - 1
+    days = (equity_df.index[-1] - equity_df.index[0]).days
+    annual_return = (1 + total_return) ** (365 / max(days, 1)) - 1
+    drawdown = (equity_df['equity'] / equity_df['equity'].cummax()) - 1
+    daily_returns = equity_df['equity'].pct_change().dropna()
+    if len(daily_returns) > 0 and daily_returns.std() > 0:
+        sharpe = (daily_returns.mean() - 0.02/252) / daily_returns.std() * np.sqrt(252)
+    else:
+        sharpe = 0
+    winning = [t for t in trades if t.pnl > 0]
+    metrics = {
+        'total_return': round(total_return * 100, 2),
+        'annual_return': round(annual_return * 100, 2),
+        'max_drawdown': round(drawdown.min() * 100, 2),
+        'sharpe_ratio': round(sharpe, 2),
+        'total_trades': len(trades),
+        'win_rate': round(len(winning) / len(trades) * 100 if trades else 0, 1),
+        'winning_trades': len(winning),
+        'losing_trades': len(trades) - len(winning),
+        'avg_holding_days': round(np.mean([t.holding_days for t in trades]), 1) if trades else 0,
+        'final_equity': round(final_equity, 0),
+        'initial_capital': capital,
+    }
+    return {'trades': [t.to_dict() for t in trades], 'metrics': metrics, 'equity_curve': equity_df}
+
+
+# === 比對 ===
+
+@pytest.mark.parametrize('engine', [backtest_stock, backtest_stock_vectorized], ids=['loop', 'vectorized'])
+@pytest.mark.parametrize('exit_rules', EXIT_VARIANTS, ids=['default', 'tight', 'loose'])
+def test_engine_matches_baseline(engine, exit_rules):
+    rules = load_rules()
+    rules = {**rules, 'entry': {}, 'exit': {**rules.get('exit', {}), **exit_rules}}
+    rules['exit'].pop('rules', None)  # 基準只有四條預設出場規則
+    for seed in SEEDS:
+        history = synthetic_history(seed=seed)
+        expected = baseline_backtest(f'SYN{seed}', history, rules)
+        result = engine(f'SYN{seed}', history, rules)
+        assert result['trades'] == expected['trades'], f'seed={seed}'
+        assert result['metrics'] == expected['metrics'], f'seed={seed}'
+        gap = (result['equity_curve']['equity'] - expected['equity_curve']['equity']).abs().max()
+        assert gap <= 1e-6 * expected['metrics']['initial_capital'], f'seed={seed}'
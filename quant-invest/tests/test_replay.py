@@ -0,0 +1,18 @@
+"""replay_screening 與逐週 screen_all（歷史截到週末）的結果必須相同（含停牌缺口與產業排除）"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from replay import check_against_screener, synthetic_check_data  # noqa: E402
+from screener import load_rules  # noqa: E402
+
+
+@pytest.mark.parametrize('gapped', [0, 10], ids=['no-gaps', 'suspension-gaps'])
+def test_replay_matches_screener(gapped):
+    rules = load_rules()
+    rules['exclude'] = {**rules.get('exclude', {}), 'sectors': ['Excluded']}
+    data = synthetic_check_data(n_symbols=40, gapped=gapped)
+    assert check_against_screener(data, rules) == []